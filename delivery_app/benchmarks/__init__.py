@@ -0,0 +1,10 @@
+"""
+Нагрузочные тесты и бенчмарки API доставки.
+
+- dataset: генератор синтетических данных (python -m benchmarks.dataset)
+- micro: микробенчмарки сериализаторов и представлений (python -m benchmarks.micro)
+- locustfile: сценарии нагрузки для Locust (locust -f benchmarks/locustfile.py)
+- locust_connections: соединения на воркер, синхронный и асинхронный стек
+  (locust -f benchmarks/locust_connections.py)
+- compare: сравнение результатов двух прогонов (python -m benchmarks.compare)
+"""
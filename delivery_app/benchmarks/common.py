@@ -0,0 +1,97 @@
+"""
+Общие функции бенчмарков: настройка Django и сохранение результатов.
+Результаты пишутся в JSON вместе с ревизией git, чтобы прогоны разных
+коммитов можно было сравнить через benchmarks.compare.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = Path(os.getenv('BENCH_RESULTS_DIR', BENCHMARKS_DIR / 'results'))
+
+# Имена и пароль пользователей, которых создает benchmarks.dataset
+COURIER_USERNAME = 'bench_courier_{index}'
+DISPATCHER_USERNAME = 'bench_dispatcher'
+BENCH_PASSWORD = os.getenv('BENCH_PASSWORD', 'bench-password')
+# Префикс номеров транспорта доставок benchmarks.dataset (по нему --clear находит свои доставки)
+TRANSPORT_NUMBER_PREFIX = 'BENCH-'
+
+
+def setup_django():
+    """Настраивает Django для запуска бенчмарка как скрипта."""
+    project_dir = str(BENCHMARKS_DIR.parent)
+    if project_dir not in sys.path:
+        sys.path.insert(0, project_dir)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'delivery_app.settings')
+    import django
+    django.setup()
+
+
+def git_revision():
+    """
+    Возвращает ревизию git рабочего дерева.
+
+    Returns:
+        dict: {"commit": sha или None, "dirty": есть ли незакоммиченные изменения}
+    """
+    def run(*args):
+        return subprocess.run(
+            ['git', *args], cwd=BENCHMARKS_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    try:
+        return {'commit': run('rev-parse', 'HEAD'), 'dirty': bool(run('status', '--porcelain'))}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+def environment_info():
+    """Описание окружения, в котором выполнялся прогон."""
+    info = {'python': platform.python_version(), 'platform': platform.platform()}
+    try:
+        import django
+        from django.db import connection
+        info['django'] = django.get_version()
+        info['database'] = connection.vendor
+    except Exception:  # pylint: disable=broad-except
+        # Нагрузочные сценарии Locust запускаются без Django
+        pass
+    return info
+
+
+def write_results(kind, results, metadata=None, path=None):
+    """
+    Сохраняет результаты прогона в JSON.
+
+    Args:
+        kind: Тип прогона (micro или load)
+        results: Имя замера -> словарь метрик (median_ms и т.д.)
+        metadata: Дополнительные сведения (размер данных, параметры)
+        path: Файл результата; по умолчанию results/<kind>-<время>-<sha>.json
+
+    Returns:
+        Path: Путь к сохраненному файлу
+    """
+    revision = git_revision()
+    now = datetime.now(timezone.utc)
+    if path is None:
+        short_sha = (revision['commit'] or 'nogit')[:10]
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = RESULTS_DIR / f"{kind}-{now:%Y%m%dT%H%M%S}-{short_sha}.json"
+    path = Path(path)
+    document = {
+        'kind': kind,
+        'timestamp': now.isoformat(),
+        'revision': revision,
+        'environment': environment_info(),
+        'metadata': metadata or {},
+        'results': results,
+    }
+    path.write_text(json.dumps(document, ensure_ascii=False, indent=2, sort_keys=True), encoding='utf-8')
+    return path
@@ -0,0 +1,87 @@
+"""
+Сравнение результатов двух прогонов бенчмарков.
+
+Печатает таблицу изменений и завершается с кодом 1, если какой-либо
+замер стал медленнее больше чем на порог, - так сравнение можно
+использовать в CI.
+
+Пример:
+    python -m benchmarks.compare results/base.json results/new.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# Метрики, по которым ищется регрессия (если есть в обоих прогонах)
+METRICS = ('median_ms', 'p95_ms', 'queries')
+
+
+def load(path):
+    """Читает файл результатов."""
+    return json.loads(Path(path).read_text(encoding='utf-8'))
+
+
+def compare(base, new, threshold):
+    """
+    Сравнивает результаты прогонов.
+
+    Args:
+        base: Базовый прогон (словарь из файла результатов)
+        new: Новый прогон
+        threshold: Допустимое замедление в процентах
+
+    Returns:
+        tuple: (строки таблицы, список регрессий)
+    """
+    rows = []
+    regressions = []
+    for name in sorted(set(base['results']) | set(new['results'])):
+        old_stats = base['results'].get(name)
+        new_stats = new['results'].get(name)
+        if old_stats is None or new_stats is None:
+            rows.append((name, '', '', '', 'только в базовом' if new_stats is None else 'новый замер'))
+            continue
+        for metric in METRICS:
+            old_value, new_value = old_stats.get(metric), new_stats.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            if old_value:
+                change = (new_value - old_value) / old_value * 100
+            else:
+                change = 0.0 if not new_value else float('inf')
+            # Число запросов должно совпадать точно, время - в пределах порога
+            limit = 0 if metric == 'queries' else threshold
+            flag = 'РЕГРЕССИЯ' if change > limit else ''
+            if flag:
+                regressions.append((name, metric, old_value, new_value, change))
+            rows.append((f'{name} {metric}', old_value, new_value, f'{change:+.1f}%', flag))
+    return rows, regressions
+
+
+def main(argv=None):
+    """Точка входа: python -m benchmarks.compare."""
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков")
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help="допустимое замедление, %%")
+    args = parser.parse_args(argv)
+
+    base, new = load(args.base), load(args.new)
+    print(f"База:  {base['revision'].get('commit')} ({base['timestamp']})")
+    print(f"Новый: {new['revision'].get('commit')} ({new['timestamp']})")
+    if base.get('metadata') != new.get('metadata'):
+        print(f"Внимание: параметры прогонов различаются: {base.get('metadata')} / {new.get('metadata')}")
+
+    rows, regressions = compare(base, new, args.threshold)
+    for name, old_value, new_value, change, flag in rows:
+        print(f"{name:60} {old_value!s:>12} {new_value!s:>12} {change:>9} {flag}")
+
+    if regressions:
+        print(f"\nРегрессий: {len(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
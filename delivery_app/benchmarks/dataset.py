@@ -0,0 +1,372 @@
+"""
+Генератор синтетических данных для нагрузочных тестов.
+
+Создает справочники, курьеров и доставки с реалистичной географией
+(точки вокруг крупных городов, маршруты в несколько километров) и
+суточным профилем заказов. В PostgreSQL строки загружаются через COPY,
+в остальных базах - через bulk_create.
+
+Пример:
+    python -m benchmarks.dataset --deliveries 1000000 --couriers 5000 --clear
+"""
+
+import argparse
+import math
+import random
+import time
+from datetime import timedelta
+
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from .common import BENCH_PASSWORD, COURIER_USERNAME, DISPATCHER_USERNAME, TRANSPORT_NUMBER_PREFIX, setup_django
+
+# Город, широта, долгота, доля заказов, радиус города в км
+CITIES = (
+    ('Москва', 55.7558, 37.6173, 0.40, 25),
+    ('Санкт-Петербург', 59.9343, 30.3351, 0.20, 18),
+    ('Новосибирск', 55.0084, 82.9357, 0.08, 14),
+    ('Екатеринбург', 56.8389, 60.6057, 0.08, 12),
+    ('Казань', 55.7961, 49.1064, 0.08, 12),
+    ('Нижний Новгород', 56.2965, 43.9361, 0.06, 12),
+    ('Краснодар', 45.0355, 38.9753, 0.05, 10),
+    ('Самара', 53.1959, 50.1002, 0.05, 10),
+)
+
+STREETS = (
+    'Ленина', 'Мира', 'Гагарина', 'Советская', 'Садовая', 'Лесная', 'Школьная',
+    'Пушкина', 'Набережная', 'Молодежная', 'Центральная', 'Заводская',
+)
+
+TRANSPORT_MODELS = (
+    'ГАЗель Next', 'ГАЗель Business', 'Ford Transit', 'Mercedes Sprinter', 'Renault Master',
+    'Volkswagen Crafter', 'Iveco Daily', 'Peugeot Boxer', 'Citroen Jumper', 'Fiat Ducato',
+    'Lada Largus', 'Hyundai Porter', 'Kia Bongo', 'Велосипед', 'Электросамокат',
+)
+PACKAGING_TYPES = ('Коробка', 'Пакет', 'Паллета', 'Конверт', 'Термобокс', 'Без упаковки')
+SERVICES = (
+    'Подъем на этаж', 'Сборка', 'Хрупкий груз', 'Страховка', 'Срочная доставка',
+    'Возврат документов', 'Оплата при получении', 'Примерка', 'Ночная доставка', 'Упаковка',
+)
+PENDING_STATUS = ('В ожидании', 'yellow')
+IN_TRANSIT_STATUS = ('В пути', 'blue')
+DELIVERED_STATUS = ('Доставлено', 'green')
+
+# Относительная частота заказов по часам суток
+HOURLY_WEIGHTS = (
+    1, 1, 1, 1, 1, 2, 4, 8, 12, 14, 14, 13,
+    12, 12, 13, 14, 15, 15, 13, 10, 7, 4, 2, 1,
+)
+
+EARTH_RADIUS_KM = 6371.0
+# Отношение длины пути по дорогам к расстоянию по прямой
+ROAD_FACTOR = 1.3
+AVERAGE_SPEED_KMH = 25
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Расстояние между точками по поверхности Земли в км."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def offset_point(lat, lon, distance_km, bearing):
+    """Точка на расстоянии distance_km от исходной по азимуту bearing (радианы)."""
+    d_lat = distance_km * math.cos(bearing) / 111.32
+    d_lon = distance_km * math.sin(bearing) / (111.32 * math.cos(math.radians(lat)))
+    return lat + d_lat, lon + d_lon
+
+
+class DatasetWriter:
+    """
+    Загружает строки в таблицы моделей.
+
+    В PostgreSQL с psycopg 3 использует COPY, иначе bulk_create пачками.
+    """
+
+    def __init__(self, connection, batch_size=5000):
+        self.connection = connection
+        self.batch_size = batch_size
+
+    @property
+    def uses_copy(self):
+        return self.connection.vendor == 'postgresql' and is_psycopg3
+
+    def write(self, model, fields, rows):
+        """
+        Записывает строки в таблицу модели.
+
+        Args:
+            model: Модель Django
+            fields: Имена атрибутов модели (attname) в порядке значений строк
+            rows: Итератор кортежей значений
+
+        Returns:
+            int: Число записанных строк
+        """
+        if self.uses_copy:
+            return self._copy(model, fields, rows)
+        return self._bulk_create(model, fields, rows)
+
+    def _copy(self, model, fields, rows):
+        quote = self.connection.ops.quote_name
+        columns = ', '.join(quote(model._meta.get_field(field).column) for field in fields)
+        count = 0
+        with self.connection.cursor() as cursor:
+            with cursor.cursor.copy(f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    count += 1
+        return count
+
+    def _bulk_create(self, model, fields, rows):
+        attnames = [model._meta.get_field(field).attname for field in fields]
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(model(**dict(zip(attnames, row))))
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    def reset_sequences(self, models):
+        """Сдвигает последовательности ID после вставки с явными ID."""
+        from django.core.management.color import no_style
+
+        statements = self.connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with self.connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+
+class DatasetGenerator:
+    """
+    Генератор синтетического набора данных.
+
+    Attributes:
+        deliveries: Число доставок
+        couriers: Число курьеров
+        days: За сколько дней распределены доставки
+        seed: Зерно генератора случайных чисел (одинаковое зерно - одинаковые данные)
+    """
+
+    def __init__(self, deliveries, couriers, days=365, seed=1, stdout=print):
+        from django.db import connection
+
+        self.deliveries = deliveries
+        self.couriers = couriers
+        self.days = days
+        self.random = random.Random(seed)
+        self.writer = DatasetWriter(connection)
+        self.stdout = stdout
+
+    def clear(self):
+        """
+        Удаляет доставки и пользователей, созданных генератором.
+
+        Доставки генератора отличаются префиксом TRANSPORT_NUMBER_PREFIX
+        номера транспорта, остальные доставки базы не затрагиваются.
+        """
+        from django.contrib.auth.models import User
+        from django.db import connection
+
+        from delivery.models import Delivery
+
+        quote = connection.ops.quote_name
+        table = quote(Delivery._meta.db_table)
+        through = Delivery.services.through._meta
+        pattern = TRANSPORT_NUMBER_PREFIX + '%'
+        # Без загрузки строк в ORM: сигналы удаления на миллионах доставок слишком медленные
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {quote(through.db_table)} WHERE {quote(through.get_field('delivery').column)} IN "
+                f"(SELECT id FROM {table} WHERE transport_number LIKE %s)",
+                [pattern],
+            )
+            cursor.execute(f"DELETE FROM {table} WHERE transport_number LIKE %s", [pattern])
+        User.objects.filter(username__startswith='bench_').delete()
+
+    def lookups(self):
+        """Создает справочники и возвращает их ID."""
+        from delivery.models import PackagingType, Service, Status, TransportModel
+
+        def ensure(model, names):
+            return [model.objects.get_or_create(name=name)[0].pk for name in names]
+
+        statuses = {}
+        for key, (name, color) in (
+            ('pending', PENDING_STATUS), ('in_transit', IN_TRANSIT_STATUS), ('delivered', DELIVERED_STATUS)
+        ):
+            statuses[key] = Status.objects.get_or_create(name=name, defaults={'color': color})[0].pk
+        return {
+            'transport_models': ensure(TransportModel, TRANSPORT_MODELS),
+            'packaging': ensure(PackagingType, PACKAGING_TYPES),
+            'services': ensure(Service, SERVICES),
+            'statuses': statuses,
+        }
+
+    def users(self):
+        """
+        Создает курьеров и диспетчера с паролем BENCH_PASSWORD.
+
+        Returns:
+            list: ID курьеров
+        """
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from django.db.models import Max
+        from django.utils import timezone
+
+        password = make_password(BENCH_PASSWORD)
+        now = timezone.now()
+        start_id = (User.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        first_names = ('Иван', 'Петр', 'Алексей', 'Мария', 'Анна', 'Ольга', 'Дмитрий', 'Елена')
+        last_names = ('Иванов', 'Петров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев')
+
+        def rows():
+            for index in range(self.couriers):
+                yield (
+                    start_id + index, COURIER_USERNAME.format(index=index), password,
+                    self.random.choice(first_names), self.random.choice(last_names),
+                    '', False, False, True, now,
+                )
+            yield (
+                start_id + self.couriers, DISPATCHER_USERNAME, password,
+                'Диспетчер', '', '', True, False, True, now,
+            )
+
+        fields = (
+            'id', 'username', 'password', 'first_name', 'last_name',
+            'email', 'is_staff', 'is_superuser', 'is_active', 'date_joined',
+        )
+        self.writer.write(User, fields, rows())
+        self.writer.reset_sequences([User])
+        return list(range(start_id, start_id + self.couriers))
+
+    def delivery_rows(self, start_id, lookups, courier_ids):
+        """Строки доставок и связей с услугами."""
+        from django.utils import timezone
+
+        rnd = self.random
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        statuses = lookups['statuses']
+        city_weights = [city[3] for city in CITIES]
+        # Нагрузка на курьеров неравномерна: часть курьеров возит больше
+        courier_weights = [1 / (rank + 10) for rank in range(len(courier_ids))]
+        hours = list(range(24))
+        services = lookups['services']
+        links = []
+
+        for offset in range(self.deliveries):
+            delivery_id = start_id + offset
+            name, lat, lon, _, radius = rnd.choices(CITIES, city_weights)[0]
+            source_lat, source_lon = offset_point(
+                lat, lon, abs(rnd.gauss(0, radius / 2)), rnd.uniform(0, 2 * math.pi)
+            )
+            trip = min(rnd.lognormvariate(math.log(5), 0.6), radius * 2)
+            dest_lat, dest_lon = offset_point(source_lat, source_lon, trip, rnd.uniform(0, 2 * math.pi))
+            distance = round(haversine_km(source_lat, source_lon, dest_lat, dest_lon) * ROAD_FACTOR, 2)
+
+            day = int(rnd.triangular(0, self.days, 0))
+            start_time = now - timedelta(days=day) + timedelta(
+                hours=rnd.choices(hours, HOURLY_WEIGHTS)[0] - now.hour,
+                minutes=rnd.randint(0, 59),
+            )
+            end_time = start_time + timedelta(hours=distance / AVERAGE_SPEED_KMH, minutes=rnd.randint(10, 40))
+
+            # Старые доставки завершены, свежие ждут курьера или в пути
+            if day > 1 or rnd.random() < 0.5:
+                status_id = statuses['delivered']
+            elif rnd.random() < 0.6:
+                status_id = statuses['pending']
+            else:
+                status_id = statuses['in_transit']
+            courier_id = None if status_id == statuses['pending'] else rnd.choices(courier_ids, courier_weights)[0]
+
+            for service_id in rnd.sample(services, rnd.choices((0, 1, 2, 3), (40, 35, 18, 7))[0]):
+                links.append((delivery_id, service_id))
+
+            yield (
+                delivery_id,
+                rnd.choice(lookups['transport_models']),
+                f"{TRANSPORT_NUMBER_PREFIX}"
+                f"{rnd.choice('АВЕКМНОРСТУХ')}{rnd.randint(100, 999)}{rnd.choice('АВЕКМНОРСТУХ')}"
+                f"{rnd.choice('АВЕКМНОРСТУХ')}{rnd.randint(1, 199)}",
+                start_time,
+                end_time,
+                distance,
+                rnd.choice(lookups['packaging']),
+                status_id,
+                'Исправно' if rnd.random() < 0.97 else 'Неисправно',
+                courier_id,
+                f"{name}, ул. {rnd.choice(STREETS)}, {rnd.randint(1, 150)}",
+                f"{name}, ул. {rnd.choice(STREETS)}, {rnd.randint(1, 150)}",
+                source_lat, source_lon, dest_lat, dest_lon,
+            )
+        self.links = links
+
+    def generate(self, clear=False):
+        """
+        Создает полный набор данных.
+
+        Args:
+            clear: Предварительно удалить доставки и пользователей, созданные генератором
+
+        Returns:
+            dict: Число созданных объектов
+        """
+        from django.db import transaction
+        from django.db.models import Max
+
+        from delivery.models import Delivery
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            if clear:
+                self.clear()
+            lookups = self.lookups()
+            courier_ids = self.users()
+            self.stdout(f"Курьеры: {len(courier_ids)} ({time.perf_counter() - started:.1f} с)")
+
+            start_id = (Delivery.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+            fields = (
+                'id', 'transport_model', 'transport_number', 'start_time', 'end_time',
+                'distance', 'packaging', 'status', 'technical_condition', 'courier',
+                'source_address', 'destination_address', 'source_lat', 'source_lon',
+                'dest_lat', 'dest_lon',
+            )
+            count = self.writer.write(Delivery, fields, self.delivery_rows(start_id, lookups, courier_ids))
+            self.writer.reset_sequences([Delivery])
+            self.stdout(f"Доставки: {count} ({time.perf_counter() - started:.1f} с)")
+
+            link_count = self.writer.write(Delivery.services.through, ('delivery', 'service'), iter(self.links))
+            self.stdout(f"Услуги доставок: {link_count} ({time.perf_counter() - started:.1f} с)")
+
+        return {'deliveries': count, 'couriers': len(courier_ids), 'service_links': link_count}
+
+
+def main(argv=None):
+    """Точка входа: python -m benchmarks.dataset."""
+    parser = argparse.ArgumentParser(description="Генерация синтетических данных для бенчмарков")
+    parser.add_argument('--deliveries', type=int, default=1_000_000)
+    parser.add_argument('--couriers', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--clear', action='store_true', help="удалить доставки и пользователей bench_*, созданные генератором")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    generator = DatasetGenerator(args.deliveries, args.couriers, days=args.days, seed=args.seed)
+    generator.generate(clear=args.clear)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Сценарий соединений на воркер для Locust: синхронный и асинхронный стек.
+
+Курьеры только читают эндпоинты, у которых есть асинхронные версии
+(списки, профиль, координаты). Токены BENCH_READ_COURIERS курьеров
+получаются до старта пользователей: вход (хэширование пароля) не
+попадает в замеры и не занимает воркер. BENCH_READ_PREFIX выбирает версию:
+/api - синхронные представления (gunicorn), /api/async - асинхронные
+(uvicorn). Сервер запускается с одним воркером, чтобы сравнивать,
+сколько одновременных клиентов держит один воркер.
+
+Пример:
+    gunicorn delivery_app.wsgi -w 1 --threads 8 -b 127.0.0.1:8000
+    locust -f benchmarks/locust_connections.py --host http://localhost:8000 \\
+        --users 200 --spawn-rate 50 --run-time 1m --headless
+
+    python -m delivery_app.uvicorn_config  # UVICORN_WORKERS=1
+    BENCH_READ_PREFIX=/api/async locust -f benchmarks/locust_connections.py ...
+"""
+
+import os
+import random
+import sys
+from pathlib import Path
+
+import requests
+from locust import HttpUser, between, events, task
+
+# Locust добавляет в sys.path только каталог locustfile
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.common import BENCH_PASSWORD, COURIER_USERNAME  # noqa: E402
+from benchmarks.locustfile import save_results  # noqa: E402,F401  (сводка в results/load-*.json)
+
+READ_PREFIX = os.getenv('BENCH_READ_PREFIX', '/api').rstrip('/')
+READ_COURIERS = int(os.getenv('BENCH_READ_COURIERS', '20'))
+
+_tokens = []
+
+
+@events.test_start.add_listener
+def login_couriers(environment, **kwargs):
+    """Получает токены курьеров до запуска пользователей."""
+    for index in range(READ_COURIERS):
+        response = requests.post(
+            f'{environment.host}/api/token/',
+            json={'username': COURIER_USERNAME.format(index=index), 'password': BENCH_PASSWORD},
+            timeout=60,
+        )
+        response.raise_for_status()
+        _tokens.append(response.json()['access'])
+
+
+class ReadOnlyCourierUser(HttpUser):
+    """Курьер, опрашивающий списки доставок и профиль."""
+
+    wait_time = between(0.5, 1.5)
+
+    def on_start(self):
+        self.client.headers['Authorization'] = f'Bearer {random.choice(_tokens)}'
+
+    @task(10)
+    def poll_available(self):
+        self.client.get(f'{READ_PREFIX}/deliveries/available/', name='available')
+
+    @task(6)
+    def poll_active(self):
+        self.client.get(f'{READ_PREFIX}/deliveries/my/active/', name='my_active')
+
+    @task(2)
+    def history(self):
+        self.client.get(f'{READ_PREFIX}/deliveries/my/history/', name='my_history')
+
+    @task(1)
+    def profile(self):
+        self.client.get(f'{READ_PREFIX}/profile/', name='profile')
+
+    @task(1)
+    def coordinates(self):
+        self.client.get(f'{READ_PREFIX}/deliveries/coordinates/', name='coordinates')
@@ -0,0 +1,171 @@
+"""
+Сценарии нагрузки API доставки для Locust.
+
+Пользователи:
+- CourierUser: мобильное приложение курьера (опрос списков, гонка за
+  назначение доставки, смена статуса, история и профиль)
+- OfflineSyncUser: курьер, отправляющий накопленные офлайн-изменения пачкой
+- DispatcherUser: веб-приложение отчетов (справочники, список, карта)
+
+Данные и пользователи создаются benchmarks.dataset. При завершении
+сводка сохраняется в results/load-*.json для benchmarks.compare.
+
+Пример:
+    locust -f benchmarks/locustfile.py --host http://localhost:8000 \\
+        --users 500 --spawn-rate 50 --run-time 5m --headless
+"""
+
+import os
+import random
+import sys
+from pathlib import Path
+
+from locust import HttpUser, between, events, task
+
+# Locust добавляет в sys.path только каталог locustfile
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.common import BENCH_PASSWORD, COURIER_USERNAME, DISPATCHER_USERNAME, write_results  # noqa: E402
+
+# Число курьеров, созданных benchmarks.dataset
+BENCH_COURIERS = int(os.getenv('BENCH_COURIERS', '5000'))
+
+
+class ApiUser(HttpUser):
+    """Базовый пользователь API с JWT аутентификацией."""
+
+    abstract = True
+
+    def on_start(self):
+        response = self.client.post(
+            '/api/token/', json={'username': self.get_username(), 'password': BENCH_PASSWORD}, name='token'
+        )
+        response.raise_for_status()
+        self.client.headers['Authorization'] = f"Bearer {response.json()['access']}"
+        self.statuses = {item['name']: item['id'] for item in self.client.get('/api/statuses/', name='statuses').json()}
+
+    def get_username(self):
+        return COURIER_USERNAME.format(index=random.randrange(BENCH_COURIERS))
+
+
+class CourierUser(ApiUser):
+    """Курьер с мобильным приложением."""
+
+    weight = 10
+    wait_time = between(2, 5)
+
+    @task(10)
+    def poll_available(self):
+        self.client.get('/api/deliveries/available/', name='available')
+
+    @task(6)
+    def poll_active(self):
+        self.client.get('/api/deliveries/my/active/', name='my_active')
+
+    @task(2)
+    def assign_race(self):
+        """Несколько курьеров одновременно пытаются взять первые доставки списка."""
+        available = self.client.get('/api/deliveries/available/', name='available').json()
+        if not available:
+            return
+        delivery = random.choice(available[:5])
+        with self.client.patch(
+            f"/api/deliveries/{delivery['id']}/assign/", name='assign', catch_response=True
+        ) as response:
+            # Проигранная гонка - ожидаемый ответ, а не ошибка
+            if response.status_code in (400, 409):
+                response.success()
+
+    @task(2)
+    def update_status(self):
+        active = self.client.get('/api/deliveries/my/active/', name='my_active').json()
+        if not active:
+            return
+        status_id = self.statuses.get('Доставлено')
+        self.client.patch(
+            f"/api/deliveries/{random.choice(active)['id']}/update-status/",
+            json={'status_id': status_id}, name='update_status'
+        )
+
+    @task(1)
+    def history(self):
+        self.client.get('/api/deliveries/my/history/', name='my_history')
+
+    @task(1)
+    def profile(self):
+        self.client.get('/api/profile/', name='profile')
+
+
+class OfflineSyncUser(ApiUser):
+    """Курьер, вернувшийся в сеть с пачкой офлайн-изменений."""
+
+    weight = 2
+    wait_time = between(10, 30)
+
+    @task
+    def sync_burst(self):
+        history = self.client.get('/api/deliveries/my/history/?fields=id', name='my_history').json()
+        if not history:
+            return
+        changes = [
+            {
+                'id': f'offline-{index}',
+                'action': 'update',
+                'data': {
+                    'id': item['id'],
+                    'technical_condition': random.choice(('Исправно', 'Неисправно')),
+                    'distance': round(random.uniform(1, 30), 2),
+                },
+            }
+            for index, item in enumerate(random.sample(history, min(len(history), random.randint(20, 50))))
+        ]
+        self.client.post('/api/deliveries/sync/', json={'changes': changes}, name='sync')
+
+
+class DispatcherUser(ApiUser):
+    """Диспетчер с веб-приложением отчетов."""
+
+    weight = 1
+    wait_time = between(5, 15)
+
+    def get_username(self):
+        return DISPATCHER_USERNAME
+
+    @task(3)
+    def reference_lists(self):
+        for url in ('/api/transport-models/', '/api/packaging-types/', '/api/services/', '/api/statuses/'):
+            self.client.get(url, name=url.strip('/').split('/')[-1])
+
+    @task(2)
+    def map(self):
+        self.client.get('/api/deliveries/coordinates/', name='coordinates')
+
+    @task(1)
+    def report(self):
+        self.client.get('/api/deliveries/?fields=id,status,courier,start_time,end_time,distance', name='deliveries_report')
+
+
+@events.quitting.add_listener
+def save_results(environment, **kwargs):
+    """Сохраняет сводку по эндпоинтам в JSON."""
+    results = {}
+    for (name, method), entry in environment.stats.entries.items():
+        if not entry.num_requests:
+            continue
+        results[f'load:{method} {name}'] = {
+            'median_ms': entry.median_response_time,
+            'p95_ms': entry.get_response_time_percentile(0.95),
+            'p99_ms': entry.get_response_time_percentile(0.99),
+            'mean_ms': round(entry.avg_response_time, 3),
+            'requests': entry.num_requests,
+            'failures': entry.num_failures,
+            'rps': round(entry.total_rps, 3),
+        }
+    options = environment.parsed_options
+    metadata = {
+        'host': environment.host,
+        'users': getattr(options, 'num_users', None),
+        'run_time': getattr(options, 'run_time', None),
+        'couriers': BENCH_COURIERS,
+    }
+    print(f"Результаты: {write_results('load', results, metadata)}")
@@ -0,0 +1,207 @@
+"""
+Микробенчмарки сериализаторов и представлений.
+
+Выполняются на текущей базе (обычно после benchmarks.dataset) через
+тестовый клиент Django, без сетевого стека. Для каждого замера
+сохраняются медиана, p95, минимум, число SQL-запросов и размер результата.
+
+Пример:
+    python -m benchmarks.micro --repeat 30
+    python -m benchmarks.micro --only view: --output results/base.json
+"""
+
+import argparse
+import statistics
+import time
+
+from .common import COURIER_USERNAME, DISPATCHER_USERNAME, setup_django, write_results
+
+# Список всех доставок не ограничен; на больших данных он пропускается
+MAX_LIST_ROWS = 50_000
+
+
+def measure(func, repeat, warmup=2):
+    """
+    Выполняет func несколько раз и считает статистику времени.
+
+    Args:
+        func: Функция без аргументов; возвращает (число SQL-запросов, размер
+            результата: байты для представлений и рендереров, строки для сериализаторов)
+        repeat: Число замеров
+        warmup: Число прогревочных запусков
+
+    Returns:
+        dict: Статистика в миллисекундах
+    """
+    for _ in range(warmup):
+        func()
+    timings = []
+    queries = size = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        queries, size = func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        'min_ms': round(timings[0], 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'repeat': repeat,
+        'queries': queries,
+        'size': size,
+    }
+
+
+def serializer_benchmarks(rows):
+    """
+    Замеры сериализации первых rows доставок.
+
+    Returns:
+        dict: Имя замера -> функция
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.renderers import JSONRenderer
+
+    from delivery.fast_serializers import DeliveryReadSerializer
+    from delivery.fieldsets import DeliveryFieldset
+    from delivery.models import Delivery
+    from delivery.renderers import ORJSONRenderer
+    from delivery.serializers import DeliverySerializer
+
+    queryset = Delivery.objects.order_by('id')
+    ids = list(queryset.values_list('id', flat=True)[:rows])
+    queryset = queryset.filter(id__in=ids)
+    sample = DeliveryReadSerializer().serialize(queryset)
+
+    def run_drf():
+        with CaptureQueriesContext(connection) as captured:
+            data = DeliverySerializer(
+                DeliveryFieldset.full().apply(queryset), many=True
+            ).data
+        return len(captured), len(data)
+
+    def run_fast():
+        with CaptureQueriesContext(connection) as captured:
+            data = DeliveryReadSerializer().serialize(queryset)
+        return len(captured), len(data)
+
+    def run_fast_compact():
+        with CaptureQueriesContext(connection) as captured:
+            data = DeliveryReadSerializer(DeliveryFieldset()).serialize(queryset)
+        return len(captured), len(data)
+
+    def run_json_renderer():
+        return 0, len(JSONRenderer().render(sample))
+
+    def run_orjson_renderer():
+        return 0, len(ORJSONRenderer().render(sample))
+
+    return {
+        f'serializer:drf[{rows}]': run_drf,
+        f'serializer:fast[{rows}]': run_fast,
+        f'serializer:fast_compact[{rows}]': run_fast_compact,
+        f'renderer:json[{rows}]': run_json_renderer,
+        f'renderer:orjson[{rows}]': run_orjson_renderer,
+    }
+
+
+def view_benchmarks():
+    """
+    Замеры эндпоинтов через тестовый клиент.
+
+    Запросы выполняются от имени самого загруженного курьера
+    и диспетчера, созданных benchmarks.dataset.
+
+    Returns:
+        dict: Имя замера -> функция
+    """
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.db.models import Count
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from delivery.models import Delivery
+
+    busiest = (
+        Delivery.objects.filter(courier__username__startswith=COURIER_USERNAME.format(index=''))
+        .values('courier').annotate(total=Count('id')).order_by('-total').first()
+    )
+    courier = User.objects.get(pk=busiest['courier']) if busiest else User.objects.filter(is_staff=False).first()
+    dispatcher = User.objects.filter(username=DISPATCHER_USERNAME).first() or courier
+
+    def client_for(user):
+        return Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', HTTP_ACCEPT_ENCODING='identity')
+
+    courier_client = client_for(courier)
+    dispatcher_client = client_for(dispatcher)
+    delivery_id = Delivery.objects.filter(courier=courier).values_list('id', flat=True).first()
+
+    def get(client, url):
+        def run():
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+            size = len(b''.join(response.streaming_content)) if response.streaming else len(response.content)
+            return len(captured), size
+        return run
+
+    benchmarks = {
+        'view:available': get(courier_client, '/api/deliveries/available/'),
+        'view:available_compact': get(courier_client, '/api/deliveries/available/?fields=id,source_lat,source_lon,distance'),
+        'view:my_active': get(courier_client, '/api/deliveries/my/active/'),
+        'view:my_history': get(courier_client, '/api/deliveries/my/history/'),
+        'view:profile': get(courier_client, '/api/profile/'),
+        'view:coordinates': get(dispatcher_client, '/api/deliveries/coordinates/'),
+        'view:statuses': get(dispatcher_client, '/api/statuses/'),
+        'view:transport_models': get(dispatcher_client, '/api/transport-models/'),
+    }
+    if delivery_id is not None:
+        benchmarks['view:retrieve'] = get(courier_client, f'/api/deliveries/{delivery_id}/')
+    if Delivery.objects.count() <= MAX_LIST_ROWS:
+        benchmarks['view:list'] = get(dispatcher_client, '/api/deliveries/')
+    return benchmarks
+
+
+def main(argv=None):
+    """Точка входа: python -m benchmarks.micro."""
+    parser = argparse.ArgumentParser(description="Микробенчмарки сериализаторов и представлений")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--rows', type=int, default=500, help="доставок в замерах сериализаторов")
+    parser.add_argument('--only', default='', help="выполнять замеры с этим префиксом имени")
+    parser.add_argument('--output', help="файл результата (по умолчанию results/micro-*.json)")
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from delivery.models import Delivery
+
+    # Тестовый клиент обращается к хосту testserver
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    # Повторы одного запроса не должны упираться в ограничение частоты
+    settings.THROTTLE_BUCKETS = {}
+
+    benchmarks = {**serializer_benchmarks(args.rows), **view_benchmarks()}
+    results = {}
+    for name, func in benchmarks.items():
+        if not name.startswith(args.only):
+            continue
+        results[name] = measure(func, args.repeat)
+        stats = results[name]
+        print(f"{name:45} {stats['median_ms']:10.2f} ms  p95 {stats['p95_ms']:10.2f} ms  "
+              f"queries {stats['queries']:>4}  size {stats['size']}")
+
+    metadata = {
+        'deliveries': Delivery.objects.count(),
+        'repeat': args.repeat,
+        'rows': args.rows,
+    }
+    path = write_results('micro', results, metadata, args.output)
+    print(f"Результаты: {path}")
+
+
+if __name__ == '__main__':
+    main()
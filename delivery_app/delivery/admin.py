@@ -1,6 +1,30 @@
 """Административная панель для управления моделями доставки."""
-from django.contrib import admin
-from .models import TransportModel, PackagingType, Service, Status, Delivery, UserProfile
+import json
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html, format_html_join
+from .models import TransportModel, PackagingType, Service, Status, Delivery, UserProfile, ProfileReport
+from . import events, maps
+from .push import delivery_event, publish_delivery_event
+from .search import search_deliveries
+
+# Оценка числа строк списка доставок, начиная с которой COUNT(*) не выполняется
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+# Максимум событий push-канала на массовое действие; больше - одно событие resync
+ADMIN_BULK_EVENT_LIMIT = 500
 
 @admin.register(TransportModel)
 class TransportModelAdmin(admin.ModelAdmin):
@@ -26,15 +50,249 @@ class StatusAdmin(admin.ModelAdmin):
     list_display = ['name', 'color']
     search_fields = ['name']
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который на больших выборках берет число строк из плана запроса.
+
+    COUNT(*) по большой таблице доставок читает ее целиком; в PostgreSQL
+    оценка из EXPLAIN берется из статистики. Если оценка меньше
+    ADMIN_EXACT_COUNT_LIMIT, выборка считается точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate > ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+class CourierFilter(admin.SimpleListFilter):
+    """
+    Фильтр по курьеру с поиском (autocomplete) вместо списка всех пользователей.
+    """
+
+    title = "курьеру"
+    parameter_name = 'courier'
+    template = 'admin/delivery/courier_filter.html'
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.admin_site = model_admin.admin_site
+
+    def lookups(self, request, model_admin):
+        lookups = [('none', "Без курьера")]
+        value = self.value()
+        if value and value.isdigit():
+            # В списке только выбранный курьер; остальные ищутся в поле поиска
+            courier = User.objects.filter(pk=value).only('username').first()
+            if courier is not None:
+                lookups.append((value, courier.username))
+        return lookups
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value == 'none':
+            return queryset.filter(courier__isnull=True)
+        if value and value.isdigit():
+            return queryset.filter(courier_id=int(value))
+        return queryset
+
+    def choices(self, changelist):
+        value = self.value()
+        field = forms.ModelChoiceField(
+            User.objects.all(),
+            required=False,
+            widget=AutocompleteSelect(Delivery._meta.get_field('courier'), self.admin_site),
+        )
+        self.search_widget = field.widget.render(
+            'courier_filter',
+            value if value and value.isdigit() else None,
+            attrs={
+                'id': 'courier_filter',
+                'data-select-url': changelist.get_query_string({self.parameter_name: '__id__'}),
+                'data-clear-url': changelist.get_query_string(remove=[self.parameter_name]),
+            },
+        )
+        return super().choices(changelist)
+
+
+class DeliveryActionForm(helpers.ActionForm):
+    """Форма действий над доставками с параметрами массовых изменений."""
+
+    courier = forms.ModelChoiceField(
+        User.objects.all(),
+        required=False,
+        label="Курьер",
+        widget=AutocompleteSelect(Delivery._meta.get_field('courier'), admin.site),
+    )
+    status = forms.ModelChoiceField(Status.objects.all(), required=False, label="Статус")
+
+
 @admin.register(Delivery)
 class DeliveryAdmin(admin.ModelAdmin):
     """Административный интерфейс для доставки."""
     list_display = ['transport_number', 'transport_model', 'start_time', 'status', 'courier']
-    list_filter = ['status', 'start_time', 'courier']
-    search_fields = ['transport_number']
+    list_select_related = ['transport_model', 'status', 'courier']
+    list_filter = ['status', 'start_time', CourierFilter]
+    date_hierarchy = 'start_time'
+    # Поле поиска админки; сам поиск выполняет delivery.search по индексам
+    search_fields = ['transport_number', 'source_address', 'destination_address']
+    search_help_text = "Номер транспорта или адрес; слова можно вводить не полностью"
+    autocomplete_fields = ['transport_model', 'packaging', 'status', 'courier', 'services']
+    paginator = EstimatedCountPaginator
+    # Без второго COUNT(*) по всей таблице при фильтрации
+    show_full_result_count = False
+    action_form = DeliveryActionForm
+    actions = ['reassign_courier', 'unassign_courier', 'change_status']
+
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет через индексированный поиск вместо ILIKE по каждому полю."""
+        if not search_term.strip():
+            return queryset, False
+        return search_deliveries(queryset, search_term), False
+
+    def bulk_update(self, request, queryset, op, **values):
+        """
+        Изменяет выбранные доставки одним UPDATE.
+
+        QuerySet.update() обходит сигналы модели, поэтому события push-канала
+        публикуются здесь: по одному на доставку или одно событие resync,
+        если доставок больше ADMIN_BULK_EVENT_LIMIT. Журнал изменений
+        получает событие для каждой доставки, у которой поле изменилось, а
+        ячейки карты - перемещения доставок при смене курьера.
+
+        Args:
+            request: HTTP запрос
+            queryset: Выбранные доставки
+            op: Тип события push-канала
+            **values: Новые значения полей
+
+        Returns:
+            int: Число измененных доставок
+        """
+        rows = list(queryset.values(
+            'id', 'courier_id', 'status_id', 'source_lat', 'source_lon'
+        )[:ADMIN_BULK_EVENT_LIMIT + 1])
+        fields = {name: name.removesuffix('_id') for name in values}
+        # Смена курьера переносит доставки на карту или убирает с нее
+        map_fields = maps.FIELDS if 'courier_id' in values else ()
+        with transaction.atomic():
+            # Прежние значения читаются до UPDATE: после него фильтр списка может не совпасть
+            changes = []
+            moves = []
+            for row in queryset.values(*dict.fromkeys(('id', *fields, *map_fields))).iterator(chunk_size=2000):
+                changes.extend(events.delivery_changes(
+                    row['id'],
+                    {field: row[name] for name, field in fields.items()},
+                    {field: values[name] for name, field in fields.items()},
+                ))
+                if map_fields:
+                    moves.append((maps.point(row), maps.point({**row, 'courier_id': values['courier_id']})))
+            events.record(changes)
+            maps.record_moves(moves)
+            # Версия увеличивается, чтобы изменения клиентов по старой версии получили конфликт
+            updated = queryset.update(version=F('version') + 1, **values)
+            if len(rows) > ADMIN_BULK_EVENT_LIMIT:
+                publish_delivery_event({'op': 'resync'})
+            else:
+                for row in rows:
+                    delivery = Delivery(
+                        id=row['id'],
+                        courier_id=values.get('courier_id', row['courier_id']),
+                        status_id=values.get('status_id', row['status_id']),
+                        source_lat=row['source_lat'],
+                        source_lon=row['source_lon'],
+                    )
+                    publish_delivery_event(delivery_event(op, delivery, row['courier_id'], row['status_id']))
+        self.message_user(request, f"Изменено доставок: {updated}", messages.SUCCESS)
+        return updated
+
+    @admin.action(description="Назначить выбранные доставки курьеру", permissions=['change'])
+    def reassign_courier(self, request, queryset):
+        courier = self.get_action_value(request, 'courier')
+        if courier is None:
+            self.message_user(request, "Выберите курьера", messages.WARNING)
+            return
+        self.bulk_update(request, queryset, 'assigned', courier_id=courier.pk)
+
+    @admin.action(description="Снять курьера с выбранных доставок", permissions=['change'])
+    def unassign_courier(self, request, queryset):
+        self.bulk_update(request, queryset, 'unassigned', courier_id=None)
+
+    @admin.action(description="Изменить статус выбранных доставок", permissions=['change'])
+    def change_status(self, request, queryset):
+        status = self.get_action_value(request, 'status')
+        if status is None:
+            self.message_user(request, "Выберите статус", messages.WARNING)
+            return
+        self.bulk_update(request, queryset, 'status', status_id=status.pk)
+
+    def get_action_value(self, request, name):
+        """Значение поля формы действий (курьер или статус) или None."""
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid():
+            return None
+        return form.cleaned_data[name]
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     """Административный интерфейс для профиля пользователя."""
     list_display = ['user', 'phone', 'email']
     search_fields = ['user__username']
+
+@admin.register(ProfileReport)
+class ProfileReportAdmin(admin.ModelAdmin):
+    """Административный интерфейс для отчетов профилирования."""
+    list_display = ['created_at', 'method', 'path', 'status_code', 'duration_ms', 'query_count', 'sql_time_ms', 'trigger', 'user']
+    list_filter = ['trigger', 'method', 'route']
+    search_fields = ['path']
+    date_hierarchy = 'created_at'
+    fields = [
+        'created_at', 'method', 'path', 'route', 'user', 'trigger', 'status_code',
+        'duration_ms', 'query_count', 'sql_time_ms', 'flamegraph', 'slow_queries_table', 'text_report'
+    ]
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/flamegraph/',
+                self.admin_site.admin_view(self.flamegraph_view),
+                name='delivery_profilereport_flamegraph'
+            ),
+        ] + super().get_urls()
+
+    def flamegraph_view(self, request, pk):
+        """Отдает HTML-отчет pyinstrument с flamegraph."""
+        report = get_object_or_404(ProfileReport, pk=pk)
+        if not self.has_view_permission(request, report):
+            raise PermissionDenied
+        return HttpResponse(report.html_report)
+
+    @admin.display(description='Flamegraph')
+    def flamegraph(self, obj):
+        """Ссылка на HTML-отчет."""
+        url = reverse('admin:delivery_profilereport_flamegraph', args=[obj.pk])
+        return format_html('<a href="{}" target="_blank">Открыть</a>', url)
+
+    @admin.display(description='Медленные запросы')
+    def slow_queries_table(self, obj):
+        """Самые медленные запросы с планами выполнения."""
+        return format_html_join(
+            '', '<p><b>{} ms</b></p><pre>{}</pre><pre>{}</pre><pre>{}</pre>',
+            (
+                (query['time_ms'], query['sql'], ', '.join(query['params']), query['explain'])
+                for query in obj.slow_queries
+            )
+        )
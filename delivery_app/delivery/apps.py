@@ -4,3 +4,22 @@ from django.apps import AppConfig
 class DeliveryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'delivery'
+
+    def ready(self):
+        from django.conf import settings
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+
+        from . import checks, signals  # noqa: F401  (регистрация проверок и обработчиков сигналов)
+        from .metrics import install_query_wrapper
+        from .partitions import ensure_partitions_after_migrate
+
+        post_migrate.connect(ensure_partitions_after_migrate, sender=self, dispatch_uid='delivery_partitions')
+
+        if getattr(settings, 'METRICS_ENABLED', True):
+            # До первого соединения с базой, чтобы считать запросы всех соединений
+            connection_created.connect(install_query_wrapper, dispatch_uid='delivery_metrics')
+        if getattr(settings, 'PROFILING_ENABLED', False):
+            from .profiling import install_capture_wrapper
+
+            connection_created.connect(install_capture_wrapper, dispatch_uid='delivery_profiling')
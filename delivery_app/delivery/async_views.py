@@ -0,0 +1,199 @@
+"""
+Асинхронные представления для чтения доставок и профиля.
+Работают под ASGI на асинхронном ORM и не занимают воркер на время
+ожидания базы или медленного клиента.
+"""
+
+from functools import wraps
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, Throttled
+
+from .authentication import AsyncJWTAuthentication
+from .db_router import replica_safe
+from .fieldsets import DeliveryFieldset
+from .models import Status, Delivery, UserProfile
+from .renderers import ORJSONRenderer
+from .serializers import UserProfileSerializer
+from . import fragments, maps, push, queries, throttling
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+authenticator = AsyncJWTAuthentication()
+renderer = ORJSONRenderer()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    """Возвращает JSON-ответ, отрендеренный ORJSONRenderer."""
+    return HttpResponse(renderer.render(data), content_type=renderer.media_type, status=status_code)
+
+
+def async_api_view(view=None, allow_query_token=False, throttle_scope=throttling.READ_SCOPE):
+    """
+    Декоратор асинхронного GET-эндпоинта с JWT аутентификацией.
+
+    Ошибки аутентификации и APIException превращаются в ответы
+    того же формата, что и у представлений DRF.
+
+    Args:
+        allow_query_token: Принимать токен в параметре access_token
+            (для EventSource, который не передает заголовки)
+        throttle_scope: Класс ограничения частоты (delivery.throttling)
+            или функция запроса, возвращающая класс
+    """
+    if view is None:
+        return lambda view: async_api_view(view, allow_query_token, throttle_scope)
+
+    @require_GET
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await authenticator.aauthenticate(request)
+            if result is None and allow_query_token and request.GET.get('access_token'):
+                user = await push.authenticate_token(request.GET['access_token'])
+                result = (user, None)
+            if result is None:
+                raise NotAuthenticated()
+            request.user, request.auth = result
+            scope = throttle_scope(request) if callable(throttle_scope) else throttle_scope
+            if scope:
+                wait = await throttling.acheck(request, scope)
+                if wait:
+                    raise Throttled(wait)
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            response = json_response(
+                exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail},
+                exc.status_code
+            )
+            if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                response['WWW-Authenticate'] = authenticator.authenticate_header(request)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = str(exc.wait)
+            return response
+
+    return wrapper
+
+
+@async_api_view(throttle_scope='poll')
+async def available_deliveries(request):
+    """
+    Асинхронная версия AvailableDeliveriesView.get.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        HttpResponse: Список доступных доставок
+    """
+    status_obj, _ = await Status.objects.aget_or_create(
+        name=queries.PENDING_STATUS_NAME,
+        defaults={'color': 'yellow'}
+    )
+    deliveries = queries.available_deliveries(status_obj, request.GET)
+    return json_response(await fragments.DeliveryFragments(DeliveryFieldset.from_request(request)).arender(deliveries))
+
+
+@async_api_view(throttle_scope='poll')
+async def my_active_deliveries(request):
+    """
+    Асинхронная версия MyActiveDeliveriesView.get.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        HttpResponse: Список активных доставок
+    """
+    deliveries = queries.my_active_deliveries(request.user)
+    return json_response(await fragments.DeliveryFragments(DeliveryFieldset.from_request(request)).arender(deliveries))
+
+
+@replica_safe
+@async_api_view(throttle_scope='poll')
+async def my_history_deliveries(request):
+    """
+    Асинхронная версия MyHistoryDeliveriesView.get.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        HttpResponse: История доставок
+    """
+    deliveries = queries.my_history_deliveries(request.user)
+    return json_response(await fragments.DeliveryFragments(DeliveryFieldset.from_request(request)).arender(deliveries))
+
+
+@async_api_view(throttle_scope=throttling.coordinates_scope)
+async def coordinates(request):
+    """
+    Асинхронная версия DeliveryViewSet.coordinates.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        HttpResponse: Список координат доставок или кластеров
+    """
+    window = maps.parse_window(request.GET)
+    if window is not None:
+        return json_response(maps.clusters([row async for row in maps.cells(*window)]))
+
+    result = [
+        delivery async for delivery in queries.unassigned_coordinates()
+        if queries.has_coordinates(delivery)
+    ]
+    return json_response(result)
+
+
+@replica_safe
+@async_api_view
+async def profile(request):
+    """
+    Асинхронная версия ProfileView.get.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        HttpResponse: Профиль и статистика курьера
+    """
+    user_profile, _ = await UserProfile.objects.select_related('user').aget_or_create(user=request.user)
+    serializer = UserProfileSerializer(user_profile)
+
+    total_deliveries = await Delivery.objects.filter(courier=request.user).acount()
+    completed_deliveries = queries.my_history_deliveries(request.user)
+    successful_deliveries = await completed_deliveries.acount()
+    durations = [
+        pair async for pair in completed_deliveries.values_list('start_time', 'end_time')
+    ]
+    stats = queries.courier_stats(total_deliveries, successful_deliveries, durations)
+
+    return json_response({**serializer.data, **stats})
+
+
+@async_api_view(allow_query_token=True, throttle_scope='poll')
+async def delivery_events(request):
+    """
+    Поток изменений доставок в формате Server-Sent Events.
+
+    Параметры: channel=available,my,bbox и bbox=min_lon,min_lat,max_lon,max_lat.
+    Работает только под ASGI.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        StreamingHttpResponse: Бесконечный поток событий
+    """
+    channels = [channel for channel in request.GET.get('channel', 'available').split(',') if channel]
+    subscription = push.Subscription(request.user.pk, channels, request.GET.get('bbox'))
+
+    response = StreamingHttpResponse(push.sse_stream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
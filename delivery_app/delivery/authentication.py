@@ -0,0 +1,163 @@
+"""
+Аутентификация по JWT для API приложения доставки.
+Пользователь из токена кэшируется на AUTH_USER_CACHE_SECONDS, поэтому
+повторные запросы клиента не обращаются к базе за пользователем. В кэше
+лежат только поля CACHED_USER_FIELDS, без хэша пароля.
+Включает асинхронный вариант для ASGI-представлений.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+# Поля пользователя в кэше аутентификации
+CACHED_USER_FIELDS = ('id', 'username', 'is_active', 'is_staff')
+
+
+def user_cache_key(user_id):
+    """Ключ кэша пользователя для JWT аутентификации."""
+    return f'delivery:auth:user:{user_id}'
+
+
+def token_version(validated_token):
+    """
+    Версия токена: хэш пароля из claim отзыва (SIMPLE_JWT CHECK_REVOKE_TOKEN).
+
+    Запись кэша подходит только токенам той же версии, поэтому после смены
+    пароля токены со старым хэшем снова проверяются по базе.
+    """
+    return validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+
+
+def invalidate_cached_user(user_id):
+    """Удаляет пользователя из кэша аутентификации (смена пароля, блокировка)."""
+    cache.delete(user_cache_key(user_id))
+
+
+def cache_entry(user, version):
+    """Запись кэша аутентификации: версия токена и поля CACHED_USER_FIELDS."""
+    return version, {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+
+
+def cached_user(user_model, fields):
+    """
+    Пользователь из полей записи кэша.
+
+    Экземпляр не загружается из базы и годится для сравнения
+    и внешних ключей; остальные поля (в том числе пароль) пусты.
+    """
+    user = user_model(**fields)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+def _token_user_id(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError as e:
+        raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT аутентификация с кэшем пользователей.
+
+    Пользователь, прошедший проверки JWTAuthentication (активность,
+    отзыв токена), хранится в кэше AUTH_USER_CACHE_SECONDS секунд по ID
+    вместе с версией токена (только поля CACHED_USER_FIELDS). Запись удаляется сигналами при сохранении
+    и удалении пользователя; изменения в обход сигналов (QuerySet.update)
+    вступают в силу по истечении TTL.
+    """
+
+    def get_user(self, validated_token):
+        """
+        Возвращает пользователя из кэша или загружает его из базы.
+
+        Args:
+            validated_token: Проверенный токен
+
+        Returns:
+            User: Пользователь из токена
+        """
+        key = user_cache_key(_token_user_id(validated_token))
+        version = token_version(validated_token)
+        cached = cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached_user(self.user_model, cached[1])
+        user = super().get_user(validated_token)
+        cache.set(key, cache_entry(user, version), settings.AUTH_USER_CACHE_SECONDS)
+        return user
+
+
+class AsyncJWTAuthentication(CachedJWTAuthentication):
+    """
+    JWT аутентификация для асинхронных представлений.
+
+    Разбор и проверка токена не обращаются к базе и выполняются как есть,
+    пользователь берется из кэша или загружается через асинхронный ORM.
+    """
+
+    async def aauthenticate(self, request):
+        """
+        Аутентифицирует запрос по заголовку Authorization.
+
+        Args:
+            request: HTTP запрос Django
+
+        Returns:
+            tuple | None: (пользователь, токен) или None без заголовка
+
+        Raises:
+            AuthenticationFailed: Токен или пользователь недействительны
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        """
+        Асинхронно возвращает пользователя, указанного в токене (из кэша или базы).
+
+        Args:
+            validated_token: Проверенный токен
+
+        Returns:
+            User: Пользователь из токена
+        """
+        user_id = _token_user_id(validated_token)
+        key = user_cache_key(user_id)
+        version = token_version(validated_token)
+        cached = await cache.aget(key)
+        if cached is not None and cached[0] == version:
+            return cached_user(self.user_model, cached[1])
+
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        await cache.aset(key, cache_entry(user, version), settings.AUTH_USER_CACHE_SECONDS)
+        return user
@@ -0,0 +1,177 @@
+"""
+Брокеры событий для push-канала доставок.
+Доставляют события изменения доставок подписчикам во всех процессах сервера.
+"""
+
+import asyncio
+import logging
+import select
+import threading
+import time
+
+import orjson
+from django.conf import settings
+from django.db import connection, connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Максимум событий в очереди одного подписчика; при переполнении
+# подписчик получает событие resync и должен перечитать список
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+RESYNC_EVENT = {'op': 'resync'}
+
+
+def _deliver(queue, message):
+    """Кладет событие в очередь подписчика (выполняется в его event loop)."""
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(RESYNC_EVENT)
+
+
+class InMemoryBroker:
+    """
+    Брокер в памяти процесса.
+
+    Подходит для одного процесса сервера и для тестов; служит основой
+    для брокеров, которые получают события из внешнего источника.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, message):
+        """
+        Публикует событие.
+
+        Args:
+            message: Событие (словарь, сериализуемый в JSON)
+        """
+        self.dispatch(message)
+
+    def dispatch(self, message):
+        """Раздает событие подписчикам текущего процесса."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(_deliver, queue, message)
+
+    def subscribe(self):
+        """
+        Регистрирует подписчика в текущем event loop.
+
+        Returns:
+            asyncio.Queue: Очередь, в которую будут приходить события
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.add((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, queue):
+        """Удаляет подписчика, зарегистрированного subscribe()."""
+        with self._lock:
+            self._subscribers = {entry for entry in self._subscribers if entry[1] is not queue}
+
+
+class PostgresBroker(InMemoryBroker):
+    """
+    Брокер на PostgreSQL LISTEN/NOTIFY.
+
+    События публикуются через pg_notify и приходят во все процессы,
+    где есть подписчики. Каждый такой процесс держит одно выделенное
+    соединение в фоновом потоке и раздает события локально.
+    """
+
+    def __init__(self, channel=None, alias='default'):
+        super().__init__()
+        self.channel = channel or getattr(settings, 'PUSH_CHANNEL', 'delivery_events')
+        self.alias = alias
+        self._listener = None
+
+    def publish(self, message):
+        """Отправляет событие через pg_notify."""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, orjson.dumps(message).decode()])
+
+    def subscribe(self):
+        """Запускает слушателя при первой подписке в процессе."""
+        self._ensure_listener()
+        return super().subscribe()
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen_forever, name='delivery-push-listener', daemon=True
+                )
+                self._listener.start()
+
+    def _listen_forever(self):
+        """Держит соединение LISTEN и переподключается после ошибок."""
+        delay = 1
+        while True:
+            wrapper = connections.create_connection(self.alias)
+            # LISTEN занимает соединение постоянно, поэтому оно открывается вне пула
+            options = {key: value for key, value in wrapper.settings_dict.get('OPTIONS', {}).items() if key != 'pool'}
+            wrapper.settings_dict = {**wrapper.settings_dict, 'OPTIONS': options}
+            try:
+                wrapper.ensure_connection()
+                raw = wrapper.connection
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                delay = 1
+                for payload in self._notifications(raw):
+                    try:
+                        self.dispatch(orjson.loads(payload))
+                    except orjson.JSONDecodeError:
+                        logger.warning("Некорректное событие в канале %s", self.channel)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Ошибка слушателя канала %s, переподключение через %s с", self.channel, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+            finally:
+                try:
+                    wrapper.close()
+                except Exception:  # pylint: disable=broad-except
+                    pass
+
+    @staticmethod
+    def _notifications(raw):
+        """Отдает тексты уведомлений для psycopg2 и psycopg 3."""
+        if hasattr(raw, 'poll'):
+            while True:
+                if select.select([raw], [], [], 30) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    yield raw.notifies.pop(0).payload
+        else:
+            while True:
+                for notify in raw.notifies(timeout=30):
+                    yield notify.payload
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Возвращает брокер процесса, заданный настройкой PUSH_BROKER.
+
+    Returns:
+        InMemoryBroker: Экземпляр брокера
+    """
+    global _broker  # pylint: disable=global-statement
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'PUSH_BROKER', 'delivery.broker.InMemoryBroker'))()
+    return _broker
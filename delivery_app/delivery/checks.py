@@ -0,0 +1,34 @@
+"""
+Проверки конфигурации приложения доставки (manage.py check).
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+# Кэши, которые не видны другим процессам
+PROCESS_LOCAL_CACHES = (LocMemCache, DummyCache)
+
+
+@register(Tags.caches)
+def check_replica_pin_cache(app_configs, **kwargs):
+    """
+    Реплики требуют общего кэша.
+
+    Закрепление пользователя за основной базой после записи
+    (db_router.pin_to_primary) хранится в кэше default; в кэше процесса
+    его не увидят другие воркеры, и пользователь прочитает с реплики
+    данные без своей записи.
+    """
+    if not getattr(settings, 'DATABASE_REPLICAS', ()):
+        return []
+    if not isinstance(caches['default'], PROCESS_LOCAL_CACHES):
+        return []
+    return [Error(
+        "DATABASE_REPLICAS задан, а кэш default не общий для процессов",
+        hint="Задайте REDIS_URL (или другой общий кэш) или уберите DB_REPLICAS",
+        obj='CACHES',
+        id='delivery.E001',
+    )]
@@ -0,0 +1,182 @@
+"""
+Адаптивное ограничение параллельности и сброс нагрузки.
+
+Запросы делятся на классы: critical (изменения: назначение, смена
+статуса, синхронизация, вход), low (опрос списков, поиск, выгрузки,
+отчеты и прием GPS-точек) и default (остальное). Когда база замедляется, запросы
+копятся в воркерах и очереди сервера, и медленными становятся все
+сразу. Лимитер процесса ограничивает число одновременных запросов
+класса low по принципу AIMD: запрос любого класса, выполнявшийся
+дольше цели своего класса (или ждавший в очереди дольше цели),
+уменьшает лимит вдвое, быстрый запрос увеличивает его на 1/limit.
+Лишние запросы low сразу получают 503, а critical не ограничиваются,
+поэтому освободившееся время базы достается им.
+
+Лимит меньше 1 означает, что запрос low пропускается с такой
+вероятностью: так сброс работает и в синхронных воркерах,
+обрабатывающих по одному запросу.
+"""
+
+import random
+import threading
+import time
+from functools import lru_cache
+
+from django.urls import Resolver404, resolve
+
+CRITICAL = 'critical'
+DEFAULT = 'default'
+LOW = 'low'
+
+# Маршруты (имена URL), чтение которых можно отложить при перегрузке
+LOW_PRIORITY_ROUTES = frozenset({
+    'available_deliveries',
+    'my_active_deliveries',
+    'my_history_deliveries',
+    'deliveries_coordinates',
+    'deliveries_search',
+    'delivery-list',
+    'async_available_deliveries',
+    'async_my_active_deliveries',
+    'async_my_history_deliveries',
+    'async_deliveries_coordinates',
+    'status_duration_report',
+    'delivery-track',
+    'courier_track',
+})
+
+# Изменяющие маршруты, которые тоже можно сбросить: клиент повторит
+# отправку со следующей пачкой
+LOW_PRIORITY_WRITE_ROUTES = frozenset({
+    'courier_locations',
+})
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def request_class(request):
+    """
+    Класс запроса для лимитера.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        str: CRITICAL, LOW или DEFAULT
+    """
+    name = _route_name(request.path_info)
+    if request.method not in SAFE_METHODS:
+        return LOW if name in LOW_PRIORITY_WRITE_ROUTES else CRITICAL
+    return LOW if name in LOW_PRIORITY_ROUTES else DEFAULT
+
+
+@lru_cache(maxsize=4096)
+def _route_name(path):
+    try:
+        return resolve(path).url_name
+    except Resolver404:
+        return None
+
+
+def queue_time(request, now=None):
+    """
+    Время ожидания запроса в очереди до воркера по заголовку X-Request-Start.
+
+    Балансировщик передает момент приема запроса: `t=<секунды>` (nginx $msec)
+    или `t=<микросекунды>`.
+
+    Returns:
+        float: Секунды в очереди или 0, если заголовка нет
+    """
+    header = request.headers.get('X-Request-Start')
+    if not header:
+        return 0.0
+    try:
+        started = float(header.removeprefix('t='))
+    except ValueError:
+        return 0.0
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    return max(0.0, (now or time.time()) - started)
+
+
+class AdaptiveLimiter:
+    """
+    Лимит одновременных запросов класса low в процессе (AIMD).
+
+    Args:
+        targets: Класс -> целевое время ответа в секундах
+        max_limit: Верхняя граница лимита
+        min_limit: Нижняя граница (доля пропускаемых запросов low при перегрузке)
+        max_queue: Запрос low, ждавший в очереди дольше, сбрасывается сразу
+    """
+
+    def __init__(self, targets, max_limit=16, min_limit=0.05, max_queue=1.0):
+        self.targets = targets
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.max_queue = max_queue
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, request_class, waited=0.0):
+        """
+        Решает, принять ли запрос.
+
+        Args:
+            request_class: Класс запроса
+            waited: Время ожидания в очереди (секунды)
+
+        Returns:
+            bool: True, если запрос принят (тогда нужно вызвать release)
+        """
+        if request_class != LOW:
+            return True
+        if waited > self.max_queue:
+            return False
+        with self._lock:
+            whole = int(self.limit)
+            if self.in_flight < whole or (
+                self.in_flight == whole and random.random() < self.limit - whole
+            ):
+                self.in_flight += 1
+                return True
+        return False
+
+    def release(self, request_class):
+        """Отмечает завершение принятого запроса класса low."""
+        if request_class == LOW:
+            with self._lock:
+                self.in_flight -= 1
+
+    def observe(self, request_class, started, latency, waited=0.0):
+        """
+        Пересчитывает лимит по времени завершенного запроса.
+
+        Уменьшение учитывает только запросы, начатые после прошлого
+        уменьшения: запросы, медленные из-за той же перегрузки, не
+        сбрасывают лимит повторно.
+
+        Args:
+            request_class: Класс запроса
+            started: Момент начала обработки (time.monotonic)
+            latency: Время обработки в секундах
+            waited: Время ожидания в очереди
+        """
+        target = self.targets.get(request_class)
+        if target is None:
+            return
+        with self._lock:
+            if latency > target or waited > target:
+                if started > self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = time.monotonic()
+            else:
+                # Ниже 1 лимит растет шагами min_limit, чтобы не вернуться к полной
+                # нагрузке после первого же быстрого запроса
+                step = 1 / self.limit if self.limit >= 1 else self.min_limit
+                self.limit = min(self.max_limit, self.limit + step)
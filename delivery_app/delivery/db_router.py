@@ -0,0 +1,103 @@
+"""
+Маршрутизация запросов между основной базой и репликами.
+Чтение уходит на реплики только в эндпоинтах, помеченных как допускающие
+отставание реплики, и только если пользователь недавно ничего не записывал.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Разрешено ли читать с реплики в текущем запросе
+_use_replica = ContextVar('delivery_use_replica', default=False)
+
+PIN_CACHE_KEY = 'db-pin:{user_id}'
+
+
+def replica_safe(view):
+    """
+    Помечает функцию-представление как допускающую чтение с реплики.
+
+    Для классов APIView используется атрибут replica_safe = True,
+    для ViewSet - replica_actions с именами действий.
+    """
+    view.replica_safe = True
+    return view
+
+
+def is_replica_safe(view_func, method):
+    """
+    Проверяет, можно ли выполнить запрос к представлению на реплике.
+
+    Args:
+        view_func: Функция представления из URLconf
+        method: HTTP метод запроса
+
+    Returns:
+        bool: True для безопасных методов помеченных представлений
+    """
+    if method not in ('GET', 'HEAD'):
+        return False
+    if getattr(view_func, 'replica_safe', False):
+        return True
+
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return False
+    actions = getattr(view_func, 'actions', None)
+    if actions is not None:
+        return actions.get(method.lower()) in getattr(view_class, 'replica_actions', ())
+    return getattr(view_class, 'replica_safe', False)
+
+
+def use_replica(enabled):
+    """Разрешает или запрещает чтение с реплики в текущем контексте."""
+    _use_replica.set(enabled)
+
+
+def pin_to_primary(user_id):
+    """
+    Направляет чтение пользователя в основную базу на REPLICA_PIN_SECONDS.
+
+    Вызывается после записи, чтобы пользователь сразу видел свои изменения,
+    даже если реплика еще не догнала основную базу.
+    """
+    cache.set(PIN_CACHE_KEY.format(user_id=user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    """Проверяет, записывал ли пользователь что-то недавно."""
+    return bool(cache.get(PIN_CACHE_KEY.format(user_id=user_id)))
+
+
+class ReplicaRouter:
+    """
+    Роутер баз данных с репликами для чтения.
+
+    Запись и миграции всегда выполняются в основной базе. Чтение уходит
+    на случайную реплику из DATABASE_REPLICAS, если это разрешено
+    для текущего запроса (см. ReplicaRoutingMiddleware).
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if replicas and _use_replica.get():
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'DATABASE_REPLICAS', ()):
+            return False
+        return None
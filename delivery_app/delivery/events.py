@@ -0,0 +1,204 @@
+"""
+Журнал изменений доставок и время в статусах.
+
+Смена статуса и курьера записывается в DeliveryEvent (кто, какое поле,
+было, стало, когда). События копятся до фиксации транзакции и пишутся
+одним INSERT на транзакцию; вместе с ними одним INSERT ... ON CONFLICT
+обновляются дневные суммы StatusDuration, поэтому отчеты о времени
+в статусах не читают журнал.
+
+Ошибка записи журнала не отменяет уже зафиксированное изменение доставки:
+она попадает в лог, как ошибка push-канала.
+"""
+
+import logging
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .log import current_user_id
+from .models import DeliveryEvent, StatusDuration
+
+logger = logging.getLogger(__name__)
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+# Событий в одном INSERT журнала
+FLUSH_BATCH_SIZE = 1000
+
+
+def _value(value):
+    return None if value is None else str(value)
+
+
+def delivery_changes(delivery_id, previous, current, created=False):
+    """
+    События изменения отслеживаемых полей доставки.
+
+    Args:
+        delivery_id: ID доставки
+        previous: Поле -> значение до изменения (status, courier)
+        current: Поле -> значение после изменения
+        created: Доставка создана: записываются все непустые поля
+
+    Returns:
+        list: Несохраненные DeliveryEvent
+    """
+    user_id = current_user_id()
+    now = timezone.now()
+    events = []
+    for field, new in current.items():
+        old = None if created else previous.get(field)
+        if old != new and (not created or new is not None):
+            events.append(DeliveryEvent(
+                delivery_id=delivery_id, user_id=user_id, field=field,
+                old_value=_value(old), new_value=_value(new), created_at=now,
+            ))
+    return events
+
+
+class CommitBuffer:
+    """
+    Записи, которые пишутся одной пачкой после фиксации транзакции.
+
+    Вне транзакции записи пишутся сразу. Ошибка записи не отменяет уже
+    зафиксированные изменения и попадает в лог.
+
+    Args:
+        name: Атрибут соединения для записей текущей транзакции
+        write: Функция, записывающая список
+        description: Что записывается (для лога)
+    """
+
+    def __init__(self, name, write, description):
+        self.name = name
+        self.write = write
+        self.description = description
+
+    def add(self, items):
+        """Добавляет записи к пачке текущей транзакции."""
+        items = list(items)
+        if not items:
+            return
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self._write(items)
+            return
+        # После отката транзакции ее обработчики on_commit удаляются вместе с пачкой
+        pending = getattr(connection, self.name, None)
+        if pending is None or not any(func == pending.flush for _, func, _ in connection.run_on_commit):
+            pending = _Pending(self, connection)
+            setattr(connection, self.name, pending)
+            transaction.on_commit(pending.flush)
+        pending.items.extend(items)
+
+    def _write(self, items):
+        try:
+            self.write(items)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Не удалось записать %s (%s)", self.description, len(items))
+
+
+class _Pending:
+    """Записи одной транзакции."""
+
+    def __init__(self, buffer, connection):
+        self.buffer = buffer
+        self.connection = connection
+        self.items = []
+
+    def flush(self):
+        if getattr(self.connection, self.buffer.name, None) is self:
+            setattr(self.connection, self.buffer.name, None)
+        self.buffer._write(self.items)
+
+
+def record(events):
+    """
+    Добавляет события в журнал после фиксации текущей транзакции.
+
+    Вне транзакции события пишутся сразу.
+
+    Args:
+        events: Итерируемое DeliveryEvent
+    """
+    _journal.add(events)
+
+
+def write_events(events):
+    """
+    Пишет события и обновляет StatusDuration пачками FLUSH_BATCH_SIZE.
+
+    Args:
+        events: Список DeliveryEvent в порядке изменений
+    """
+    for start in range(0, len(events), FLUSH_BATCH_SIZE):
+        batch = events[start:start + FLUSH_BATCH_SIZE]
+        with transaction.atomic():
+            # Время входа в статус берется из журнала до вставки новых событий
+            _update_durations(batch)
+            DeliveryEvent.objects.bulk_create(batch)
+
+
+def _entered_at(delivery_ids):
+    """Время последнего входа доставок в текущий статус (один запрос)."""
+    if not delivery_ids:
+        return {}
+    return dict(
+        DeliveryEvent.objects.filter(delivery_id__in=delivery_ids, field='status')
+        .values('delivery_id').annotate(entered=Max('created_at'))
+        .values_list('delivery_id', 'entered')
+    )
+
+
+def _update_durations(events):
+    """Добавляет переходы между статусами к дневным суммам StatusDuration."""
+    changes = [event for event in events if event.field == 'status']
+    if not changes:
+        return
+
+    first_seen = {}
+    for event in changes:
+        first_seen.setdefault(event.delivery_id, event)
+    entered = _entered_at([
+        delivery_id for delivery_id, event in first_seen.items() if event.old_value is not None
+    ])
+
+    # (статус, день) -> [входы, выходы, секунды]
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for event in changes:
+        day = timezone.localdate(event.created_at)
+        if event.new_value is not None:
+            totals[int(event.new_value), day][0] += 1
+        since = entered.get(event.delivery_id)
+        if event.old_value is not None and since is not None:
+            row = totals[int(event.old_value), day]
+            row[1] += 1
+            row[2] += max(0.0, (event.created_at - since).total_seconds())
+        entered[event.delivery_id] = event.created_at
+
+    connection = transaction.get_connection()
+    quote = connection.ops.quote_name
+    table = quote(StatusDuration._meta.db_table)
+    rows = sorted(totals.items())
+    params = [
+        value for (status_id, day), counts in rows
+        for value in (status_id, connection.ops.adapt_datefield_value(day), *counts)
+    ]
+    with connection.cursor() as cursor:
+        # Строки в одном порядке во всех транзакциях - без взаимных блокировок
+        cursor.execute(
+            f"INSERT INTO {table} (status_id, {quote('day')}, entries, exits, total_seconds) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))} "
+            f"ON CONFLICT (status_id, {quote('day')}) DO UPDATE SET "
+            f"entries = {table}.entries + EXCLUDED.entries, "
+            f"exits = {table}.exits + EXCLUDED.exits, "
+            f"total_seconds = {table}.total_seconds + EXCLUDED.total_seconds",
+            params,
+        )
+
+
+_journal = CommitBuffer('delivery_event_buffer', write_events, 'журнал доставок')
@@ -0,0 +1,242 @@
+"""
+Быстрая сериализация доставок только для чтения.
+Строит словари напрямую из строк values() без полей DRF, сохраняя вывод
+DeliverySerializer байт в байт.
+"""
+
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework.fields import DateTimeField
+from rest_framework.settings import api_settings
+
+from .fieldsets import DeliveryFieldset
+from .metrics import serializer_timer
+from .models import Delivery
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+# Колонки values(), из которых собираются связанные объекты
+RELATED_VALUES = {
+    'transport_model': ('transport_model__name',),
+    'packaging': ('packaging__name',),
+    'status': ('status__name', 'status__color'),
+    'courier': ('courier__username', 'courier__first_name', 'courier__last_name'),
+}
+
+# Простые поля и функции их преобразования (как в полях DRF)
+FLOAT_FIELDS = ('distance', 'source_lat', 'source_lon', 'dest_lat', 'dest_lon')
+STRING_FIELDS = ('transport_number', 'source_address', 'destination_address')
+
+
+def _datetime_formatter():
+    """
+    Возвращает функцию форматирования дат, совпадающую с DateTimeField DRF.
+
+    Для формата ISO 8601 с включенными часовыми поясами используется
+    короткий путь без создания поля DRF.
+    """
+    field = DateTimeField()
+    if api_settings.DATETIME_FORMAT is None or api_settings.DATETIME_FORMAT.lower() != ISO_8601:
+        return field.to_representation
+
+    field_timezone = field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def format_datetime(value):
+        if not value:
+            return None
+        if not timezone.is_aware(value):
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return format_datetime
+
+
+class DeliveryReadSerializer:
+    """
+    Сериализатор доставок для списков, обходящий механизм полей DRF.
+
+    Загружает доставки одним запросом values() и услуги одним запросом
+    к промежуточной таблице, после чего собирает словари вручную.
+    Вывод совпадает с DeliverySerializer с тем же DeliveryFieldset.
+    """
+
+    def __init__(self, fieldset=None, request=None):
+        """
+        Args:
+            fieldset: Набор полей; по умолчанию полное представление
+            request: HTTP запрос для абсолютных ссылок на медиафайлы
+                (как context['request'] у DeliverySerializer)
+        """
+        self.fieldset = fieldset or DeliveryFieldset.full()
+        self.request = request
+
+    def get_values_fields(self):
+        """
+        Возвращает список колонок для values().
+
+        Returns:
+            list: Имена колонок, включая колонки развернутых связей
+        """
+        columns = []
+        for name in self.fieldset.fields:
+            if name == 'services':
+                continue
+            if name in RELATED_VALUES:
+                columns.append(f'{name}_id')
+                if name in self.fieldset.expand:
+                    columns.extend(RELATED_VALUES[name])
+            else:
+                columns.append(name)
+        return columns
+
+    def get_rows_queryset(self, queryset):
+        """Превращает запрос доставок в запрос строк values()."""
+        return queryset.values(*self.get_values_fields())
+
+    def get_services_queryset(self, delivery_ids):
+        """
+        Возвращает запрос связей доставок с услугами.
+
+        Args:
+            delivery_ids: ID доставок
+
+        Returns:
+            QuerySet: Кортежи (delivery_id, service_id[, service__name])
+        """
+        columns = ['delivery_id', 'service_id']
+        if 'services' in self.fieldset.expand:
+            columns.append('service__name')
+        return Delivery.services.through.objects.filter(
+            delivery_id__in=delivery_ids
+        ).order_by('service_id').values_list(*columns)
+
+    def build_services_map(self, links):
+        """
+        Группирует связи с услугами по доставкам.
+
+        Args:
+            links: Кортежи из get_services_queryset
+
+        Returns:
+            dict: ID доставки -> список услуг в представлении API
+        """
+        services_map = {}
+        if 'services' in self.fieldset.expand:
+            for delivery_id, service_id, name in links:
+                services_map.setdefault(delivery_id, []).append({'id': service_id, 'name': name})
+        else:
+            for delivery_id, service_id in links:
+                services_map.setdefault(delivery_id, []).append(service_id)
+        return services_map
+
+    def build(self, rows, services_map=None):
+        """
+        Собирает представление доставок из строк values().
+
+        Args:
+            rows: Строки values() с колонками из get_values_fields
+            services_map: Результат build_services_map
+
+        Returns:
+            list: Список словарей в формате DeliverySerializer
+        """
+        services_map = services_map or {}
+        expand = self.fieldset.expand
+        format_datetime = _datetime_formatter()
+        media_storage = Delivery._meta.get_field('media_file').storage
+        request = self.request
+
+        def build_media_url(name):
+            if not name:
+                return None
+            url = media_storage.url(name)
+            if request is not None:
+                return request.build_absolute_uri(url)
+            return url
+
+        # Заранее выбираем преобразование для каждого поля, чтобы в цикле
+        # по строкам не было ветвлений по именам полей.
+        builders = []
+        for name in self.fieldset.fields:
+            if name == 'id':
+                builders.append((name, lambda row: row['id']))
+            elif name == 'services':
+                builders.append((name, lambda row: services_map.get(row['id'], [])))
+            elif name in RELATED_VALUES and name not in expand:
+                builders.append((name, lambda row, key=f'{name}_id': row[key]))
+            elif name in ('transport_model', 'packaging'):
+                builders.append((name, lambda row, name=name: {
+                    'id': row[f'{name}_id'],
+                    'name': row[f'{name}__name'],
+                }))
+            elif name == 'status':
+                builders.append((name, lambda row: {
+                    'id': row['status_id'],
+                    'name': row['status__name'],
+                    'color': row['status__color'],
+                }))
+            elif name == 'courier':
+                builders.append((name, lambda row: None if row['courier_id'] is None else {
+                    'id': row['courier_id'],
+                    'username': row['courier__username'],
+                    'first_name': row['courier__first_name'],
+                    'last_name': row['courier__last_name'],
+                }))
+            elif name in ('start_time', 'end_time'):
+                builders.append((name, lambda row, name=name: format_datetime(row[name])))
+            elif name == 'media_file':
+                builders.append((name, lambda row: build_media_url(row['media_file'])))
+            elif name in FLOAT_FIELDS:
+                builders.append((name, lambda row, name=name: (
+                    None if row[name] is None else float(row[name])
+                )))
+            elif name in STRING_FIELDS:
+                builders.append((name, lambda row, name=name: (
+                    None if row[name] is None else str(row[name])
+                )))
+            else:
+                builders.append((name, lambda row, name=name: row[name]))
+
+        return [{name: build(row) for name, build in builders} for row in rows]
+
+    def serialize(self, queryset):
+        """
+        Загружает и сериализует доставки.
+
+        Args:
+            queryset: Запрос доставок (фильтры и сортировка)
+
+        Returns:
+            list: Список словарей в формате DeliverySerializer
+        """
+        rows = list(self.get_rows_queryset(queryset))
+        services_map = None
+        if 'services' in self.fieldset.fields and rows:
+            links = self.get_services_queryset([row['id'] for row in rows])
+            services_map = self.build_services_map(links)
+        with serializer_timer():
+            return self.build(rows, services_map)
+
+    async def aserialize(self, queryset):
+        """
+        Асинхронный вариант serialize() на асинхронном ORM.
+
+        Args:
+            queryset: Запрос доставок (фильтры и сортировка)
+
+        Returns:
+            list: Список словарей в формате DeliverySerializer
+        """
+        rows = [row async for row in self.get_rows_queryset(queryset)]
+        services_map = None
+        if 'services' in self.fieldset.fields and rows:
+            links = self.get_services_queryset([row['id'] for row in rows])
+            services_map = self.build_services_map([link async for link in links])
+        with serializer_timer():
+            return self.build(rows, services_map)
@@ -0,0 +1,128 @@
+"""
+Разреженные наборы полей для эндпоинтов доставок.
+Разбирает параметры ?fields= и ?expand= и строит под них запрос к базе.
+"""
+
+from django.conf import settings
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+
+from .models import Service
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+DELIVERY_FIELDS = (
+    'id', 'transport_model', 'transport_number',
+    'start_time', 'end_time', 'distance', 'media_file',
+    'services', 'packaging', 'status', 'technical_condition',
+    'courier', 'source_address', 'destination_address',
+    'source_lat', 'source_lon', 'dest_lat', 'dest_lon', 'version'
+)
+
+# Связанные объекты, которые можно вернуть как ID или развернуть
+RELATED_FIELDS = ('transport_model', 'packaging', 'status', 'courier', 'services')
+
+# Поля связанных моделей, которые нужны для развернутого представления
+RELATED_COLUMNS = {
+    'transport_model': ('name',),
+    'packaging': ('name',),
+    'status': ('name', 'color'),
+    'courier': ('username', 'first_name', 'last_name'),
+}
+
+
+def _parse_list(value, param):
+    """Разбирает список имен полей через запятую и проверяет их."""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in DELIVERY_FIELDS]
+    if unknown:
+        raise ValidationError({param: f"Неизвестные поля: {', '.join(unknown)}"})
+    return names
+
+
+class DeliveryFieldset:
+    """
+    Набор полей доставки для вывода.
+
+    Attributes:
+        fields: Поля в порядке DeliverySerializer (id присутствует всегда)
+        expand: Связанные поля, которые выводятся вложенными объектами;
+            остальные связанные поля выводятся как ID
+    """
+
+    def __init__(self, fields=None, expand=()):
+        requested = set(fields) if fields is not None else set(DELIVERY_FIELDS)
+        requested.add('id')
+        self.fields = tuple(name for name in DELIVERY_FIELDS if name in requested)
+        self.expand = frozenset(
+            name for name in expand if name in RELATED_FIELDS and name in requested
+        )
+
+    @classmethod
+    def full(cls):
+        """Полное представление, совпадающее с DeliverySerializer."""
+        return cls(expand=RELATED_FIELDS)
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Строит набор полей из параметров запроса.
+
+        Без ?fields= и ?expand= возвращается полное представление, пока
+        DELIVERY_COMPACT_BY_DEFAULT выключен, чтобы уже выпущенные
+        клиенты продолжали работать.
+
+        Args:
+            request: HTTP запрос DRF или Django
+
+        Returns:
+            DeliveryFieldset: Набор полей для ответа
+        """
+        params = getattr(request, 'query_params', request.GET)
+        fields_param = params.get('fields')
+        expand_param = params.get('expand')
+
+        if fields_param is None and expand_param is None:
+            if getattr(settings, 'DELIVERY_COMPACT_BY_DEFAULT', False):
+                return cls()
+            return cls.full()
+
+        fields = _parse_list(fields_param, 'fields') if fields_param else None
+        expand = _parse_list(expand_param, 'expand') if expand_param else ()
+        return cls(fields=fields, expand=expand)
+
+    @property
+    def is_full(self):
+        """True, если набор совпадает с полным представлением."""
+        return len(self.fields) == len(DELIVERY_FIELDS) and len(self.expand) == len(RELATED_FIELDS)
+
+    def apply(self, queryset):
+        """
+        Ограничивает запрос колонками, джойнами и prefetch выбранных полей.
+
+        Args:
+            queryset: Запрос доставок
+
+        Returns:
+            QuerySet: Запрос, загружающий только нужные данные
+        """
+        columns = [name for name in self.fields if name != 'services']
+        select_related = []
+        for name in RELATED_COLUMNS:
+            if name in self.expand:
+                select_related.append(name)
+                columns.extend(f'{name}__{column}' for column in RELATED_COLUMNS[name])
+
+        queryset = queryset.select_related(*select_related) if select_related else queryset.select_related(None)
+        queryset = queryset.only(*columns)
+
+        if 'services' in self.expand:
+            queryset = queryset.prefetch_related(
+                Prefetch('services', queryset=Service.objects.order_by('id'))
+            )
+        elif 'services' in self.fields:
+            queryset = queryset.prefetch_related(
+                Prefetch('services', queryset=Service.objects.only('id').order_by('id'))
+            )
+        return queryset
@@ -0,0 +1,225 @@
+"""
+Кэш JSON-представлений доставок.
+
+Представление доставки хранится готовыми байтами JSON по ключу из ID,
+версии доставки, поколения кэша и набора полей. Сохранение доставки
+увеличивает версию, поэтому прежние представления перестают читаться
+и вытесняются по времени жизни. Переименование строки справочника
+(модель транспорта, упаковка, статус, услуга, курьер) и изменение
+набора услуг в обход writes (admin, services.add()) меняют поколение:
+после фиксации транзакции все представления строятся заново.
+
+Два уровня: кэш процесса (алиас delivery_fragments) перед общим кэшем
+DELIVERY_FRAGMENT_CACHE (Redis при REDIS_URL). Если DELIVERY_FRAGMENT_CACHE
+сам виден только процессу (LocMemCache, DummyCache), уровень один, и
+поколение тоже хранится в процессе: переименование справочника в одном
+воркере сбрасывает представления только в нем, остальные отдают прежние
+названия до истечения DELIVERY_FRAGMENT_TIMEOUT. Изменения самих доставок
+видны всем процессам сразу - их версия входит в ключ. Список собирается
+одним get_many на уровень; промахи сериализуются одной выборкой
+DeliveryReadSerializer.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .checks import PROCESS_LOCAL_CACHES
+from .fast_serializers import DeliveryReadSerializer
+from .models import Delivery
+from .renderers import ORJSONRenderer, RawJSON
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+GENERATION_KEY = 'delivery:json:generation'
+
+renderer = ORJSONRenderer()
+
+
+def _shared():
+    return caches[settings.DELIVERY_FRAGMENT_CACHE]
+
+
+def _tiers():
+    shared = _shared()
+    # Кэш процесса перед кэшем процесса только удвоил бы память
+    if isinstance(shared, PROCESS_LOCAL_CACHES):
+        return (shared,)
+    return (caches['delivery_fragments'], shared)
+
+
+def generation():
+    """
+    Текущее поколение кэша.
+
+    Вытесненный ключ поколения заменяется новым значением времени,
+    которое не совпадает ни с одним прежним.
+    """
+    shared = _shared()
+    value = shared.get(GENERATION_KEY)
+    if value is None:
+        shared.add(GENERATION_KEY, time.time_ns(), None)
+        value = shared.get(GENERATION_KEY)
+    return value
+
+
+async def ageneration():
+    """Асинхронный вариант generation()."""
+    shared = _shared()
+    value = await shared.aget(GENERATION_KEY)
+    if value is None:
+        await shared.aadd(GENERATION_KEY, time.time_ns(), None)
+        value = await shared.aget(GENERATION_KEY)
+    return value
+
+
+def invalidate_all():
+    """Сбрасывает все представления после фиксации текущей транзакции."""
+    transaction.on_commit(lambda: _shared().set(GENERATION_KEY, time.time_ns(), None))
+
+
+class DeliveryFragments:
+    """
+    Представления доставок из кэша.
+
+    Args:
+        fieldset: Набор полей; по умолчанию полное представление
+        request: HTTP запрос для абсолютных ссылок на медиафайлы
+            (как у DeliveryReadSerializer)
+    """
+
+    def __init__(self, fieldset=None, request=None):
+        self.serializer = DeliveryReadSerializer(fieldset, request=request)
+        fieldset = self.serializer.fieldset
+        parts = [*fieldset.fields, '+', *sorted(fieldset.expand)]
+        if 'media_file' in fieldset.fields and request is not None:
+            parts.append(request.build_absolute_uri('/'))
+        self.digest = hashlib.blake2b('|'.join(parts).encode(), digest_size=8).hexdigest()
+
+    def key_function(self, generation_value):
+        """Функция (ID, версия) -> ключ кэша для поколения generation_value."""
+        prefix = f'delivery:json:{generation_value}:{self.digest}'
+        return lambda delivery_id, version: f'{prefix}:{delivery_id}:{version}'
+
+    def render(self, queryset):
+        """
+        Список доставок запроса в виде JSON.
+
+        Args:
+            queryset: Запрос доставок (фильтры, сортировка, срез)
+
+        Returns:
+            RawJSON: Массив представлений в порядке запроса
+        """
+        keys, found = self.fetch(queryset.values_list('id', 'version'))
+        return _array(found, keys)
+
+    def render_one(self, delivery_id, version):
+        """
+        Представление одной доставки.
+
+        Returns:
+            RawJSON: Представление или None, если доставку успели удалить
+        """
+        keys, found = self.fetch([(delivery_id, version)])
+        value = found.get(keys[delivery_id])
+        return None if value is None else RawJSON(value)
+
+    def fetch(self, rows):
+        """
+        Представления доставок из кэша; промахи строятся одной выборкой.
+
+        Args:
+            rows: Пары (ID, версия)
+
+        Returns:
+            tuple: ID -> ключ в порядке rows и ключ -> байты JSON
+        """
+        key = self.key_function(generation())
+        keys = {delivery_id: key(delivery_id, version) for delivery_id, version in rows}
+        found = {}
+        tiers = _tiers()
+        for tier in tiers:
+            missing = [item for item in keys.values() if item not in found]
+            if not missing:
+                break
+            hits = tier.get_many(missing)
+            found.update(hits)
+            # Попадания общего кэша копируются в кэш процесса
+            if hits and tier is not tiers[0]:
+                tiers[0].set_many(hits, settings.DELIVERY_FRAGMENT_TIMEOUT)
+        missing = [delivery_id for delivery_id, item in keys.items() if item not in found]
+        if missing:
+            built = self.build(self.serializer.serialize(Delivery.objects.filter(pk__in=missing)), keys)
+            # Внутри транзакции прочитанная версия может быть отменена
+            transaction.on_commit(lambda: self.store(built))
+            found.update(built)
+        return keys, found
+
+    async def arender(self, queryset):
+        """Асинхронный вариант render() на асинхронном ORM."""
+        key = self.key_function(await ageneration())
+        keys = {
+            delivery_id: key(delivery_id, version)
+            async for delivery_id, version in queryset.values_list('id', 'version')
+        }
+        found = {}
+        tiers = _tiers()
+        for tier in tiers:
+            missing = [item for item in keys.values() if item not in found]
+            if not missing:
+                break
+            hits = await tier.aget_many(missing)
+            found.update(hits)
+            if hits and tier is not tiers[0]:
+                await tiers[0].aset_many(hits, settings.DELIVERY_FRAGMENT_TIMEOUT)
+        missing = [delivery_id for delivery_id, item in keys.items() if item not in found]
+        if missing:
+            built = self.build(await self.serializer.aserialize(Delivery.objects.filter(pk__in=missing)), keys)
+            for tier in tiers:
+                await tier.aset_many(built, settings.DELIVERY_FRAGMENT_TIMEOUT)
+            found.update(built)
+        return _array(found, keys)
+
+    def instance(self, delivery, build):
+        """
+        Представление загруженной доставки.
+
+        Построенное представление попадает в кэш после фиксации
+        транзакции, чтобы версия отмененного изменения не осталась в кэше.
+
+        Args:
+            delivery: Доставка с актуальной версией
+            build: Функция без аргументов, возвращающая словарь представления
+
+        Returns:
+            RawJSON: Представление доставки
+        """
+        item = self.key_function(generation())(delivery.pk, delivery.version)
+        for tier in _tiers():
+            value = tier.get(item)
+            if value is not None:
+                return RawJSON(value)
+        value = renderer.render(build())
+        transaction.on_commit(lambda: self.store({item: value}))
+        return RawJSON(value)
+
+    @staticmethod
+    def build(items, keys):
+        """Ключ -> байты JSON для представлений доставок из keys."""
+        return {keys[item['id']]: renderer.render(item) for item in items if item['id'] in keys}
+
+    @staticmethod
+    def store(values):
+        """Записывает представления во все уровни кэша."""
+        for tier in _tiers():
+            tier.set_many(values, settings.DELIVERY_FRAGMENT_TIMEOUT)
+
+
+def _array(found, keys):
+    # Доставки, удаленные между запросами, пропускаются
+    return RawJSON(b'[' + b','.join(found[item] for item in keys.values() if item in found) + b']')
@@ -0,0 +1,354 @@
+"""
+Прием GPS-точек курьеров.
+
+Приложение отправляет точки пачками: JSON-массивом или в двоичном
+формате (FIX, Content-Type: application/x-gps-fixes). Точки
+прореживаются на сервере (подряд идущие точки ближе LOCATION_MIN_DISTANCE
+метров и чаще LOCATION_MIN_INTERVAL секунд не сохраняются), копятся
+в буфере процесса и пишутся в CourierLocation одним COPY (PostgreSQL
+с psycopg 3) или многострочным INSERT: когда в буфере набралось
+LOCATION_FLUSH_SIZE точек или фоновым потоком раз в
+LOCATION_FLUSH_INTERVAL секунд.
+
+Точки из буфера теряются при аварийном завершении процесса: поток
+точек непрерывный, и потеря секунды трека допустима.
+"""
+
+import atexit
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .metrics import LOCATION_FIXES
+from .models import CourierLocation, Delivery
+
+logger = logging.getLogger(__name__)
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+MEDIA_TYPE = 'application/x-gps-fixes'
+
+# Двоичная точка (little-endian, 22 байта): время (секунды Unix, double),
+# широта и долгота (int32, единицы 1e-7 градуса), точность (uint16, дециметры,
+# 0 - неизвестна), ID доставки (uint32, 0 - без доставки)
+FIX = struct.Struct('<diiHI')
+
+# Точки старше недели и из будущего (с запасом на расхождение часов) не принимаются
+MAX_FIX_AGE = 7 * 24 * 3600
+MAX_FIX_SKEW = 300
+
+EARTH_RADIUS = 6371000.0
+
+COLUMNS = ('courier_id', 'delivery_id', 'recorded_at', 'lat', 'lon', 'accuracy')
+
+
+class Fix(NamedTuple):
+    """GPS-точка из запроса."""
+    recorded_at: float
+    lat: float
+    lon: float
+    accuracy: float = None
+    delivery_id: int = None
+
+
+def _valid(fix, now):
+    return (
+        -90 <= fix.lat <= 90 and -180 <= fix.lon <= 180
+        and now - MAX_FIX_AGE <= fix.recorded_at <= now + MAX_FIX_SKEW
+    )
+
+
+def parse_json(items, now=None):
+    """
+    Разбирает точки из JSON: [{"t": секунды Unix, "lat", "lon", "acc"?, "delivery_id"?}, ...].
+
+    Returns:
+        tuple: Список корректных Fix и число отброшенных точек
+    """
+    if not isinstance(items, list):
+        raise ParseError("Ожидается массив точек")
+    now = now or time.time()
+    fixes = []
+    for item in items:
+        try:
+            fix = Fix(
+                float(item['t']), float(item['lat']), float(item['lon']),
+                float(item['acc']) if item.get('acc') is not None else None,
+                int(item['delivery_id']) if item.get('delivery_id') else None,
+            )
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        if _valid(fix, now):
+            fixes.append(fix)
+    return fixes, len(items) - len(fixes)
+
+
+def parse_binary(data, now=None):
+    """
+    Разбирает точки в двоичном формате FIX.
+
+    Returns:
+        tuple: Список корректных Fix и число отброшенных точек
+    """
+    if len(data) % FIX.size:
+        raise ParseError(f"Размер тела должен быть кратен {FIX.size} байтам")
+    now = now or time.time()
+    fixes = []
+    for recorded_at, lat, lon, accuracy, delivery_id in FIX.iter_unpack(data):
+        fix = Fix(recorded_at, lat / 1e7, lon / 1e7, accuracy / 10 or None, delivery_id or None)
+        if _valid(fix, now):
+            fixes.append(fix)
+    return fixes, len(data) // FIX.size - len(fixes)
+
+
+class FixesParser(BaseParser):
+    """Парсер DRF для двоичного формата точек."""
+    media_type = MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        # Точки разбирает и проверяет parse_binary() в представлении
+        return stream.read()
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Расстояние в метрах (равнопромежуточная проекция, точна на расстояниях трека)."""
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS * math.hypot(x, y)
+
+
+class Downsampler:
+    """
+    Прореживание точек по последней сохраненной точке курьера.
+
+    Точка сохраняется, если с последней сохраненной прошло не меньше
+    min_interval секунд или курьер сместился на min_distance метров;
+    точки не новее последней сохраненной (повторная отправка) отбрасываются.
+    Состояние хранится в процессе: если пачки курьера попадают в разные
+    процессы, прореживание между пачками слабее, но внутри пачки полное.
+    """
+
+    def __init__(self, min_interval, min_distance, max_couriers=100000):
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        self.max_couriers = max_couriers
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def filter(self, courier_id, fixes):
+        """
+        Args:
+            courier_id: ID курьера
+            fixes: Точки пачки
+
+        Returns:
+            list: Точки для сохранения в порядке времени
+        """
+        kept = []
+        with self._lock:
+            last = self._last.get(courier_id)
+            for fix in sorted(fixes, key=lambda fix: fix.recorded_at):
+                if last is not None:
+                    if fix.recorded_at <= last.recorded_at:
+                        continue
+                    if (
+                        fix.recorded_at - last.recorded_at < self.min_interval
+                        and fix.delivery_id == last.delivery_id
+                        and distance(last.lat, last.lon, fix.lat, fix.lon) < self.min_distance
+                    ):
+                        continue
+                kept.append(fix)
+                last = fix
+            if last is not None:
+                if len(self._last) >= self.max_couriers:
+                    self._last.clear()
+                self._last[courier_id] = last
+        return kept
+
+
+class LocationBuffer:
+    """
+    Буфер точек процесса с пакетной записью.
+
+    Args:
+        flush_size: Запись в потоке запроса, когда набралось столько точек
+        flush_interval: Период записи фоновым потоком в секундах
+        max_size: Больше точек в буфере (база недоступна) - новые отбрасываются
+    """
+
+    def __init__(self, flush_size=5000, flush_interval=1.0, max_size=200000):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    def add(self, courier_id, fixes):
+        """
+        Добавляет точки курьера в буфер.
+
+        Returns:
+            int: Число принятых точек
+        """
+        self._ensure_flusher()
+        rows = [
+            (courier_id, fix.delivery_id, datetime.fromtimestamp(fix.recorded_at, timezone.utc),
+             fix.lat, fix.lon, fix.accuracy)
+            for fix in fixes
+        ]
+        with self._lock:
+            rows = rows[:max(0, self.max_size - len(self._rows))]
+            self._rows.extend(rows)
+            full = len(self._rows) >= self.flush_size
+        if full:
+            self.flush()
+        return len(rows)
+
+    def flush(self):
+        """
+        Записывает накопленные точки.
+
+        Ошибка базы данных записывается в журнал, точки теряются;
+        остальные исключения (ошибки в коде) пробрасываются.
+
+        Returns:
+            int: Число записанных точек
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                write_rows(rows)
+            except DatabaseError:
+                logger.exception("Не удалось записать GPS-точки (%s)", len(rows))
+                LOCATION_FIXES.labels('failed').inc(len(rows))
+                return 0
+            except Exception:
+                LOCATION_FIXES.labels('failed').inc(len(rows))
+                raise
+            LOCATION_FIXES.labels('stored').inc(len(rows))
+            return len(rows)
+
+    def _ensure_flusher(self):
+        # Поток не переживает fork, поэтому запускается в каждом процессе
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._rows = []
+                threading.Thread(target=self._flush_forever, name='delivery-location-flush', daemon=True).start()
+                if self._pid is None:
+                    atexit.register(self.flush)
+                self._pid = os.getpid()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                # Ошибка в коде не должна останавливать поток записи
+                logger.exception("Сбой фоновой записи GPS-точек")
+
+
+def write_rows(rows):
+    """
+    Записывает строки COLUMNS в CourierLocation.
+
+    В PostgreSQL с psycopg 3 - одним COPY, иначе многострочными INSERT.
+    """
+    if connection.vendor == 'postgresql' and is_psycopg3:
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(column) for column in COLUMNS)
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(f'COPY {quote(CourierLocation._meta.db_table)} ({columns}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row(row)
+    else:
+        CourierLocation.objects.bulk_create(
+            [CourierLocation(**dict(zip(COLUMNS, row))) for row in rows], batch_size=1000
+        )
+
+
+_downsampler = None
+_buffer = None
+
+
+def get_downsampler():
+    """Прореживание процесса по настройкам LOCATION_MIN_*."""
+    global _downsampler  # pylint: disable=global-statement
+    if _downsampler is None:
+        _downsampler = Downsampler(settings.LOCATION_MIN_INTERVAL, settings.LOCATION_MIN_DISTANCE)
+    return _downsampler
+
+
+def assigned_fixes(courier_id, fixes):
+    """
+    Отбрасывает точки, привязанные к доставкам другого курьера.
+
+    Args:
+        courier_id: ID курьера
+        fixes: Корректные точки
+
+    Returns:
+        tuple: Точки без доставки или с доставкой курьера и число отброшенных
+    """
+    requested = {fix.delivery_id for fix in fixes if fix.delivery_id is not None}
+    if not requested:
+        return fixes, 0
+    assigned = set(
+        Delivery.objects.filter(pk__in=requested, courier_id=courier_id).values_list('pk', flat=True)
+    )
+    kept = [fix for fix in fixes if fix.delivery_id is None or fix.delivery_id in assigned]
+    return kept, len(fixes) - len(kept)
+
+
+def get_buffer():
+    """Буфер процесса по настройкам LOCATION_FLUSH_*."""
+    global _buffer  # pylint: disable=global-statement
+    if _buffer is None:
+        _buffer = LocationBuffer(settings.LOCATION_FLUSH_SIZE, settings.LOCATION_FLUSH_INTERVAL)
+    return _buffer
+
+
+def ingest(courier_id, fixes, rejected=0):
+    """
+    Прореживает точки курьера и ставит их в очередь записи.
+
+    Args:
+        courier_id: ID курьера
+        fixes: Корректные точки
+        rejected: Число точек, отброшенных при разборе
+
+    Returns:
+        dict: Число полученных, поставленных в очередь, прореженных и отброшенных точек
+    """
+    kept = get_downsampler().filter(courier_id, fixes)
+    queued = get_buffer().add(courier_id, kept)
+    result = {
+        'received': len(fixes) + rejected,
+        'queued': queued,
+        'downsampled': len(fixes) - len(kept),
+        # Переполненный буфер отбрасывает точки так же, как некорректные
+        'rejected': rejected + len(kept) - queued,
+    }
+    LOCATION_FIXES.labels('downsampled').inc(result['downsampled'])
+    LOCATION_FIXES.labels('rejected').inc(result['rejected'])
+    return result
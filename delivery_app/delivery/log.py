@@ -0,0 +1,250 @@
+"""
+Структурированное неблокирующее логирование.
+Записи кладутся в очередь и форматируются в JSON фоновым потоком,
+поэтому вызов логгера в обработчике запроса стоит микросекунды.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+
+# Текущий HTTP-запрос и его ID для корреляции записей
+_request_context = ContextVar('delivery_log_request', default=(None, None))
+
+# Максимальная длина дампа данных запроса в записи лога (если не задан LOG_PAYLOAD_LIMIT)
+DEFAULT_PAYLOAD_LIMIT = 2048
+
+# Атрибуты LogRecord, которые не считаются дополнительными полями (extra)
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'request_id', 'user_id',
+}
+
+
+def new_request_id(header_value=None):
+    """
+    Возвращает ID запроса: из заголовка X-Request-ID или новый.
+
+    Args:
+        header_value: Значение заголовка X-Request-ID
+
+    Returns:
+        str: ID запроса
+    """
+    if header_value and len(header_value) <= 64 and header_value.isprintable():
+        return header_value
+    return uuid.uuid4().hex
+
+
+def set_request_context(request, request_id):
+    """Привязывает записи лога текущего контекста к запросу; возвращает токен."""
+    return _request_context.set((request, request_id))
+
+
+def reset_request_context(token):
+    """Отменяет set_request_context()."""
+    _request_context.reset(token)
+
+
+def current_user_id():
+    """ID пользователя текущего запроса или None (вне запроса и для анонимных)."""
+    request, _ = _request_context.get()
+    return _user_id(request) if request is not None else None
+
+
+def _user_id(request):
+    # Не вычисляем ленивого пользователя, чтобы запись лога не обращалась к базе;
+    # DRF подставляет настоящего пользователя после аутентификации
+    user = request.__dict__.get('user')
+    if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+        return None
+    return getattr(user, 'pk', None)
+
+
+class Payload:
+    """
+    Ленивое ограниченное представление данных для лога.
+
+    Сериализуется только при форматировании записи (в фоновом потоке)
+    и обрезается до limit байт.
+    """
+
+    __slots__ = ('data', 'limit')
+
+    def __init__(self, data, limit=DEFAULT_PAYLOAD_LIMIT):
+        self.data = data
+        self.limit = limit
+
+    def __str__(self):
+        data = self.data
+        if hasattr(data, 'dict') and callable(data.dict):
+            # QueryDict формы
+            data = data.dict()
+        try:
+            dumped = orjson.dumps(data, default=str)
+        except TypeError:
+            dumped = repr(data).encode()
+        if len(dumped) <= self.limit:
+            return dumped.decode()
+        return f"{dumped[:self.limit].decode(errors='ignore')}...(+{len(dumped) - self.limit} байт)"
+
+
+def payload(data, limit=None):
+    """
+    Оборачивает данные запроса для лога с ограничением размера.
+
+    Args:
+        data: Данные (dict, QueryDict, list)
+        limit: Максимум байт; по умолчанию settings.LOG_PAYLOAD_LIMIT
+
+    Returns:
+        Payload: Объект, сериализуемый только при записи
+    """
+    if limit is None:
+        limit = getattr(settings, 'LOG_PAYLOAD_LIMIT', DEFAULT_PAYLOAD_LIMIT)
+    return Payload(data, limit)
+
+
+class RequestContextFilter(logging.Filter):
+    """Добавляет к записи request_id и user_id текущего запроса."""
+
+    def filter(self, record):
+        request, request_id = _request_context.get()
+        if request is None:
+            # django.request пишет ошибки уже после выхода из middleware,
+            # но передает сам запрос в extra
+            request = getattr(record, 'request', None)
+            request_id = getattr(request, 'request_id', None)
+        record.request_id = request_id
+        record.user_id = _user_id(request) if request is not None else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю записей ниже WARNING для выбранных логгеров.
+
+    Args:
+        rates: Имя логгера -> доля записей (0..1); правило действует
+            и на дочерние логгеры
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = dict(rates or {})
+
+    def get_rate(self, name):
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.get_rate(record.name)
+        return rate is None or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON."""
+
+    def format(self, record):
+        document = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'user_id': getattr(record, 'user_id', None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                document[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            document['exc'] = record.exc_text
+        return orjson.dumps(document, default=str).decode()
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Обработчик, передающий записи фоновому потоку через очередь.
+
+    Сообщение форматируется в фоновом потоке; при переполнении очереди
+    записи отбрасываются, а не блокируют запрос (число отброшенных
+    записей пишется в лог при следующей успешной записи).
+
+    Args:
+        queue_size: Размер очереди
+        stream: Поток вывода (по умолчанию stdout)
+    """
+
+    def __init__(self, queue_size=10000, stream=None):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._listener_lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def setFormatter(self, fmt):
+        # Форматирование выполняет целевой обработчик в фоновом потоке
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        # После fork (воркеры сервера) поток нужно запустить заново
+        if self._pid == os.getpid():
+            return
+        with self._listener_lock:
+            if self._pid != os.getpid():
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        """
+        Готовит запись к передаче в очередь без форматирования сообщения.
+
+        Аргументы сообщения остаются ссылками и форматируются в фоновом
+        потоке; трассировка исключения форматируется сразу, пока кадры живы.
+        Запись не копируется: кроме этого обработчика ее никто не получает.
+        """
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': "Очередь лога переполнена, отброшено записей: %s", 'args': (dropped,),
+                }))
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        """Дописывает оставшиеся записи и останавливает фоновый поток."""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
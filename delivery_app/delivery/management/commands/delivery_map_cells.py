@@ -0,0 +1,26 @@
+"""
+Пересчет ячеек карты доставок.
+
+Нужен после первой установки, изменения MAP_MAX_LEVEL и для исправления
+расхождений счетчиков (например, после изменения доставок в обход модели).
+
+Пример:
+    python manage.py delivery_map_cells
+"""
+
+from django.core.management.base import BaseCommand
+
+from delivery import maps
+
+
+class Command(BaseCommand):
+    """Пересчет MapCell по доставкам без курьера."""
+
+    help = "Пересчет ячеек карты доставок по текущим доставкам без курьера"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="доставок в одной выборке")
+
+    def handle(self, *args, **options):
+        cells = maps.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(f"Непустых ячеек: {cells}")
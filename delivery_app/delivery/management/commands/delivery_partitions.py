@@ -0,0 +1,62 @@
+"""
+Обслуживание секций таблицы доставок.
+
+Примеры:
+    python manage.py delivery_partitions list
+    python manage.py delivery_partitions ensure --months-ahead 3
+    python manage.py delivery_partitions archive --older-than 12 --mode freeze
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from delivery import partitions
+
+
+class Command(BaseCommand):
+    """Создание будущих секций, список и архивация старых секций доставок."""
+
+    help = "Создание будущих секций, список и архивация старых секций таблицы доставок"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        subcommands = parser.add_subparsers(dest='action', required=True)
+
+        subcommands.add_parser('list', help="список секций с размером")
+
+        ensure = subcommands.add_parser('ensure', help="создать секции текущего и будущих месяцев")
+        ensure.add_argument(
+            '--months-ahead', type=int, default=settings.DELIVERY_PARTITION_MONTHS_AHEAD
+        )
+
+        archive = subcommands.add_parser('archive', help="архивировать старые секции")
+        archive.add_argument(
+            '--older-than', type=int, default=settings.DELIVERY_ARCHIVE_AFTER_MONTHS,
+            help="возраст секции в месяцах"
+        )
+        archive.add_argument('--mode', choices=('freeze', 'detach'), default='freeze')
+        archive.add_argument('--tablespace', help="табличное пространство для режима freeze")
+        archive.add_argument('--dry-run', action='store_true', help="только показать секции")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not partitions.is_partitioned(using):
+            raise CommandError("Таблица доставок не секционирована (нужен PostgreSQL и миграция 0007)")
+
+        action = options['action']
+        if action == 'list':
+            for item in partitions.list_partitions(using):
+                self.stdout.write(f"{item['name']:40} {item['rows']:>12} строк {item['size'] / 2**20:>10.1f} МБ")
+        elif action == 'ensure':
+            created = partitions.ensure_partitions(options['months_ahead'], using=using)
+            self.stdout.write(f"Создано секций: {len(created)} {' '.join(created)}")
+        else:
+            archived = partitions.archive_partitions(
+                options['older_than'],
+                mode=options['mode'],
+                tablespace=options['tablespace'],
+                dry_run=options['dry_run'],
+                using=using,
+            )
+            verb = "Будут архивированы" if options['dry_run'] else "Архивировано"
+            self.stdout.write(f"{verb} ({options['mode']}): {len(archived)} {' '.join(archived)}")
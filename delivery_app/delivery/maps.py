@@ -0,0 +1,255 @@
+"""
+Кластеры доставок без курьера на карте.
+
+Доставка есть на карте, если у нее нет курьера и заполнены все
+координаты (как в DeliveryViewSet.coordinates); кластеризуется точка
+отправления. Для каждого уровня 0..MAP_MAX_LEVEL точка попадает в ячейку -
+тайл Web Mercator, и MapCell хранит число доставок и суммы координат
+ячейки. Изменения доставок (сигналы модели, пакетное создание, действия
+админки) превращаются в приращения ячеек, которые копятся до фиксации
+транзакции и пишутся одним INSERT ... ON CONFLICT на пачку. Кластеры
+окна карты - выборка ячеек одного уровня по индексу (level, x, y),
+без обхода доставок.
+
+Приращения, потерянные при ошибке записи или при изменении доставок
+в обход модели, исправляет пересчет: python manage.py delivery_map_cells.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from .events import CommitBuffer
+from .models import Delivery, MapCell
+from .push import parse_bbox
+from .queries import has_coordinates
+from .tracks import parse_zoom
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+# Поля доставки, от которых зависит ее ячейка
+FIELDS = ('courier_id', 'source_lat', 'source_lon', 'dest_lat', 'dest_lon')
+
+# Широта края карты Web Mercator
+MAX_LAT = 85.05112878
+
+# Ячеек в одном INSERT
+FLUSH_BATCH_SIZE = 1000
+
+
+def point(values):
+    """
+    Точка доставки на карте.
+
+    Args:
+        values: Поле из FIELDS -> значение
+
+    Returns:
+        tuple: (lat, lon) или None, если доставки нет на карте
+    """
+    if values['courier_id'] is not None or not has_coordinates(values):
+        return None
+    return values['source_lat'], values['source_lon']
+
+
+def tile(lat, lon, level):
+    """
+    Ячейки точек на уровне level.
+
+    Args:
+        lat: Широты
+        lon: Долготы
+        level: Уровень ячеек
+
+    Returns:
+        tuple: Массивы x и y
+    """
+    n = 2 ** level
+    lat = np.radians(np.clip(np.asarray(lat, dtype=float), -MAX_LAT, MAX_LAT))
+    x = (np.asarray(lon, dtype=float) + 180) / 360 * n
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * n
+    return (
+        np.clip(np.floor(x), 0, n - 1).astype(np.int64),
+        np.clip(np.floor(y), 0, n - 1).astype(np.int64),
+    )
+
+
+def aggregate(lat, lon, weight):
+    """
+    Суммы по ячейкам всех уровней.
+
+    Args:
+        lat: Широты
+        lon: Долготы
+        weight: Вес точки: 1 - добавлена, -1 - убрана
+
+    Returns:
+        list: Кортежи (level, x, y, count, lat_sum, lon_sum) по возрастанию ячейки
+    """
+    lat = np.asarray(lat, dtype=float)
+    lon = np.asarray(lon, dtype=float)
+    weight = np.asarray(weight, dtype=float)
+    rows = []
+    if not len(lat):
+        return rows
+    for level in range(settings.MAP_MAX_LEVEL + 1):
+        x, y = tile(lat, lon, level)
+        cells, inverse = np.unique(np.column_stack((x, y)), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        sums = [
+            np.bincount(inverse, weights=values, minlength=len(cells)).tolist()
+            for values in (weight, weight * lat, weight * lon)
+        ]
+        for (cell_x, cell_y), count, lat_sum, lon_sum in zip(cells.tolist(), *sums):
+            # Перемещение внутри ячейки меняет только суммы координат
+            if count or lat_sum or lon_sum:
+                rows.append((level, cell_x, cell_y, round(count), lat_sum, lon_sum))
+    return rows
+
+
+def write_deltas(items):
+    """
+    Добавляет приращения точек к MapCell.
+
+    Args:
+        items: Кортежи (lat, lon, weight)
+    """
+    rows = aggregate(*zip(*items))
+    connection = transaction.get_connection()
+    quote = connection.ops.quote_name
+    table = quote(MapCell._meta.db_table)
+    with transaction.atomic():
+        for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+            batch = rows[start:start + FLUSH_BATCH_SIZE]
+            with connection.cursor() as cursor:
+                # Ячейки в одном порядке во всех транзакциях - без взаимных блокировок
+                cursor.execute(
+                    f"INSERT INTO {table} ({quote('level')}, x, y, {quote('count')}, lat_sum, lon_sum) "
+                    f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(batch))} "
+                    f"ON CONFLICT ({quote('level')}, x, y) DO UPDATE SET "
+                    f"{quote('count')} = {table}.{quote('count')} + EXCLUDED.{quote('count')}, "
+                    f"lat_sum = {table}.lat_sum + EXCLUDED.lat_sum, "
+                    f"lon_sum = {table}.lon_sum + EXCLUDED.lon_sum",
+                    [value for row in batch for value in row],
+                )
+
+
+_deltas = CommitBuffer('delivery_map_buffer', write_deltas, 'ячейки карты')
+
+
+def record_moves(moves):
+    """
+    Учитывает перемещения доставок на карте после фиксации текущей транзакции.
+
+    Args:
+        moves: Пары точек (до, после); None - доставки нет на карте
+    """
+    items = []
+    for old, new in moves:
+        if old == new:
+            continue
+        if old is not None:
+            items.append((*old, -1))
+        if new is not None:
+            items.append((*new, 1))
+    _deltas.add(items)
+
+
+def rebuild(chunk_size=10000):
+    """
+    Пересчитывает MapCell по доставкам.
+
+    Изменения доставок, зафиксированные во время пересчета, могут
+    учесться дважды или потеряться: пересчет запускается при малой
+    нагрузке, повторный запуск исправляет расхождение.
+
+    Returns:
+        int: Число непустых ячеек
+    """
+    points = [
+        point(values) for values in
+        Delivery.objects.filter(courier__isnull=True).values(*FIELDS).iterator(chunk_size=chunk_size)
+    ]
+    points = [item for item in points if item is not None]
+    lat, lon = zip(*points) if points else ((), ())
+    rows = aggregate(lat, lon, np.ones(len(lat)))
+    with transaction.atomic():
+        MapCell.objects.all().delete()
+        MapCell.objects.bulk_create([
+            MapCell(level=level, x=x, y=y, count=count, lat_sum=lat_sum, lon_sum=lon_sum)
+            for level, x, y, count, lat_sum, lon_sum in rows
+        ], batch_size=FLUSH_BATCH_SIZE)
+    return len(rows)
+
+
+def parse_window(params):
+    """
+    Окно карты из параметров запроса bbox и zoom.
+
+    Returns:
+        tuple: (bbox, zoom) или None, если кластеры не запрошены
+
+    Raises:
+        ValidationError: Указан только один параметр или значение некорректно
+    """
+    bbox, zoom = params.get('bbox'), params.get('zoom')
+    if bbox is None and zoom is None:
+        return None
+    if bbox is None or zoom in (None, ''):
+        raise ValidationError({'zoom': "Кластеры запрашиваются параметрами bbox и zoom вместе"})
+    try:
+        zoom = parse_zoom(zoom)
+    except ValueError:
+        raise ValidationError({'zoom': "Некорректный масштаб zoom"})
+    return parse_bbox(bbox), zoom
+
+
+def cells(bbox, zoom):
+    """
+    Непустые ячейки окна карты для масштаба zoom.
+
+    Ячейка кластера занимает 256 / 2**MAP_CLUSTER_CELL_SHIFT пикселей
+    экрана. Окно через антимеридиан задается min_lon > max_lon.
+
+    Args:
+        bbox: (min_lon, min_lat, max_lon, max_lat)
+        zoom: Масштаб карты
+
+    Returns:
+        QuerySet: Кортежи (count, lat_sum, lon_sum)
+
+    Raises:
+        ValidationError: В окне больше MAP_MAX_CELLS ячеек
+    """
+    level = min(settings.MAP_MAX_LEVEL, zoom + settings.MAP_CLUSTER_CELL_SHIFT)
+    min_lon, min_lat, max_lon, max_lat = bbox
+    (min_x, max_x), y = tile([min_lat, max_lat], [min_lon, max_lon], level)
+    min_y, max_y = sorted(y.tolist())
+    min_x, max_x = int(min_x), int(max_x)
+    if min_x <= max_x:
+        width = max_x - min_x + 1
+        x_filter = Q(x__range=(min_x, max_x))
+    else:
+        width = 2 ** level - min_x + max_x + 1
+        x_filter = Q(x__gte=min_x) | Q(x__lte=max_x)
+    if width * (max_y - min_y + 1) > settings.MAP_MAX_CELLS:
+        raise ValidationError({'bbox': "Слишком большое окно карты для масштаба zoom"})
+    return MapCell.objects.filter(
+        x_filter, level=level, y__range=(min_y, max_y), count__gt=0
+    ).values_list('count', 'lat_sum', 'lon_sum')
+
+
+def clusters(rows):
+    """
+    Кластеры из строк cells().
+
+    Returns:
+        list: Словари с центром кластера (lat, lon) и числом доставок count
+    """
+    return [
+        {'lat': round(lat_sum / count, 6), 'lon': round(lon_sum / count, 6), 'count': count}
+        for count, lat_sum, lon_sum in rows
+    ]
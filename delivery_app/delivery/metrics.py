@@ -0,0 +1,180 @@
+"""
+Метрики производительности эндпоинтов в формате Prometheus.
+Собирает время ответа, число и время SQL-запросов, время сериализации
+и размер ответа по маршрутам URLconf.
+"""
+
+import hmac
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+REQUEST_LATENCY = Histogram(
+    'delivery_http_request_duration_seconds', 'Время обработки запроса',
+    ['method', 'route'], buckets=LATENCY_BUCKETS
+)
+REQUESTS = Counter(
+    'delivery_http_requests', 'Число запросов',
+    ['method', 'route', 'status']
+)
+DB_QUERIES = Histogram(
+    'delivery_http_request_db_queries', 'Число SQL-запросов на HTTP-запрос',
+    ['method', 'route'], buckets=QUERY_COUNT_BUCKETS
+)
+DB_TIME = Histogram(
+    'delivery_http_request_db_duration_seconds', 'Время SQL-запросов на HTTP-запрос',
+    ['method', 'route'], buckets=LATENCY_BUCKETS
+)
+SERIALIZER_TIME = Histogram(
+    'delivery_http_request_serializer_duration_seconds', 'Время сериализации на HTTP-запрос',
+    ['method', 'route'], buckets=LATENCY_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    'delivery_http_response_size_bytes', 'Размер тела ответа',
+    ['method', 'route'], buckets=SIZE_BUCKETS
+)
+LOCATION_FIXES = Counter(
+    'delivery_location_fixes', 'GPS-точки курьеров по результату приема',
+    ['result']
+)
+
+# Счетчики текущего запроса; объект изменяется на месте, поэтому
+# запросы из sync_to_async тоже учитываются
+_request_stats = ContextVar('delivery_request_stats', default=None)
+
+
+class RequestStats:
+    """Счетчики одного HTTP-запроса."""
+
+    __slots__ = ('queries', 'db_time', 'serializer_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """Обертка выполнения SQL, считающая запросы и их время."""
+    stats = _request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += perf_counter() - start
+
+
+def start_request():
+    """
+    Начинает сбор счетчиков запроса в текущем контексте.
+
+    Returns:
+        tuple: (RequestStats, токен для finish_request)
+    """
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def finish_request(token):
+    """Завершает сбор счетчиков, начатый start_request()."""
+    _request_stats.reset(token)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """Подключает query_wrapper к новому соединению с базой."""
+    # С пулом соединений сигнал приходит на каждое получение соединения
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
+
+
+@contextmanager
+def serializer_timer():
+    """Добавляет время выполнения блока ко времени сериализации запроса."""
+    stats = _request_stats.get()
+    if stats is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_time += perf_counter() - start
+
+
+def get_route(request):
+    """
+    Возвращает шаблон маршрута запроса для метки метрик.
+
+    Используется шаблон из URLconf, а не путь, чтобы число меток
+    не зависело от ID в адресах.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.route or match.view_name
+
+
+def observe_request(request, response, stats, duration):
+    """Записывает метрики завершенного запроса."""
+    method = request.method
+    route = get_route(request)
+    REQUEST_LATENCY.labels(method, route).observe(duration)
+    REQUESTS.labels(method, route, str(response.status_code)).inc()
+    DB_QUERIES.labels(method, route).observe(stats.queries)
+    DB_TIME.labels(method, route).observe(stats.db_time)
+    SERIALIZER_TIME.labels(method, route).observe(stats.serializer_time)
+    if not response.streaming:
+        RESPONSE_SIZE.labels(method, route).observe(len(response.content))
+
+
+def _authorized(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_staff:
+        return True
+    metrics_token = getattr(settings, 'METRICS_TOKEN', None)
+    if not metrics_token:
+        return False
+    # Сравнение за постоянное время не раскрывает токен по времени ответа
+    return hmac.compare_digest(
+        request.META.get('HTTP_AUTHORIZATION', '').encode(), f'Bearer {metrics_token}'.encode()
+    )
+
+
+def metrics_view(request):
+    """
+    Отдает метрики в текстовом формате Prometheus.
+
+    Если задан PROMETHEUS_MULTIPROC_DIR, метрики собираются со всех
+    воркеров сервера. Доступ - по заголовку Authorization: Bearer
+    <METRICS_TOKEN> или сотрудникам (is_staff) с сессией admin; без
+    METRICS_TOKEN остальные запросы получают 403.
+
+    Args:
+        request: HTTP запрос
+
+    Returns:
+        HttpResponse: Метрики
+    """
+    if not _authorized(request):
+        return HttpResponseForbidden()
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,542 @@
+"""
+Middleware приложения доставки.
+Включает сбор метрик запросов, ID запросов для корреляции логов, сброс нагрузки
+при перегрузке, сжатие ответов с согласованием алгоритма
+по заголовку Accept-Encoding, выбор базы данных (основная или реплика)
+и профилирование запросов по требованию.
+"""
+
+import zlib
+from time import monotonic, perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from . import concurrency, log, metrics
+from .authentication import CachedJWTAuthentication
+from .db_router import is_pinned, is_replica_safe, pin_to_primary, use_replica
+from .profiling import RequestProfile, sample_trigger
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli необязателен
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard необязателен
+    zstandard = None
+
+
+class _GzipCompressor:
+    """Потоковый компрессор gzip."""
+
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    """Потоковый компрессор brotli."""
+
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._obj.process(data)
+
+    def flush(self):
+        return self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+class _ZstdCompressor:
+    """Потоковый компрессор zstd."""
+
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+COMPRESSORS = {'gzip': _GzipCompressor}
+if brotli is not None:
+    COMPRESSORS['br'] = _BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _ZstdCompressor
+
+
+def parse_accept_encoding(header):
+    """
+    Разбирает заголовок Accept-Encoding.
+
+    Args:
+        header: Значение заголовка
+
+    Returns:
+        dict: Кодировка -> вес (q)
+    """
+    result = {}
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        result[coding] = q
+    return result
+
+
+def choose_encoding(header, preferred):
+    """
+    Выбирает алгоритм сжатия, поддерживаемый и клиентом, и сервером.
+
+    При равных весах побеждает алгоритм, стоящий раньше в списке сервера.
+
+    Args:
+        header: Значение заголовка Accept-Encoding
+        preferred: Алгоритмы сервера в порядке предпочтения
+
+    Returns:
+        str | None: Выбранный алгоритм или None
+    """
+    if not header:
+        return None
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in preferred:
+        if coding not in COMPRESSORS:
+            continue
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Сжимает ответы алгоритмом zstd, brotli или gzip.
+
+    Алгоритм выбирается по заголовку Accept-Encoding с учетом порядка
+    COMPRESSION_ENCODINGS. Короткие ответы (меньше COMPRESSION_MIN_SIZE байт)
+    и уже сжатые типы содержимого не обрабатываются. Потоковые ответы
+    сжимаются по частям.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.encodings = getattr(settings, 'COMPRESSION_ENCODINGS', ['zstd', 'br', 'gzip'])
+        self.levels = getattr(settings, 'COMPRESSION_LEVELS', {'zstd': 3, 'br': 4, 'gzip': 6})
+        self.content_types = tuple(getattr(
+            settings, 'COMPRESSION_CONTENT_TYPES',
+            ['application/json', 'text/', 'application/javascript', 'application/xml']
+        ))
+
+    def process_response(self, request, response):
+        """
+        Сжимает ответ, если клиент это поддерживает.
+
+        Args:
+            request: HTTP запрос
+            response: HTTP ответ
+
+        Returns:
+            HttpResponse: Исходный или сжатый ответ
+        """
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        if response.has_header('Content-Encoding'):
+            return response
+
+        if not response.get('Content-Type', '').startswith(self.content_types):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.encodings)
+        if encoding is None:
+            return response
+
+        compressor_class = COMPRESSORS[encoding]
+        level = self.levels.get(encoding)
+
+        if response.streaming:
+            if response.is_async:
+                original_iterator = response.streaming_content
+
+                async def compress_async():
+                    compressor = compressor_class(level)
+                    async for chunk in original_iterator:
+                        data = compressor.compress(chunk) + compressor.flush()
+                        if data:
+                            yield data
+                    yield compressor.finish()
+
+                response.streaming_content = compress_async()
+            else:
+                original_iterator = response.streaming_content
+
+                def compress_sync():
+                    compressor = compressor_class(level)
+                    for chunk in original_iterator:
+                        data = compressor.compress(chunk) + compressor.flush()
+                        if data:
+                            yield data
+                    yield compressor.finish()
+
+                response.streaming_content = compress_sync()
+            del response.headers['Content-Length']
+        else:
+            compressor = compressor_class(level)
+            compressed_content = compressor.compress(response.content) + compressor.finish()
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # Сильный ETag становится слабым, так как тело ответа изменилось.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+
+        return response
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    Разрешает чтение с реплик для помеченных представлений.
+
+    Пользователь определяется по JWT без обращения к базе. После успешного
+    изменяющего запроса пользователь закрепляется за основной базой
+    на REPLICA_PIN_SECONDS, чтобы читать свои же изменения.
+    """
+
+    authenticator = JWTAuthentication()
+
+    def get_user_id(self, request):
+        """
+        Возвращает ID пользователя из заголовка Authorization.
+
+        Args:
+            request: HTTP запрос
+
+        Returns:
+            ID пользователя или None, если токена нет или он недействителен
+        """
+        header = self.authenticator.get_header(request)
+        raw_token = self.authenticator.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        try:
+            token = self.authenticator.get_validated_token(raw_token)
+        except (InvalidToken, TokenError):
+            return None
+        return token.get(jwt_settings.USER_ID_CLAIM)
+
+    def process_request(self, request):
+        use_replica(False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'DATABASE_REPLICAS', ()):
+            return None
+        if not is_replica_safe(view_func, request.method):
+            return None
+        user_id = self.get_user_id(request)
+        use_replica(user_id is None or not is_pinned(user_id))
+        return None
+
+    def process_response(self, request, response):
+        use_replica(False)
+        if (
+            getattr(settings, 'DATABASE_REPLICAS', ())
+            and request.method not in ('GET', 'HEAD', 'OPTIONS')
+            and response.status_code < 400
+        ):
+            user_id = self.get_user_id(request)
+            if user_id is not None:
+                pin_to_primary(user_id)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики каждого запроса.
+
+    Должен стоять первым в MIDDLEWARE, чтобы учитывать время всех
+    остальных middleware и размер уже сжатого ответа.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token = metrics.start_request()
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        metrics.observe_request(request, response, stats, perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token = metrics.start_request()
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish_request(token)
+        metrics.observe_request(request, response, stats, perf_counter() - start)
+        return response
+
+
+class RequestContextMiddleware:
+    """
+    Присваивает запросу ID и привязывает к нему записи лога.
+
+    ID берется из заголовка X-Request-ID (от балансировщика или клиента)
+    или генерируется и возвращается в том же заголовке ответа.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = log.new_request_id(request.headers.get('X-Request-ID'))
+        token = log.set_request_context(request, request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            log.reset_request_context(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = log.new_request_id(request.headers.get('X-Request-ID'))
+        token = log.set_request_context(request, request.request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            log.reset_request_context(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Сбрасывает запросы низкого приоритета при перегрузке (delivery.concurrency).
+
+    Опрос списков, поиск и выгрузки сверх адаптивного лимита процесса
+    сразу получают 503 с Retry-After, изменения выполняются всегда.
+    При LOAD_SHEDDING_ENABLED=False middleware не подключается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    retry_after = 2
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'LOAD_SHEDDING_ENABLED', True):
+            raise MiddlewareNotUsed()
+        self.limiter = concurrency.AdaptiveLimiter(
+            settings.LOAD_SHEDDING_TARGETS,
+            max_limit=settings.LOAD_SHEDDING_MAX_LOW,
+            min_limit=settings.LOAD_SHEDDING_MIN_LOW,
+            max_queue=settings.LOAD_SHEDDING_MAX_QUEUE,
+        )
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def admit(self, request):
+        """
+        Классифицирует запрос и решает, принять ли его.
+
+        Returns:
+            tuple: Класс запроса, время в очереди и признак приема
+        """
+        request_class = concurrency.request_class(request)
+        waited = concurrency.queue_time(request)
+        if self.limiter.acquire(request_class, waited):
+            return request_class, waited, True
+        if waited:
+            # Очередь перед воркером - тоже признак перегрузки
+            self.limiter.observe(request_class, monotonic(), 0.0, waited)
+        return request_class, waited, False
+
+    def overloaded(self):
+        """Быстрый ответ 503 на сброшенный запрос."""
+        response = JsonResponse(
+            {'detail': "Сервер перегружен, повторите запрос позже"},
+            status=503,
+            json_dumps_params={'ensure_ascii': False},
+        )
+        response['Retry-After'] = str(self.retry_after)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_class, waited, admitted = self.admit(request)
+        if not admitted:
+            return self.overloaded()
+        started = monotonic()
+        try:
+            return self.get_response(request)
+        finally:
+            self.limiter.release(request_class)
+            self.limiter.observe(request_class, started, monotonic() - started, waited)
+
+    async def __acall__(self, request):
+        request_class, waited, admitted = self.admit(request)
+        if not admitted:
+            return self.overloaded()
+        started = monotonic()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.limiter.release(request_class)
+            self.limiter.observe(request_class, started, monotonic() - started, waited)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует отдельные запросы и сохраняет отчеты в ProfileReport.
+
+    Запрос профилируется, если сотрудник (is_staff) передал заголовок
+    X-Profile: 1 или параметр _profile=1, либо если запрос попал в выборку
+    PROFILING_SAMPLE_RATES для своего маршрута. ID отчета возвращается
+    в заголовке X-Profile-Report. При PROFILING_ENABLED=False middleware
+    не подключается.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    authenticator = CachedJWTAuthentication()
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.sample_rates = getattr(settings, 'PROFILING_SAMPLE_RATES', {})
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def get_trigger(self, request):
+        """Возвращает причину профилирования запроса или None."""
+        if request.headers.get('X-Profile') == '1':
+            return 'header'
+        if request.GET.get('_profile') == '1':
+            return 'query'
+        if self.sample_rates:
+            return sample_trigger(request, self.sample_rates)
+        return None
+
+    def get_user(self, request):
+        """Возвращает пользователя из JWT (через кэш) или сессии."""
+        try:
+            result = self.authenticator.authenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            result = None
+        if result is not None:
+            return result[0]
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user
+        return None
+
+    def can_profile(self, trigger, user):
+        """Запросы по заголовку и параметру профилируются только для сотрудников."""
+        return trigger == 'sample' or (user is not None and user.is_staff)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        user = self.get_user(request)
+        if not self.can_profile(trigger, user):
+            return self.get_response(request)
+
+        profile = RequestProfile(trigger)
+        profile.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+        report = profile.save(request, response, user)
+        response['X-Profile-Report'] = str(report.pk)
+        return response
+
+    async def __acall__(self, request):
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+        user = await sync_to_async(self.get_user)(request)
+        if not self.can_profile(trigger, user):
+            return await self.get_response(request)
+
+        profile = RequestProfile(trigger, async_mode='enabled')
+        profile.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.stop()
+        report = await sync_to_async(profile.save)(request, response, user)
+        response['X-Profile-Report'] = str(report.pk)
+        return response
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0005_delivery_dest_lat_delivery_dest_lon_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('route', models.CharField(db_index=True, max_length=255)),
+                ('trigger', models.CharField(choices=[('header', 'Заголовок X-Profile'), ('query', 'Параметр _profile'), ('sample', 'Выборка маршрута')], max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField()),
+                ('query_count', models.PositiveIntegerField()),
+                ('sql_time_ms', models.FloatField()),
+                ('slow_queries', models.JSONField(default=list)),
+                ('text_report', models.TextField()),
+                ('html_report', models.TextField()),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Profile Report',
+                'verbose_name_plural': 'Profile Reports',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
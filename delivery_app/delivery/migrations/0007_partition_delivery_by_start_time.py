@@ -0,0 +1,136 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:51
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+TABLE = 'delivery_delivery'
+# Секции создаются на столько месяцев вперед; дальше их создает
+# команда delivery_partitions ensure (и post_migrate)
+MONTHS_AHEAD = 3
+
+
+def _next_month(month):
+    return month.replace(year=month.year + month.month // 12, month=month.month % 12 + 1)
+
+
+def _table_ddl(cursor, table):
+    """Определения индексов (кроме первичного ключа) и внешних ключей таблицы."""
+    cursor.execute(
+        "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary",
+        [table],
+    )
+    # Для секционированной таблицы определение содержит ON ONLY
+    indexes = [row[0].replace(' ON ONLY ', ' ON ') for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE contype = 'f' AND conrelid = %s::regclass",
+        [table],
+    )
+    return indexes, cursor.fetchall()
+
+
+def _restore_ddl(cursor, indexes, foreign_keys):
+    for statement in indexes:
+        cursor.execute(statement)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+
+
+def partition_deliveries(apps, schema_editor):
+    """
+    Переводит delivery_delivery в таблицу, секционированную по месяцам start_time.
+
+    Данные копируются в новую таблицу в той же транзакции; на большой
+    таблице миграцию следует выполнять в окно обслуживания.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        # Внешние ключи на секционированную таблицу требуют уникальности (id, start_time)
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = %s::regclass",
+            [TABLE],
+        )
+        for table, name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+
+        indexes, foreign_keys = _table_ddl(cursor, TABLE)
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy")
+        if sequence:
+            cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {TABLE}_legacy_id_seq")
+
+        cursor.execute(
+            f"CREATE TABLE {TABLE} (LIKE {TABLE}_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            f"PARTITION BY RANGE (start_time)"
+        )
+        cursor.execute(f"CREATE SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+
+        cursor.execute(f"SELECT min(start_time) FROM {TABLE}_legacy")
+        now = datetime.now(timezone.utc)
+        first = cursor.fetchone()[0] or now
+        month = first.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        for _ in range(MONTHS_AHEAD):
+            last = _next_month(last)
+        while month <= last:
+            following = _next_month(month)
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_y{month.year:04d}m{month.month:02d} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM (%s) TO (%s)",
+                [month, following],
+            )
+            month = following
+        cursor.execute(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_legacy")
+        cursor.execute(
+            f"SELECT setval('{TABLE}_id_seq', COALESCE(max(id), 1), max(id) IS NOT NULL) FROM {TABLE}"
+        )
+        cursor.execute(f"DROP TABLE {TABLE}_legacy")
+
+        # Ключ секционирования обязан входить в первичный ключ
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, start_time)")
+        _restore_ddl(cursor, indexes, foreign_keys)
+
+
+def unpartition_deliveries(apps, schema_editor):
+    """Возвращает обычную таблицу delivery_delivery со всеми строками секций."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _table_ddl(cursor, TABLE)
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned")
+        cursor.execute(f"ALTER SEQUENCE {TABLE}_id_seq RENAME TO {TABLE}_partitioned_id_seq")
+
+        cursor.execute(f"CREATE TABLE {TABLE} (LIKE {TABLE}_partitioned INCLUDING CONSTRAINTS)")
+        cursor.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+        cursor.execute(f"INSERT INTO {TABLE} SELECT * FROM {TABLE}_partitioned")
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(max(id), 1), max(id) IS NOT NULL) "
+            f"FROM {TABLE}"
+        )
+        # Вместе с родительской таблицей удаляются секции и ее последовательность
+        cursor.execute(f"DROP TABLE {TABLE}_partitioned")
+
+        cursor.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (id)")
+        _restore_ddl(cursor, indexes, foreign_keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0006_profilereport'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='delivery',
+            name='services',
+            field=models.ManyToManyField(db_constraint=False, to='delivery.service'),
+        ),
+        migrations.RunPython(partition_deliveries, unpartition_deliveries),
+    ]
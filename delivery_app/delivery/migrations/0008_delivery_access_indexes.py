@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+from delivery.partitions import AddPartitionedIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не выполняется в транзакции
+    atomic = False
+
+    dependencies = [
+        ('delivery', '0007_partition_delivery_by_start_time'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddPartitionedIndexConcurrently(
+            model_name='delivery',
+            index=models.Index(condition=models.Q(('courier__isnull', True)), fields=['status', 'distance'], name='delivery_available_dist_idx'),
+        ),
+        AddPartitionedIndexConcurrently(
+            model_name='delivery',
+            index=models.Index(condition=models.Q(('courier__isnull', True)), fields=['status', 'start_time'], name='delivery_available_start_idx'),
+        ),
+        AddPartitionedIndexConcurrently(
+            model_name='delivery',
+            index=models.Index(fields=['courier', 'status'], name='delivery_courier_status_idx'),
+        ),
+    ]
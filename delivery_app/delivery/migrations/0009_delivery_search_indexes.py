@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:56
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+from delivery.operations import AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не выполняется в транзакции;
+    # индексы только PostgreSQL, вне состояния модели (delivery.operations)
+    atomic = False
+
+    dependencies = [
+        ('delivery', '0008_delivery_access_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddPostgresIndex(
+            model_name='delivery',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.search.SearchVector('transport_number', 'source_address', 'destination_address', config='simple'), name='delivery_search_vector_idx'),
+            concurrently=True,
+        ),
+        AddPostgresIndex(
+            model_name='delivery',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass('transport_number', name='gin_trgm_ops'), django.contrib.postgres.indexes.OpClass('source_address', name='gin_trgm_ops'), django.contrib.postgres.indexes.OpClass('destination_address', name='gin_trgm_ops'), name='delivery_search_trgm_idx'),
+            concurrently=True,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+from delivery.partitions import AddPartitionedIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY не выполняется в транзакции
+    atomic = False
+
+    dependencies = [
+        ('delivery', '0009_delivery_search_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddPartitionedIndexConcurrently(
+            model_name='delivery',
+            index=models.Index(fields=['start_time'], name='delivery_start_time_idx'),
+        ),
+    ]
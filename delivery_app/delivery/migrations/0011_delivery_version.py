@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0010_delivery_start_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='delivery',
+            name='version',
+            field=models.IntegerField(db_default=1, default=1),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:16
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+from delivery.operations import AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0011_delivery_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('status', 'Статус'), ('courier', 'Курьер')], max_length=20)),
+                ('old_value', models.CharField(blank=True, max_length=255, null=True)),
+                ('new_value', models.CharField(blank=True, max_length=255, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivery', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='delivery.delivery')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Delivery Event',
+                'verbose_name_plural': 'Delivery Events',
+                'indexes': [models.Index(fields=['delivery', 'created_at'], name='delivery_event_delivery_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StatusDuration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('entries', models.PositiveIntegerField(default=0)),
+                ('exits', models.PositiveIntegerField(default=0)),
+                ('total_seconds', models.FloatField(default=0)),
+                ('status', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='delivery.status')),
+            ],
+            options={
+                'verbose_name': 'Status Duration',
+                'verbose_name_plural': 'Status Durations',
+                'constraints': [models.UniqueConstraint(fields=('status', 'day'), name='status_duration_status_day_uniq')],
+            },
+        ),
+        AddPostgresIndex(
+            model_name='deliveryevent',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='delivery_event_time_brin'),
+        ),
+    ]
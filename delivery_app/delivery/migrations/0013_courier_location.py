@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:18
+
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from delivery.operations import AddPostgresIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0012_delivery_event_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourierLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recorded_at', models.DateTimeField()),
+                ('lat', models.FloatField()),
+                ('lon', models.FloatField()),
+                ('accuracy', models.FloatField(blank=True, null=True)),
+                ('courier', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('delivery', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='delivery.delivery')),
+            ],
+            options={
+                'verbose_name': 'Courier Location',
+                'verbose_name_plural': 'Courier Locations',
+                'indexes': [models.Index(fields=['courier', 'recorded_at'], name='courier_location_courier_idx'), models.Index(condition=models.Q(('delivery__isnull', False)), fields=['delivery', 'recorded_at'], name='courier_location_delivery_idx')],
+            },
+        ),
+        AddPostgresIndex(
+            model_name='courierlocation',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['recorded_at'], name='courier_location_time_brin'),
+        ),
+    ]
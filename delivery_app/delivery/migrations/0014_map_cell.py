@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0013_courier_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MapCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.PositiveSmallIntegerField()),
+                ('x', models.PositiveIntegerField()),
+                ('y', models.PositiveIntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('lat_sum', models.FloatField(default=0)),
+                ('lon_sum', models.FloatField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Map Cell',
+                'verbose_name_plural': 'Map Cells',
+                'constraints': [models.UniqueConstraint(fields=('level', 'x', 'y'), name='map_cell_level_x_y_uniq')],
+            },
+        ),
+    ]
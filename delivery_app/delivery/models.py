@@ -4,8 +4,11 @@
 """
 
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from django.contrib.auth.models import User
 
+
 class TransportModel(models.Model):
     """Модель транспорта для доставки."""
     name = models.CharField(max_length=100, unique=True)
@@ -70,8 +73,27 @@ class UserProfile(models.Model):
         verbose_name = "User Profile"
         verbose_name_plural = "User Profiles"
 
+class VersionConflict(Exception):
+    """
+    Доставка изменена другим запросом после того, как ее прочитали.
+
+    Attributes:
+        delivery_id: ID доставки
+    """
+
+    def __init__(self, delivery_id):
+        super().__init__(f"Доставка {delivery_id} изменена другим запросом")
+        self.delivery_id = delivery_id
+
 class Delivery(models.Model):
-    """Модель доставки."""
+    """
+    Модель доставки.
+
+    Изменения защищены оптимистичной блокировкой: save() существующей
+    доставки выполняет UPDATE ... WHERE version = <прочитанная версия>
+    и увеличивает version; если строку уже изменили (или удалили),
+    вызывается VersionConflict, а не перезапись чужих изменений.
+    """
     TECHNICAL_CONDITION_CHOICES = [
         ('Исправно', 'Исправно'),
         ('Неисправно', 'Неисправно'),
@@ -83,7 +105,10 @@ class Delivery(models.Model):
     end_time = models.DateTimeField()
     distance = models.FloatField()
     media_file = models.FileField(upload_to='deliveries/%Y/%m/%d/', blank=True, null=True)
-    services = models.ManyToManyField(Service)
+    # Таблица доставок секционирована по start_time (PostgreSQL), а внешний ключ
+    # на секционированную таблицу требует уникальности (id, start_time),
+    # поэтому ссылки на доставку хранятся без ограничения в базе
+    services = models.ManyToManyField(Service, db_constraint=False)
     packaging = models.ForeignKey(PackagingType, on_delete=models.CASCADE)
     status = models.ForeignKey(Status, on_delete=models.CASCADE)
     technical_condition = models.CharField(max_length=20, choices=TECHNICAL_CONDITION_CHOICES)
@@ -94,11 +119,226 @@ class Delivery(models.Model):
     source_lon = models.FloatField(blank=True, null=True)
     dest_lat = models.FloatField(blank=True, null=True)
     dest_lon = models.FloatField(blank=True, null=True)
+    # Версия строки для оптимистичной блокировки (ETag в API);
+    # значение по умолчанию в базе - для строк, загружаемых через COPY
+    version = models.IntegerField(default=1, db_default=1)
 
     def __str__(self) -> str:
         return f"Delivery {self.transport_number}"
 
+    def check_version(self, expected):
+        """
+        Проверяет, что клиент изменял ту версию доставки, которая сейчас в базе.
+
+        Args:
+            expected: Версия из If-Match или тела запроса (None - без проверки)
+
+        Raises:
+            VersionConflict: Версия устарела
+        """
+        if expected is not None and expected != self.version:
+            raise VersionConflict(self.pk)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+        self._saved_version = self.version
+        self.version += 1
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'version'}
+        try:
+            return super().save(*args, **kwargs)
+        except VersionConflict:
+            self.version = self._saved_version
+            raise
+
+    def _do_update(self, base_qs, *args, **kwargs):
+        # UPDATE только при неизменной версии; ноль строк - конфликт, а не INSERT,
+        # который Django выполнил бы для "отсутствующей" строки
+        if not super()._do_update(base_qs.filter(version=self._saved_version), *args, **kwargs):
+            raise VersionConflict(self.pk)
+        return True
+
     class Meta:
         """Метаданные модели доставки."""
         verbose_name = "Delivery"
         verbose_name_plural = "Deliveries"
+        indexes = [
+            # Доступные доставки: courier IS NULL AND status = ... с фильтром
+            # и сортировкой по distance или сортировкой по start_time
+            models.Index(
+                fields=['status', 'distance'], condition=Q(courier__isnull=True),
+                name='delivery_available_dist_idx',
+            ),
+            models.Index(
+                fields=['status', 'start_time'], condition=Q(courier__isnull=True),
+                name='delivery_available_start_idx',
+            ),
+            # Активные доставки и история курьера: courier = ... AND status ...
+            models.Index(fields=['courier', 'status'], name='delivery_courier_status_idx'),
+            # Иерархия дат и фильтр по start_time в админке (MIN/MAX, диапазоны)
+            models.Index(fields=['start_time'], name='delivery_start_time_idx'),
+        ]
+        # GIN-индексы поиска (delivery.search) только в PostgreSQL, вне Meta
+        # (см. delivery.operations): миграция 0009_delivery_search_indexes
+
+class DeliveryEvent(models.Model):
+    """
+    Изменение поля доставки (журнал только дополняется).
+
+    Значения хранятся строками: для status и courier - ID.
+    """
+    FIELD_CHOICES = [
+        ('status', 'Статус'),
+        ('courier', 'Курьер'),
+    ]
+
+    # Без ограничения в базе, как services у доставки: таблица доставок секционирована.
+    # Журнал переживает удаление доставки
+    delivery = models.ForeignKey(
+        Delivery, on_delete=models.DO_NOTHING, db_constraint=False, related_name='events'
+    )
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    old_value = models.CharField(max_length=255, null=True, blank=True)
+    new_value = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:
+        return f"Delivery {self.delivery_id}: {self.field} {self.old_value} -> {self.new_value}"
+
+    class Meta:
+        """Метаданные модели события доставки."""
+        verbose_name = "Delivery Event"
+        verbose_name_plural = "Delivery Events"
+        indexes = [
+            # История доставки и время входа в текущий статус
+            models.Index(fields=['delivery', 'created_at'], name='delivery_event_delivery_idx'),
+        ]
+        # BRIN-индекс created_at для выборок за период (только PostgreSQL,
+        # см. delivery.operations): миграция 0012_delivery_event_log
+
+class StatusDuration(models.Model):
+    """
+    Время доставок в статусе по дням (обновляется при записи событий).
+
+    entries - переходы в статус за день, exits - выходы из статуса за день
+    с известным временем входа, total_seconds - суммарное время в статусе
+    для этих выходов.
+    """
+    status = models.ForeignKey(Status, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    entries = models.PositiveIntegerField(default=0)
+    exits = models.PositiveIntegerField(default=0)
+    total_seconds = models.FloatField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.status_id} {self.day}"
+
+    class Meta:
+        """Метаданные модели времени в статусе."""
+        verbose_name = "Status Duration"
+        verbose_name_plural = "Status Durations"
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'day'], name='status_duration_status_day_uniq'),
+        ]
+
+class CourierLocation(models.Model):
+    """
+    GPS-точка курьера (временной ряд, только добавление).
+
+    Точки пишутся пачками через COPY (delivery.locations), поэтому внешние
+    ключи без ограничений в базе: их проверка замедлила бы загрузку.
+    """
+    courier = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    # Таблица доставок секционирована (см. DeliveryEvent.delivery)
+    delivery = models.ForeignKey(
+        Delivery, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    recorded_at = models.DateTimeField()
+    lat = models.FloatField()
+    lon = models.FloatField()
+    # Точность в метрах по данным устройства
+    accuracy = models.FloatField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"Courier {self.courier_id} at {self.recorded_at}"
+
+    class Meta:
+        """Метаданные модели GPS-точки курьера."""
+        verbose_name = "Courier Location"
+        verbose_name_plural = "Courier Locations"
+        indexes = [
+            # Трек курьера за период
+            models.Index(fields=['courier', 'recorded_at'], name='courier_location_courier_idx'),
+            # Трек доставки
+            models.Index(
+                fields=['delivery', 'recorded_at'], condition=Q(delivery__isnull=False),
+                name='courier_location_delivery_idx',
+            ),
+        ]
+        # BRIN-индекс recorded_at (только PostgreSQL, см. delivery.operations):
+        # миграция 0013_courier_location
+
+class MapCell(models.Model):
+    """
+    Число доставок без курьера в ячейке карты (обновляется при изменении доставок).
+
+    Ячейка - тайл Web Mercator уровня level с координатами x, y; на каждом
+    уровне 0..MAP_MAX_LEVEL хранятся только непустые ячейки. lat_sum и
+    lon_sum - суммы координат точек отправления для центра кластера.
+    """
+    level = models.PositiveSmallIntegerField()
+    x = models.PositiveIntegerField()
+    y = models.PositiveIntegerField()
+    count = models.IntegerField(default=0)
+    lat_sum = models.FloatField(default=0)
+    lon_sum = models.FloatField(default=0)
+
+    def __str__(self) -> str:
+        return f"{self.level}/{self.x}/{self.y}"
+
+    class Meta:
+        """Метаданные модели ячейки карты."""
+        verbose_name = "Map Cell"
+        verbose_name_plural = "Map Cells"
+        constraints = [
+            # Индекс ограничения покрывает выборку ячеек окна карты: level = ... AND x BETWEEN ... AND y BETWEEN ...
+            models.UniqueConstraint(fields=['level', 'x', 'y'], name='map_cell_level_x_y_uniq'),
+        ]
+
+class ProfileReport(models.Model):
+    """Отчет профилирования одного HTTP-запроса."""
+    TRIGGER_CHOICES = [
+        ('header', 'Заголовок X-Profile'),
+        ('query', 'Параметр _profile'),
+        ('sample', 'Выборка маршрута'),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    route = models.CharField(max_length=255, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    query_count = models.PositiveIntegerField()
+    sql_time_ms = models.FloatField()
+    # Самые медленные запросы: [{"sql", "params", "time_ms", "explain"}]
+    slow_queries = models.JSONField(default=list)
+    text_report = models.TextField()
+    # HTML-отчет pyinstrument с интерактивным flamegraph
+    html_report = models.TextField()
+
+    def __str__(self) -> str:
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
+
+    class Meta:
+        """Метаданные модели отчета профилирования."""
+        verbose_name = "Profile Report"
+        verbose_name_plural = "Profile Reports"
+        ordering = ['-created_at']
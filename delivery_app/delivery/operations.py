@@ -0,0 +1,55 @@
+"""
+Операции миграций для индексов, которые есть только в PostgreSQL.
+
+GIN- и BRIN-индексы не входят в Meta.indexes моделей: SQLite при
+пересоздании таблицы (например, при AddField с db_default) строит заново
+все индексы из состояния модели и не может выполнить их SQL. Операции
+модуля создают индекс в базе, не меняя состояние миграций, и ничего не
+делают на других СУБД.
+"""
+
+from django.db.migrations.operations import AddIndex
+
+from .partitions import AddPartitionedIndexConcurrently
+
+
+class AddPostgresIndex(AddIndex):
+    """
+    Создает индекс только в PostgreSQL, вне состояния модели.
+
+    Args:
+        model_name: Имя модели
+        index: Индекс
+        concurrently: Строить без блокировки записи, в том числе на
+            секционированной таблице (миграция должна быть atomic = False)
+    """
+
+    def __init__(self, model_name, index, concurrently=False):
+        super().__init__(model_name, index)
+        self.concurrently = concurrently
+
+    def deconstruct(self):
+        name, args, kwargs = super().deconstruct()
+        if self.concurrently:
+            kwargs['concurrently'] = True
+        return name, args, kwargs
+
+    def state_forwards(self, app_label, state):
+        # Индекс не попадает в состояние модели и в пересоздаваемые таблицы
+        pass
+
+    def _operation(self):
+        if self.concurrently:
+            return AddPartitionedIndexConcurrently(self.model_name, self.index)
+        return AddIndex(self.model_name, self.index)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            self._operation().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            self._operation().database_backwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return f"{super().describe()} (PostgreSQL)"
@@ -0,0 +1,275 @@
+"""
+Секционирование таблицы доставок по месяцам start_time (PostgreSQL).
+
+Таблица delivery_delivery - секционированная (PARTITION BY RANGE start_time),
+секции называются delivery_delivery_yYYYYmMM, строки вне созданных секций
+попадают в delivery_delivery_default. Модуль создает будущие секции
+и архивирует старые; на других СУБД функции ничего не делают.
+"""
+
+import logging
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.postgres.indexes import PostgresIndex
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import connections, transaction
+from django.db.migrations.operations import AddIndex
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'delivery_delivery'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def add_months(month, count):
+    """
+    Сдвигает первое число месяца на count месяцев.
+
+    Args:
+        month: datetime первого числа месяца
+        count: Число месяцев (может быть отрицательным)
+
+    Returns:
+        datetime: Первое число нового месяца
+    """
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def month_start(moment):
+    """Возвращает начало месяца (UTC) для момента времени."""
+    moment = moment.astimezone(timezone.utc) if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def partition_name(month):
+    """Имя секции месяца."""
+    return f'{TABLE}_y{month.year:04d}m{month.month:02d}'
+
+
+def is_partitioned(using='default', table=TABLE):
+    """
+    Проверяет, секционирована ли таблица (по умолчанию - доставок).
+
+    Returns:
+        bool: True для секционированной таблицы PostgreSQL
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)",
+            [table],
+        )
+        return cursor.fetchone() is not None
+
+
+def _partition_rows(cursor, table):
+    cursor.execute(
+        "SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = %s::regclass ORDER BY c.relname",
+        [table],
+    )
+    return cursor.fetchall()
+
+
+def list_partitions(using='default'):
+    """
+    Возвращает секции таблицы доставок.
+
+    Returns:
+        list: Словари name, month (None для секции по умолчанию), rows
+            (оценка по статистике) и size (байт)
+    """
+    with connections[using].cursor() as cursor:
+        rows = _partition_rows(cursor, TABLE)
+    partitions = []
+    for name, tuples, size in rows:
+        month = None
+        if name != DEFAULT_PARTITION:
+            month = datetime.strptime(name[len(TABLE) + 1:], 'y%Ym%m').replace(tzinfo=timezone.utc)
+        partitions.append({'name': name, 'month': month, 'rows': max(tuples, 0), 'size': size})
+    return partitions
+
+
+def create_partition(month, using='default'):
+    """
+    Создает секцию месяца, если ее еще нет.
+
+    Строки этого месяца, уже попавшие в секцию по умолчанию, переносятся
+    в новую секцию (иначе PostgreSQL не позволит ее создать).
+
+    Args:
+        month: datetime первого числа месяца (UTC)
+
+    Returns:
+        bool: True, если секция создана
+    """
+    connection = connections[using]
+    name = partition_name(month)
+    bounds = [month, add_months(month, 1)]
+    quote = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        cursor.execute(
+            f"CREATE TEMP TABLE delivery_partition_moved ON COMMIT DROP AS "
+            f"SELECT * FROM {quote(DEFAULT_PARTITION)} WHERE start_time >= %s AND start_time < %s",
+            bounds,
+        )
+        cursor.execute(
+            f"DELETE FROM {quote(DEFAULT_PARTITION)} WHERE start_time >= %s AND start_time < %s", bounds
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f"CREATE TABLE {quote(name)} PARTITION OF {quote(TABLE)} FOR VALUES FROM (%s) TO (%s)", bounds
+        )
+        cursor.execute(f"INSERT INTO {quote(TABLE)} SELECT * FROM delivery_partition_moved")
+        cursor.execute("DROP TABLE delivery_partition_moved")
+    logger.info("Создана секция %s (перенесено из секции по умолчанию: %s)", name, moved)
+    return True
+
+
+def ensure_partitions(months_ahead=3, now=None, using='default'):
+    """
+    Создает секции текущего и следующих months_ahead месяцев.
+
+    Args:
+        months_ahead: Сколько месяцев вперед подготовить
+        now: Текущий момент (для тестов)
+
+    Returns:
+        list: Имена созданных секций
+    """
+    if not is_partitioned(using):
+        return []
+    current = month_start(now or datetime.now(timezone.utc))
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month, using):
+            created.append(partition_name(month))
+    return created
+
+
+def ensure_partitions_after_migrate(using='default', **kwargs):
+    """Обработчик post_migrate: секции на ближайшие месяцы после миграций."""
+    ensure_partitions(settings.DELIVERY_PARTITION_MONTHS_AHEAD, using=using)
+
+
+def archive_partitions(older_than_months, mode='freeze', tablespace=None, now=None, dry_run=False, using='default'):
+    """
+    Архивирует секции старше older_than_months месяцев.
+
+    Режимы:
+    - freeze: VACUUM FREEZE и отключение autovacuum для секции; секция
+      остается в таблице, история и отчеты ее видят, а autovacuum больше
+      не тратит на нее время. С tablespace секция переносится в табличное
+      пространство (например, на дешевый диск или файловую систему со сжатием)
+    - detach: секция отсоединяется и переименовывается в
+      delivery_delivery_archive_yYYYYmMM; ее строки больше не видны API
+
+    Args:
+        older_than_months: Возраст секции в месяцах
+        mode: freeze или detach
+        tablespace: Табличное пространство для режима freeze
+        now: Текущий момент (для тестов)
+        dry_run: Только вернуть список секций
+
+    Returns:
+        list: Имена обработанных секций
+    """
+    if mode not in ('freeze', 'detach'):
+        raise ValueError(f"Неизвестный режим архивации: {mode}")
+    if not is_partitioned(using):
+        return []
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    border = add_months(month_start(now or datetime.now(timezone.utc)), -older_than_months)
+    candidates = [item['name'] for item in list_partitions(using) if item['month'] and item['month'] < border]
+    if dry_run:
+        return candidates
+
+    archived = []
+    with connection.cursor() as cursor:
+        for name in candidates:
+            if mode == 'detach':
+                archive_name = name.replace(TABLE, f'{TABLE}_archive', 1)
+                cursor.execute(f"ALTER TABLE {quote(TABLE)} DETACH PARTITION {quote(name)}")
+                cursor.execute(f"ALTER TABLE {quote(name)} RENAME TO {quote(archive_name)}")
+            else:
+                cursor.execute(
+                    "SELECT c.reloptions FROM pg_class c WHERE c.relname = %s", [name]
+                )
+                options = cursor.fetchone()[0] or []
+                if 'autovacuum_enabled=false' in options and not tablespace:
+                    continue
+                if tablespace:
+                    cursor.execute(f"ALTER TABLE {quote(name)} SET TABLESPACE {quote(tablespace)}")
+                # VACUUM нельзя выполнять в транзакции; команда управления работает в autocommit
+                cursor.execute(f"VACUUM (FREEZE, ANALYZE) {quote(name)}")
+                cursor.execute(f"ALTER TABLE {quote(name)} SET (autovacuum_enabled = false)")
+            archived.append(name)
+            logger.info("Секция %s архивирована (%s)", name, mode)
+    return archived
+
+
+class AddPartitionedIndexConcurrently(AddIndexConcurrently):
+    """
+    Создает индекс без блокировки записи, в том числе на секционированной таблице.
+
+    PostgreSQL не умеет CREATE INDEX CONCURRENTLY для секционированной
+    таблицы, поэтому индекс создается на родителе через ON ONLY (без
+    построения), затем конкурентно на каждой секции и присоединяется
+    к родительскому; после присоединения всех секций он становится
+    действительным, а новые секции получают его автоматически.
+    На других СУБД выполняется обычный AddIndex, а индексы PostgreSQL
+    (GIN и т.п.) пропускаются.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        connection = schema_editor.connection
+        if connection.vendor != 'postgresql':
+            if isinstance(self.index, PostgresIndex):
+                # GIN и другие индексы PostgreSQL на других СУБД не создаются
+                return None
+            return AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        table = model._meta.db_table
+        if not self.allow_migrate_model(connection.alias, model) or not is_partitioned(connection.alias, table):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+        self._ensure_not_in_transaction(schema_editor)
+        quote = schema_editor.quote_name
+        # IF NOT EXISTS - чтобы прерванную миграцию можно было запустить повторно
+        parent = self.index.create_sql(model, schema_editor)
+        parent.parts['table'] = f'ONLY {quote(table)}'
+        schema_editor.execute(str(parent).replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1))
+        with connection.cursor() as cursor:
+            partitions = [row[0] for row in _partition_rows(cursor, table)]
+        for partition in partitions:
+            name = f'{self.index.name}_{partition[len(table) + 1:]}'[:connection.ops.max_name_length()]
+            child = self.index.create_sql(model, schema_editor, concurrently=True)
+            child.parts['name'] = quote(name)
+            child.parts['table'] = quote(partition)
+            schema_editor.execute(str(child).replace('CONCURRENTLY', 'CONCURRENTLY IF NOT EXISTS', 1))
+            schema_editor.execute(f'ALTER INDEX {quote(self.index.name)} ATTACH PARTITION {quote(name)}')
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        connection = schema_editor.connection
+        if connection.vendor != 'postgresql':
+            if isinstance(self.index, PostgresIndex):
+                return None
+            return AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if not is_partitioned(connection.alias, model._meta.db_table):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        # Индекс секционированной таблицы удаляется только без CONCURRENTLY
+        # (вместе с индексами секций)
+        if self.allow_migrate_model(connection.alias, model):
+            schema_editor.execute(f'DROP INDEX IF EXISTS {schema_editor.quote_name(self.index.name)}')
@@ -0,0 +1,166 @@
+"""
+Профилирование отдельных запросов по требованию.
+Запускает запрос под семплирующим профайлером pyinstrument, собирает SQL
+с планами самых медленных запросов и сохраняет отчет в ProfileReport.
+"""
+
+import random
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.urls import Resolver404, resolve
+from pyinstrument import Profiler
+
+from .models import ProfileReport
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+# SQL текущего профилируемого запроса; None, если запрос не профилируется
+_captured_queries = ContextVar('delivery_profiled_queries', default=None)
+
+
+def capture_wrapper(execute, sql, params, many, context):
+    """Обертка выполнения SQL, запоминающая запросы профилируемого запроса."""
+    queries = _captured_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append({
+            'alias': context['connection'].alias,
+            'sql': sql,
+            'params': params,
+            'many': many,
+            'time': perf_counter() - start,
+        })
+
+
+def install_capture_wrapper(sender, connection, **kwargs):
+    """Подключает capture_wrapper к новому соединению с базой."""
+    if capture_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_wrapper)
+
+
+def sample_trigger(request, sample_rates):
+    """
+    Решает, попадает ли запрос в выборку профилирования маршрута.
+
+    Args:
+        request: HTTP запрос
+        sample_rates: Шаблон маршрута -> доля профилируемых запросов
+
+    Returns:
+        str | None: 'sample' или None
+    """
+    try:
+        route = resolve(request.path_info).route
+    except Resolver404:
+        return None
+    rate = sample_rates.get(route)
+    if rate and random.random() < rate:
+        return 'sample'
+    return None
+
+
+def explain_queries(queries, limit):
+    """
+    Получает планы выполнения самых медленных SELECT-запросов.
+
+    Args:
+        queries: Запросы, собранные capture_wrapper
+        limit: Сколько запросов объяснять
+
+    Returns:
+        list: [{"sql", "params", "time_ms", "explain"}]
+    """
+    selects = [
+        query for query in queries
+        if not query['many'] and query['sql'].lstrip()[:6].upper() == 'SELECT'
+    ]
+    slowest = sorted(selects, key=lambda query: query['time'], reverse=True)[:limit]
+
+    result = []
+    for query in slowest:
+        connection = connections[query['alias']]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"{connection.ops.explain_query_prefix()} {query['sql']}", query['params'])
+                plan = '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+        except DatabaseError as exc:
+            plan = f"EXPLAIN не выполнен: {exc}"
+        result.append({
+            'sql': query['sql'],
+            'params': [str(param) for param in query['params'] or ()],
+            'time_ms': round(query['time'] * 1000, 3),
+            'explain': plan,
+        })
+    return result
+
+
+class RequestProfile:
+    """
+    Профилирование одного запроса.
+
+    Использование: start(), выполнение запроса, stop(), save().
+    """
+
+    def __init__(self, trigger, async_mode='disabled'):
+        """
+        Args:
+            trigger: Причина профилирования (header, query или sample)
+            async_mode: Режим pyinstrument ('enabled' для асинхронных запросов)
+        """
+        self.trigger = trigger
+        self.profiler = Profiler(
+            interval=getattr(settings, 'PROFILING_INTERVAL', 0.001),
+            async_mode=async_mode
+        )
+        self.queries = []
+        self.duration = 0.0
+        self._token = None
+        self._started = None
+
+    def start(self):
+        """Запускает профайлер и сбор SQL."""
+        self._token = _captured_queries.set(self.queries)
+        self._started = perf_counter()
+        self.profiler.start()
+
+    def stop(self):
+        """Останавливает профайлер и сбор SQL."""
+        self.profiler.stop()
+        self.duration = perf_counter() - self._started
+        _captured_queries.reset(self._token)
+
+    def save(self, request, response, user=None):
+        """
+        Сохраняет отчет профилирования.
+
+        Args:
+            request: HTTP запрос
+            response: HTTP ответ
+            user: Пользователь, выполнивший запрос
+
+        Returns:
+            ProfileReport: Сохраненный отчет
+        """
+        match = getattr(request, 'resolver_match', None)
+        return ProfileReport.objects.create(
+            method=request.method,
+            path=request.get_full_path()[:500],
+            route=(match.route if match else '')[:255],
+            user=user,
+            trigger=self.trigger,
+            status_code=response.status_code,
+            duration_ms=self.duration * 1000,
+            query_count=len(self.queries),
+            sql_time_ms=sum(query['time'] for query in self.queries) * 1000,
+            slow_queries=explain_queries(self.queries, getattr(settings, 'PROFILING_EXPLAIN_TOP', 5)),
+            text_report=self.profiler.output_text(),
+            html_report=self.profiler.output_html(),
+        )
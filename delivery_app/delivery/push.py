@@ -0,0 +1,254 @@
+"""
+Push-канал изменений доставок.
+Формирует компактные события, фильтрует их по подпискам и отдает клиентам
+через Server-Sent Events и WebSocket.
+"""
+
+import asyncio
+import logging
+from urllib.parse import parse_qs
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from rest_framework.exceptions import APIException, ValidationError
+
+from .authentication import AsyncJWTAuthentication
+from .broker import get_broker
+
+logger = logging.getLogger(__name__)
+
+CHANNELS = ('available', 'my', 'bbox')
+
+# Интервал отправки heartbeat, чтобы прокси не закрывали простаивающие соединения
+HEARTBEAT_SECONDS = 25
+
+
+def delivery_event(op, delivery, previous_courier_id=None, previous_status_id=None):
+    """
+    Строит событие изменения доставки.
+
+    Args:
+        op: created, assigned, unassigned, status, updated или deleted
+        delivery: Доставка (после изменения)
+        previous_courier_id: ID курьера до изменения
+        previous_status_id: ID статуса до изменения
+
+    Returns:
+        dict: Событие для отправки клиентам
+    """
+    return {
+        'op': op,
+        'id': delivery.pk,
+        'courier': delivery.courier_id,
+        'prev_courier': previous_courier_id,
+        'status': delivery.status_id,
+        'prev_status': previous_status_id,
+        'lat': delivery.source_lat,
+        'lon': delivery.source_lon,
+    }
+
+
+def _publish(event):
+    try:
+        get_broker().publish(event)
+    except Exception:  # pylint: disable=broad-except
+        # Ошибка push-канала не должна ломать запись доставки
+        logger.exception("Не удалось опубликовать событие доставки %s", event.get('id'))
+
+
+def publish_delivery_event(event):
+    """
+    Публикует событие после фиксации текущей транзакции.
+
+    Используется сигналами модели и путями записи, которые обходят
+    сигналы (QuerySet.update, bulk_create).
+
+    Args:
+        event: Событие из delivery_event()
+    """
+    if not getattr(settings, 'PUSH_ENABLED', True):
+        return
+    transaction.on_commit(lambda: _publish(event))
+
+
+class Subscription:
+    """
+    Подписка клиента на события доставок.
+
+    Attributes:
+        user_id: ID пользователя (для канала my)
+        channels: Набор каналов из CHANNELS
+        bbox: (min_lon, min_lat, max_lon, max_lat) для канала bbox
+    """
+
+    def __init__(self, user_id, channels=(), bbox=None):
+        self.user_id = user_id
+        self.channels = set()
+        self.bbox = None
+        self.update(channels, bbox)
+
+    def update(self, channels, bbox=None):
+        """
+        Добавляет каналы к подписке.
+
+        Raises:
+            ValidationError: Неизвестный канал или некорректный bbox
+        """
+        unknown = [channel for channel in channels if channel not in CHANNELS]
+        if unknown:
+            raise ValidationError({'channel': f"Неизвестные каналы: {', '.join(unknown)}"})
+        if 'bbox' in channels:
+            self.bbox = parse_bbox(bbox)
+        self.channels.update(channels)
+
+    def remove(self, channels):
+        """Удаляет каналы из подписки."""
+        self.channels.difference_update(channels)
+        if 'bbox' not in self.channels:
+            self.bbox = None
+
+    def matches(self, event):
+        """
+        Проверяет, нужно ли отправить событие подписчику.
+
+        Args:
+            event: Событие из delivery_event()
+
+        Returns:
+            bool: True, если событие относится к подписке
+        """
+        if event.get('op') == 'resync':
+            return True
+        if 'available' in self.channels and (event['courier'] is None or event['prev_courier'] is None):
+            return True
+        if 'my' in self.channels and self.user_id in (event['courier'], event['prev_courier']):
+            return True
+        if self.bbox is not None and event['lat'] is not None and event['lon'] is not None:
+            min_lon, min_lat, max_lon, max_lat = self.bbox
+            if min_lon <= event['lon'] <= max_lon and min_lat <= event['lat'] <= max_lat:
+                return True
+        return False
+
+
+def parse_bbox(value):
+    """
+    Разбирает bbox вида "min_lon,min_lat,max_lon,max_lat".
+
+    Raises:
+        ValidationError: Некорректный bbox
+    """
+    try:
+        if isinstance(value, str):
+            value = value.split(',')
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value)
+    except (TypeError, ValueError):
+        raise ValidationError({'bbox': "Ожидается bbox=min_lon,min_lat,max_lon,max_lat"})
+    return min_lon, min_lat, max_lon, max_lat
+
+
+async def authenticate_token(raw_token):
+    """
+    Аутентифицирует пользователя по токену из строки запроса.
+
+    Браузерные EventSource и WebSocket не умеют передавать заголовок
+    Authorization, поэтому push-канал принимает токен в access_token.
+
+    Returns:
+        User: Пользователь из токена
+
+    Raises:
+        AuthenticationFailed: Токен или пользователь недействительны
+    """
+    authenticator = AsyncJWTAuthentication()
+    try:
+        return await authenticator.aget_user(authenticator.get_validated_token(raw_token))
+    finally:
+        await sync_to_async(close_old_connections)()
+
+
+async def event_stream(subscription):
+    """
+    Асинхронный генератор событий подписки с heartbeat.
+
+    Yields:
+        dict | None: Событие или None, если пора отправить heartbeat
+    """
+    broker = get_broker()
+    queue = broker.subscribe()
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if subscription.matches(event):
+                yield event
+    finally:
+        broker.unsubscribe(queue)
+
+
+async def sse_stream(subscription):
+    """Форматирует события подписки как Server-Sent Events."""
+    yield b'retry: 3000\n\n'
+    async for event in event_stream(subscription):
+        if event is None:
+            yield b': ping\n\n'
+        else:
+            yield b'event: delivery\ndata: ' + orjson.dumps(event) + b'\n\n'
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI-приложение WebSocket push-канала.
+
+    Подключение: /ws/deliveries/?access_token=<JWT>&channel=available,my
+    Клиент может менять подписку сообщениями
+    {"subscribe": ["bbox"], "bbox": [min_lon, min_lat, max_lon, max_lat]}
+    и {"unsubscribe": ["available"]}. События приходят как JSON-объекты.
+    """
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    params = parse_qs(scope.get('query_string', b'').decode())
+    token = params.get('access_token', [None])[0]
+    try:
+        if not token:
+            raise ValidationError({'access_token': "Токен не указан"})
+        user = await authenticate_token(token)
+        channels = [c for c in params.get('channel', [''])[0].split(',') if c]
+        subscription = Subscription(user.pk, channels, params.get('bbox', [None])[0])
+    except APIException:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+
+    await send({'type': 'websocket.accept'})
+
+    async def forward_events():
+        async for event in event_stream(subscription):
+            if event is None:
+                event = {'op': 'ping'}
+            await send({'type': 'websocket.send', 'text': orjson.dumps(event).decode()})
+
+    forwarder = asyncio.create_task(forward_events())
+    try:
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message['type'] != 'websocket.receive':
+                continue
+            try:
+                command = orjson.loads(message.get('text') or message.get('bytes') or b'{}')
+                if 'subscribe' in command:
+                    subscription.update(command['subscribe'], command.get('bbox'))
+                if 'unsubscribe' in command:
+                    subscription.remove(command['unsubscribe'])
+            except (orjson.JSONDecodeError, TypeError, APIException) as exc:
+                detail = getattr(exc, 'detail', str(exc))
+                await send({'type': 'websocket.send', 'text': orjson.dumps({'op': 'error', 'detail': detail}).decode()})
+    finally:
+        forwarder.cancel()
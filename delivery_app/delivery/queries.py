@@ -0,0 +1,191 @@
+"""
+Запросы доставок, общие для синхронных и асинхронных представлений.
+Функции только строят QuerySet и не обращаются к базе.
+"""
+
+from django.db.models import Sum
+
+from .models import CourierLocation, Delivery, DeliveryEvent, StatusDuration
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+PENDING_STATUS_NAME = "В ожидании"
+DELIVERED_STATUS_NAME = "Доставлено"
+
+# Допустимые значения параметра sort_by для доступных доставок
+AVAILABLE_SORT_FIELDS = ('distance', '-distance', 'start_time', '-start_time')
+
+
+def available_deliveries(status_obj, params):
+    """
+    Доставки без курьера с указанным статусом.
+
+    Args:
+        status_obj: Статус "В ожидании"
+        params: Параметры запроса (max_distance, sort_by)
+
+    Returns:
+        QuerySet: Доступные доставки
+    """
+    deliveries = Delivery.objects.filter(
+        courier__isnull=True,
+        status=status_obj
+    )
+
+    # Фильтрация по максимальному расстоянию
+    max_distance = params.get('max_distance')
+    if max_distance and max_distance.isdigit():
+        deliveries = deliveries.filter(distance__lte=float(max_distance))
+
+    # Сортировка
+    sort_by = params.get('sort_by')
+    if sort_by in AVAILABLE_SORT_FIELDS:
+        deliveries = deliveries.order_by(sort_by)
+
+    return deliveries
+
+
+def filter_deliveries(queryset, params):
+    """
+    Применяет общие фильтры списка и поиска доставок.
+
+    Args:
+        queryset: Исходный запрос доставок
+        params: Параметры запроса: status (ID), courier (ID или none для
+            доставок без курьера), max_distance, sort_by
+
+    Returns:
+        QuerySet: Отфильтрованные доставки
+    """
+    status_id = params.get('status')
+    if status_id and status_id.isdigit():
+        queryset = queryset.filter(status_id=int(status_id))
+
+    courier_id = params.get('courier')
+    if courier_id == 'none':
+        queryset = queryset.filter(courier__isnull=True)
+    elif courier_id and courier_id.isdigit():
+        queryset = queryset.filter(courier_id=int(courier_id))
+
+    max_distance = params.get('max_distance')
+    if max_distance and max_distance.isdigit():
+        queryset = queryset.filter(distance__lte=float(max_distance))
+
+    sort_by = params.get('sort_by')
+    if sort_by in AVAILABLE_SORT_FIELDS:
+        queryset = queryset.order_by(sort_by)
+
+    return queryset
+
+
+def my_active_deliveries(user):
+    """Незавершенные доставки курьера."""
+    return Delivery.objects.filter(
+        courier=user
+    ).exclude(status__name=DELIVERED_STATUS_NAME)
+
+
+def my_history_deliveries(user):
+    """Завершенные доставки курьера."""
+    return Delivery.objects.filter(
+        courier=user,
+        status__name=DELIVERED_STATUS_NAME
+    )
+
+
+def unassigned_coordinates():
+    """Координаты доставок без курьера."""
+    return Delivery.objects.filter(
+        courier__isnull=True
+    ).values('id', 'source_lat', 'source_lon', 'dest_lat', 'dest_lon')
+
+
+def has_coordinates(delivery):
+    """Проверяет, что у строки координат заполнены все точки."""
+    return bool(delivery.get('source_lat') and delivery.get('source_lon') and
+                delivery.get('dest_lat') and delivery.get('dest_lon'))
+
+
+def courier_stats(total_deliveries, successful_deliveries, durations):
+    """
+    Собирает статистику курьера для профиля.
+
+    Args:
+        total_deliveries: Количество всех доставок курьера
+        successful_deliveries: Количество завершенных доставок
+        durations: Пары (start_time, end_time) завершенных доставок
+
+    Returns:
+        dict: Статистика в формате ответа профиля
+    """
+    total_delivery_time = 0
+    for start_time, end_time in durations:
+        if end_time and start_time:
+            duration = end_time - start_time
+            total_delivery_time += duration.total_seconds()
+
+    return {
+        'total_deliveries': total_deliveries,
+        'successful_deliveries': successful_deliveries,
+        'total_delivery_time_seconds': round(total_delivery_time, 2),
+        'total_delivery_time_hours': round(total_delivery_time / 3600, 2)  # Конвертируем в часы для удобства
+    }
+
+
+def delivery_history(delivery_id):
+    """События журнала доставки в порядке изменений."""
+    return DeliveryEvent.objects.filter(delivery_id=delivery_id).order_by('created_at', 'id')
+
+
+def status_durations(date_from, date_to):
+    """
+    Время в статусах за период по дневным суммам StatusDuration.
+
+    Args:
+        date_from: Первый день периода
+        date_to: Последний день периода (включительно)
+
+    Returns:
+        QuerySet: Строки status, status__name, status__color, entries, exits, total_seconds
+    """
+    return StatusDuration.objects.filter(
+        day__gte=date_from, day__lte=date_to
+    ).values('status', 'status__name', 'status__color').annotate(
+        entries=Sum('entries'), exits=Sum('exits'), total_seconds=Sum('total_seconds')
+    ).order_by('status')
+
+
+def status_duration_report(rows):
+    """
+    Ответ отчета о времени в статусах.
+
+    Args:
+        rows: Строки status_durations()
+
+    Returns:
+        list: По статусу - переходы в статус, выходы и среднее время в секундах
+    """
+    return [{
+        'status': row['status'],
+        'name': row['status__name'],
+        'color': row['status__color'],
+        'entries': row['entries'],
+        'exits': row['exits'],
+        'total_seconds': round(row['total_seconds'], 2),
+        'avg_seconds': round(row['total_seconds'] / row['exits'], 2) if row['exits'] else None,
+    } for row in rows]
+
+
+def delivery_locations(delivery_id):
+    """Точки трека доставки (recorded_at, lat, lon) в порядке времени."""
+    return CourierLocation.objects.filter(
+        delivery_id=delivery_id
+    ).order_by('recorded_at').values_list('recorded_at', 'lat', 'lon')
+
+
+def courier_locations(courier_id, start, end):
+    """Точки трека курьера за период [start, end] в порядке времени."""
+    return CourierLocation.objects.filter(
+        courier_id=courier_id, recorded_at__gte=start, recorded_at__lte=end
+    ).order_by('recorded_at').values_list('recorded_at', 'lat', 'lon')
@@ -0,0 +1,84 @@
+"""
+Рендереры и парсеры JSON на базе orjson.
+Заменяют стандартные JSONRenderer и JSONParser DRF, сохраняя их формат вывода.
+"""
+
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import JSONRenderer
+
+# Даты передаются в стандартный энкодер DRF, чтобы формат времени
+# (миллисекунды и суффикс "Z") совпадал со стандартным рендерером.
+ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+_default_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """Сериализует типы, которые orjson не поддерживает напрямую."""
+    return _default_encoder.default(obj)
+
+
+class RawJSON(bytes):
+    """Готовый JSON (например, из кэша), который рендерер выводит без повторной сериализации."""
+
+
+class ORJSONRenderer(JSONRenderer):
+    """Рендерер JSON, использующий orjson вместо стандартного модуля json."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Преобразует данные в JSON.
+
+        Args:
+            data: Данные для сериализации
+            accepted_media_type: Согласованный тип содержимого
+            renderer_context: Контекст рендеринга
+
+        Returns:
+            bytes: JSON-представление данных
+        """
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        option = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            option |= orjson.OPT_INDENT_2
+        elif isinstance(data, RawJSON):
+            return bytes(data)
+        if isinstance(data, RawJSON):
+            data = orjson.loads(bytes(data))
+
+        ret = orjson.dumps(data, default=_default, option=option)
+
+        # Как и JSONRenderer, экранируем U+2028 и U+2029, чтобы вывод
+        # оставался корректным подмножеством JavaScript.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(BaseParser):
+    """Парсер JSON, использующий orjson."""
+    media_type = 'application/json'
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        """
+        Разбирает тело запроса в формате JSON.
+
+        Args:
+            stream: Поток с телом запроса
+            media_type: Тип содержимого запроса
+            parser_context: Контекст парсера
+
+        Returns:
+            Разобранные данные запроса
+        """
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,89 @@
+"""
+Поиск доставок по номеру транспорта и адресам.
+
+В PostgreSQL используется полнотекстовый поиск с префиксами слов
+(для подсказок при наборе) и нечеткое сравнение по триграммам (pg_trgm)
+для опечаток; оба варианта опираются на GIN-индексы таблицы доставок
+(миграция 0009_delivery_search_indexes).
+На других СУБД выполняется простой поиск подстроки.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+# Поля, по которым ищутся доставки
+SEARCH_FIELDS = ('transport_number', 'source_address', 'destination_address')
+
+# Словарь без морфологии: адреса и номера не склоняются как обычный текст
+SEARCH_CONFIG = 'simple'
+
+# Вес полнотекстового совпадения относительно триграммного сходства
+TEXT_RANK_WEIGHT = 2.0
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def search_vector():
+    """
+    Выражение tsvector по полям поиска.
+
+    Совпадает с выражением GIN-индекса delivery_search_vector_idx,
+    поэтому запрос использует индекс.
+    """
+    return SearchVector(*SEARCH_FIELDS, config=SEARCH_CONFIG)
+
+
+def prefix_query(text):
+    """
+    Строит запрос tsquery, в котором каждое слово ищется как префикс.
+
+    Args:
+        text: Строка поиска пользователя
+
+    Returns:
+        SearchQuery или None, если в строке нет слов
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), config=SEARCH_CONFIG, search_type='raw')
+
+
+def search_deliveries(queryset, text):
+    """
+    Фильтрует доставки по строке поиска и сортирует по релевантности.
+
+    Args:
+        queryset: Исходный запрос доставок
+        text: Строка поиска
+
+    Returns:
+        QuerySet: Найденные доставки (в PostgreSQL упорядочены по релевантности)
+    """
+    text = text.strip()
+    if not text:
+        return queryset.none()
+
+    if connections[queryset.db].vendor != 'postgresql':
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': text})
+        return queryset.filter(condition)
+
+    query = prefix_query(text)
+    similarity = Greatest(*(TrigramWordSimilarity(text, field) for field in SEARCH_FIELDS))
+    # Опечатки: слово запроса похоже на слово поля (оператор <% из pg_trgm)
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__trigram_word_similar': text})
+    if query is not None:
+        queryset = queryset.alias(search=search_vector())
+        condition |= Q(search=query)
+        rank = SearchRank(F('search'), query) * TEXT_RANK_WEIGHT + similarity
+    else:
+        rank = similarity
+    return queryset.alias(rank=rank).filter(condition).order_by('-rank', 'id')
@@ -3,7 +3,10 @@
 Предоставляет сериализацию для всех моделей в формате JSON.
 """
 
+import logging
+
 from django.contrib.auth.models import User
+from django.db import transaction
 from rest_framework import serializers
 from .models import (
     TransportModel,
@@ -11,54 +14,85 @@ from .models import (
     Service,
     Status,
     Delivery,
+    DeliveryEvent,
     UserProfile
 )
+from . import writes
+from .fieldsets import RELATED_FIELDS
+from .log import payload
+from .metrics import serializer_timer
 
 # pylint: disable=no-member
 # objects - это стандартный атрибут Django моделей
 
-class TransportModelSerializer(serializers.ModelSerializer):
+logger = logging.getLogger(__name__)
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    """Сериализатор списка, время работы которого попадает в метрики запроса."""
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+class TimedModelSerializer(serializers.ModelSerializer):
+    """
+    Базовый сериализатор моделей, время работы которого попадает в метрики запроса.
+    Для списков в Meta задается list_serializer_class = TimedListSerializer.
+    """
+    @property
+    def data(self):
+        with serializer_timer():
+            return super().data
+
+class TransportModelSerializer(TimedModelSerializer):
     """Сериализатор для модели транспорта."""
     class Meta:
         """Метаданные сериализатора транспорта."""
         model = TransportModel
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name']
 
-class PackagingTypeSerializer(serializers.ModelSerializer):
+class PackagingTypeSerializer(TimedModelSerializer):
     """Сериализатор для типа упаковки."""
     class Meta:
         """Метаданные сериализатора типа упаковки."""
         model = PackagingType
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name']
 
-class ServiceSerializer(serializers.ModelSerializer):
+class ServiceSerializer(TimedModelSerializer):
     """Сериализатор для услуги."""
     class Meta:
         """Метаданные сериализатора услуги."""
         model = Service
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name']
 
-class StatusSerializer(serializers.ModelSerializer):
+class StatusSerializer(TimedModelSerializer):
     """Сериализатор для статуса."""
     class Meta:
         """Метаданные сериализатора статуса."""
         model = Status
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'name', 'color']
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedModelSerializer):
     """Сериализатор для пользователя."""
     class Meta:
         """Метаданные сериализатора пользователя."""
         model = User
+        list_serializer_class = TimedListSerializer
         fields = ['id', 'username', 'first_name', 'last_name']
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(TimedModelSerializer):
     """Сериализатор для профиля пользователя."""
     user = UserSerializer(read_only=True)
 
     class Meta:
         """Метаданные сериализатора профиля пользователя."""
         model = UserProfile
+        list_serializer_class = TimedListSerializer
         fields = ['user', 'phone', 'email']
         
     def update(self, instance, validated_data):
@@ -68,7 +102,46 @@ class UserProfileSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-class DeliverySerializer(serializers.ModelSerializer):
+class DeliveryEventSerializer(serializers.ModelSerializer):
+    """Сериализатор события журнала доставки."""
+    class Meta:
+        """Метаданные сериализатора события доставки."""
+        model = DeliveryEvent
+        fields = ['id', 'field', 'old_value', 'new_value', 'user', 'created_at']
+
+class LookupNameSerializer(serializers.Serializer):
+    """Справочная запись по названию (создается, если ее нет)."""
+    name = serializers.CharField(max_length=100)
+
+class StatusLookupSerializer(LookupNameSerializer):
+    """Статус по названию; цвет используется только для нового статуса."""
+    color = serializers.CharField(max_length=20, required=False)
+
+class DeliveryBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Доставка для пакетного создания.
+
+    Справочники задаются названиями, как во вложенных объектах
+    DeliverySerializer, но без проверки уникальности: существующие
+    записи используются, недостающие создаются. Курьер задается ID.
+    """
+    transport_model = LookupNameSerializer()
+    packaging = LookupNameSerializer()
+    status = StatusLookupSerializer()
+    services = LookupNameSerializer(many=True, required=False)
+    courier_id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        """Метаданные сериализатора пакетного создания."""
+        model = Delivery
+        fields = [
+            'transport_model', 'transport_number', 'start_time', 'end_time',
+            'distance', 'services', 'packaging', 'status', 'technical_condition',
+            'courier_id', 'source_address', 'destination_address',
+            'source_lat', 'source_lon', 'dest_lat', 'dest_lon'
+        ]
+
+class DeliverySerializer(TimedModelSerializer):
     """Сериализатор для доставки."""
     transport_model = TransportModelSerializer()
     packaging = PackagingTypeSerializer()
@@ -79,13 +152,34 @@ class DeliverySerializer(serializers.ModelSerializer):
     class Meta:
         """Метаданные сериализатора доставки."""
         model = Delivery
+        list_serializer_class = TimedListSerializer
         fields = [
             'id', 'transport_model', 'transport_number',
             'start_time', 'end_time', 'distance', 'media_file',
             'services', 'packaging', 'status', 'technical_condition',
             'courier', 'source_address', 'destination_address',
-            'source_lat', 'source_lon', 'dest_lat', 'dest_lon'
+            'source_lat', 'source_lon', 'dest_lat', 'dest_lon', 'version'
         ]
+        # Версия меняется только при сохранении (оптимистичная блокировка)
+        read_only_fields = ['version']
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        """
+        Args:
+            fieldset: DeliveryFieldset для разреженного вывода; без него
+                выводятся все поля с вложенными объектами
+        """
+        super().__init__(*args, **kwargs)
+        if fieldset is None:
+            return
+
+        for name in list(self.fields):
+            if name not in fieldset.fields:
+                self.fields.pop(name)
+            elif name in RELATED_FIELDS and name not in fieldset.expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True, many=name == 'services'
+                )
 
     def create(self, validated_data):
         """Создает новую доставку с связанными объектами."""
@@ -95,101 +189,61 @@ class DeliverySerializer(serializers.ModelSerializer):
         status_data = validated_data.pop('status')
         courier_data = validated_data.pop('courier', None)
 
-        transport_model, _ = TransportModel.objects.get_or_create(**transport_model_data)
-        packaging, _ = PackagingType.objects.get_or_create(**packaging_data)
-        status, _ = Status.objects.get_or_create(**status_data)
-        courier = User.objects.get(**courier_data) if courier_data else None
-
-        delivery = Delivery.objects.create(
-            transport_model=transport_model,
-            packaging=packaging,
-            status=status,
-            courier=courier,
-            **validated_data
-        )
-
-        for service_data in services_data:
-            service, _ = Service.objects.get_or_create(**service_data)
-            delivery.services.add(service)
+        with transaction.atomic():
+            # Справочники - upsert по названию: параллельное создание не падает на уникальности
+            status_name = status_data.pop('name')
+            transport_model_id, = writes.upsert_by_name(TransportModel, [transport_model_data['name']]).values()
+            packaging_id, = writes.upsert_by_name(PackagingType, [packaging_data['name']]).values()
+            status_id, = writes.upsert_by_name(Status, {status_name: status_data}).values()
+            courier = User.objects.get(**courier_data) if courier_data else None
+
+            delivery = Delivery.objects.create(
+                transport_model_id=transport_model_id,
+                packaging_id=packaging_id,
+                status_id=status_id,
+                courier=courier,
+                **validated_data
+            )
+            service_ids = writes.service_ids_by_name(service['name'] for service in services_data)
+            writes.set_services(delivery, service_ids, current=())
 
         return delivery
 
     def update(self, instance, validated_data):
-        """Обновляет существующую доставку и связанные объекты."""
-        transport_model_data = validated_data.pop('transport_model', None)
-        packaging_data = validated_data.pop('packaging', None)
-        services_data = validated_data.pop('services', None)
-        status_data = validated_data.pop('status', None)
+        """
+        Обновляет существующую доставку и связанные объекты.
+
+        Связанный объект ищется, только если он отличается от текущего;
+        услуги изменяются по разнице, UPDATE включает только изменившиеся поля.
+        """
+        changed = []
+        for name, model in (('transport_model', TransportModel), ('packaging', PackagingType), ('status', Status)):
+            data = validated_data.pop(name, None)
+            if data and any(getattr(getattr(instance, name), key) != value for key, value in data.items()):
+                setattr(instance, name, model.objects.get_or_create(**data)[0])
+                changed.append(name)
+
         courier_data = validated_data.pop('courier', None)
+        if courier_data and (
+            instance.courier is None
+            or any(getattr(instance.courier, key) != value for key, value in courier_data.items())
+        ):
+            instance.courier = User.objects.get(**courier_data)
+            changed.append('courier')
 
-        # Обработка ID полей для прямого обновления связанных объектов
-        transport_model_id = validated_data.pop('transport_model_id', None)
-        packaging_id = validated_data.pop('packaging_id', None)
-        service_ids = validated_data.pop('service_ids', None)
-        status_id = validated_data.pop('status_id', None)
-        courier_id = validated_data.pop('courier_id', None)
-
-        # Прямое обновление по ID имеет приоритет над обновлением через объекты
-        if transport_model_id:
-            try:
-                instance.transport_model = TransportModel.objects.get(id=transport_model_id)
-            except TransportModel.DoesNotExist:
-                pass
-        elif transport_model_data:
-            transport_model, _ = TransportModel.objects.get_or_create(**transport_model_data)
-            instance.transport_model = transport_model
-            
-        if packaging_id:
-            try:
-                instance.packaging = PackagingType.objects.get(id=packaging_id)
-            except PackagingType.DoesNotExist:
-                pass
-        elif packaging_data:
-            packaging, _ = PackagingType.objects.get_or_create(**packaging_data)
-            instance.packaging = packaging
-            
-        if status_id:
-            try:
-                print(f"Пытаемся найти статус с ID {status_id}")
-                status_obj = Status.objects.get(id=status_id)
-                print(f"Найден статус: {status_obj.id} - {status_obj.name}")
-                instance.status = status_obj
-            except Status.DoesNotExist:
-                print(f"Статус с ID {status_id} не найден")
-                pass
-        elif status_data:
-            status, _ = Status.objects.get_or_create(**status_data)
-            instance.status = status
-            
-        if courier_id:
-            try:
-                instance.courier = User.objects.get(id=courier_id) if courier_id else None
-            except User.DoesNotExist:
-                instance.courier = None
-        elif courier_data:
-            instance.courier = User.objects.get(**courier_data) if courier_data else None
-            
-        if service_ids:
-            instance.services.clear()
-            for service_id in service_ids:
-                try:
-                    service = Service.objects.get(id=service_id)
-                    instance.services.add(service)
-                except Service.DoesNotExist:
-                    pass
-        elif services_data:
-            instance.services.clear()
-            for service_data in services_data:
-                service, _ = Service.objects.get_or_create(**service_data)
-                instance.services.add(service)
-
-        print("Валидированные данные для обновления:", validated_data)
+        services_data = validated_data.pop('services', None)
 
-        for attr, value in validated_data.items():
-            print(f"Устанавливаем атрибут {attr} = {value}")
-            setattr(instance, attr, value)
+        logger.debug("Обновление доставки %s: %s", instance.pk, payload(validated_data))
 
-        print(f"Сохраняем доставку с ID={instance.id}, status={instance.status.id}")
-        instance.save()
-        print(f"Доставка сохранена, текущий статус: {instance.status.id} - {instance.status.name}")
+        for attr, value in validated_data.items():
+            if getattr(instance, attr) != value:
+                setattr(instance, attr, value)
+                changed.append(attr)
+
+        with transaction.atomic():
+            services_changed = False
+            if services_data:
+                service_ids = writes.service_ids_by_name(service['name'] for service in services_data)
+                services_changed = writes.set_services(instance, service_ids)
+            writes.save_changes(instance, changed, services_changed)
         return instance
@@ -0,0 +1,165 @@
+"""
+Сигналы моделей приложения доставки.
+Публикуют события изменения доставок в push-канал, пишут журнал
+изменений доставок, обновляют ячейки карты, сбрасывают кэш
+представлений доставок при изменении справочников и кэш аутентификации
+при изменении пользователей.
+"""
+
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import events, fragments, maps
+from .authentication import invalidate_cached_user
+from .models import Delivery, PackagingType, Service, Status, TransportModel
+from .push import delivery_event, publish_delivery_event
+
+# Точка на карте неизвестна: поля были отложены при загрузке
+UNKNOWN = object()
+
+# Имена в update_fields, от которых зависит точка на карте
+MAP_FIELDS = frozenset(maps.FIELDS) | {'courier'}
+
+# Поля курьера в представлении доставки
+COURIER_FIELDS = frozenset(('username', 'first_name', 'last_name'))
+
+
+def _snapshot(instance):
+    # __dict__ вместо атрибутов, чтобы не загружать отложенные поля (only/defer)
+    return instance.__dict__.get('courier_id'), instance.__dict__.get('status_id')
+
+
+def _map_point(instance):
+    if any(name not in instance.__dict__ for name in maps.FIELDS):
+        return UNKNOWN
+    return maps.point(instance.__dict__)
+
+
+def _load_map_point(instance):
+    # Одно чтение строки вместо загрузки каждого отложенного поля
+    if getattr(instance, '_map_state', UNKNOWN) is UNKNOWN:
+        values = Delivery.objects.filter(pk=instance.pk).values(*maps.FIELDS).first()
+        instance._map_state = maps.point(values) if values else None
+
+
+@receiver(post_init, sender=Delivery)
+def remember_delivery_state(sender, instance, **kwargs):
+    """Запоминает курьера, статус и точку доставки на карте при загрузке."""
+    instance._push_state = _snapshot(instance)
+    instance._map_state = _map_point(instance)
+
+
+@receiver(pre_save, sender=Delivery)
+def load_map_state(sender, instance, update_fields=None, **kwargs):
+    """Читает прежнюю точку доставки на карте, если ее поля были отложены."""
+    if instance._state.adding or (update_fields is not None and not MAP_FIELDS & set(update_fields)):
+        return
+    _load_map_point(instance)
+
+
+@receiver(post_save, sender=Delivery)
+def update_map_cells(sender, instance, created, update_fields=None, **kwargs):
+    """Переносит доставку между ячейками карты."""
+    if not created and update_fields is not None and not MAP_FIELDS & set(update_fields):
+        return
+    previous = None if created else getattr(instance, '_map_state', UNKNOWN)
+    if previous is UNKNOWN:
+        return
+    current = maps.point({name: getattr(instance, name) for name in maps.FIELDS})
+    maps.record_moves([(previous, current)])
+    instance._map_state = current
+
+
+@receiver(post_save, sender=Delivery)
+def publish_delivery_saved(sender, instance, created, **kwargs):
+    """Публикует событие создания или изменения доставки и записывает смену статуса и курьера в журнал."""
+    previous_courier_id, previous_status_id = getattr(instance, '_push_state', (None, None))
+    events.record(events.delivery_changes(
+        instance.pk,
+        {'status': previous_status_id, 'courier': previous_courier_id},
+        {'status': instance.status_id, 'courier': instance.courier_id},
+        created=created,
+    ))
+    if created:
+        op = 'created'
+        previous_courier_id, previous_status_id = instance.courier_id, instance.status_id
+    elif previous_courier_id != instance.courier_id:
+        op = 'assigned' if instance.courier_id is not None else 'unassigned'
+    elif previous_status_id != instance.status_id:
+        op = 'status'
+    else:
+        op = 'updated'
+
+    publish_delivery_event(delivery_event(op, instance, previous_courier_id, previous_status_id))
+    instance._push_state = _snapshot(instance)
+
+
+@receiver(pre_delete, sender=Delivery)
+def load_deleted_map_state(sender, instance, **kwargs):
+    """Читает точку удаляемой доставки на карте, пока строка есть в базе."""
+    _load_map_point(instance)
+
+
+@receiver(post_delete, sender=Delivery)
+def publish_delivery_deleted(sender, instance, **kwargs):
+    """Публикует событие удаления доставки и убирает ее с карты."""
+    maps.record_moves([(instance._map_state, None)])
+    publish_delivery_event(delivery_event('deleted', instance, instance.courier_id, instance.status_id))
+
+
+@receiver(pre_delete, sender=User)
+def release_courier_deliveries(sender, instance, **kwargs):
+    """
+    Возвращает доставки удаляемого курьера на карту.
+
+    Курьер снимается с доставок UPDATE-ом (on_delete=SET_NULL) в обход
+    сигналов доставок.
+    """
+    maps.record_moves(
+        (None, maps.point({**values, 'courier_id': None}))
+        for values in Delivery.objects.filter(courier=instance).values(*maps.FIELDS).iterator()
+    )
+
+
+@receiver(post_save, sender=TransportModel)
+@receiver(post_save, sender=PackagingType)
+@receiver(post_save, sender=Status)
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=TransportModel)
+@receiver(post_delete, sender=PackagingType)
+@receiver(post_delete, sender=Status)
+@receiver(post_delete, sender=Service)
+def invalidate_lookup_fragments(sender, instance, created=False, **kwargs):
+    """Переименование или удаление справочной записи сбрасывает представления доставок."""
+    # Новую запись еще не содержит ни одно представление
+    if not created:
+        fragments.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_courier_fragments(sender, instance, created=False, update_fields=None, **kwargs):
+    """Изменение имени или удаление пользователя сбрасывает представления доставок."""
+    if created or (update_fields is not None and not COURIER_FIELDS & set(update_fields)):
+        return
+    fragments.invalidate_all()
+
+
+@receiver(m2m_changed, sender=Delivery.services.through)
+def invalidate_services_fragments(sender, action, **kwargs):
+    """
+    Изменение набора услуг через менеджер связи сбрасывает представления доставок.
+
+    writes.set_services меняет промежуточную таблицу напрямую и увеличивает
+    версию доставки; сигнал приходит от admin и services.add()/set().
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        fragments.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_cache(sender, instance, **kwargs):
+    """Смена пароля, блокировка или удаление пользователя сбрасывают его кэш."""
+    invalidate_cached_user(instance.pk)
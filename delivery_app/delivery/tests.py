@@ -1,3 +1,1595 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import admin as delivery_admin, async_views, authentication, checks, concurrency, fragments, locations, log, maps, partitions, profiling, push, queries, search, throttling, tracks, writes
+from .db_router import ReplicaRouter
+from .fast_serializers import DeliveryReadSerializer
+from .fieldsets import DeliveryFieldset
+from .middleware import ReplicaRoutingMiddleware
+from .models import (
+    TransportModel, PackagingType, Service, Status, Delivery, DeliveryEvent, StatusDuration, CourierLocation,
+    MapCell, ProfileReport,
+)
+from .renderers import ORJSONRenderer
+from .serializers import DeliverySerializer
+from .views import AvailableDeliveriesView, DeliveryViewSet, MyHistoryDeliveriesView
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+
+class DeliveryReadSerializerParityTests(TestCase):
+    """Вывод DeliveryReadSerializer должен совпадать с DeliverySerializer байт в байт."""
+
+    @classmethod
+    def setUpTestData(cls):
+        transport_models = [TransportModel.objects.create(name=f'Модель {i}') for i in range(3)]
+        packagings = [PackagingType.objects.create(name=f'Упаковка {i}') for i in range(2)]
+        services = [Service.objects.create(name=f'Услуга «{i}»') for i in range(4)]
+        statuses = [
+            Status.objects.create(name='В ожидании', color='yellow'),
+            Status.objects.create(name='Доставлено', color='green'),
+        ]
+        couriers = [
+            User.objects.create_user('courier1', first_name='Иван', last_name='Петров'),
+            User.objects.create_user('courier2'),
+        ]
+        start = datetime(2025, 5, 10, 19, 41, 3, 123456, tzinfo=dt_timezone.utc)
+
+        for i in range(12):
+            delivery = Delivery.objects.create(
+                transport_model=transport_models[i % 3],
+                transport_number=f'А{i:03d}ВС',
+                start_time=start + timedelta(hours=i, microseconds=i * 999),
+                end_time=start + timedelta(hours=i + 2),
+                distance=[0, 1.5, 12.25, 1e-7][i % 4],
+                media_file=f'deliveries/2025/05/10/photo_{i}.jpg' if i % 3 == 0 else None,
+                packaging=packagings[i % 2],
+                status=statuses[i % 2],
+                technical_condition='Исправно' if i % 2 else 'Неисправно',
+                courier=couriers[i % 3] if i % 3 < 2 else None,
+                source_address='' if i % 4 == 0 else f'ул. Ленина, {i} ',
+                destination_address=f'пр. Мира, {i}',
+                source_lat=None if i % 5 == 0 else 55.75 + i / 100,
+                source_lon=None if i % 5 == 0 else 37.61 + i / 100,
+                dest_lat=55.7,
+                dest_lon=37.6,
+            )
+            delivery.services.set(services[:i % 5])
+
+    def assertParity(self, fieldset, queryset=None, request=None):
+        queryset = queryset if queryset is not None else Delivery.objects.order_by('id')
+        context = {'request': request} if request is not None else {}
+
+        expected = DeliverySerializer(
+            fieldset.apply(queryset), many=True, fieldset=fieldset, context=context
+        ).data
+        actual = DeliveryReadSerializer(fieldset, request=request).serialize(queryset)
+
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+        self.assertEqual(ORJSONRenderer().render(actual), ORJSONRenderer().render(expected))
+
+    def test_full_representation(self):
+        self.assertParity(DeliveryFieldset.full())
+
+    def test_full_representation_with_request(self):
+        request = APIRequestFactory().get('/api/deliveries/')
+        self.assertParity(DeliveryFieldset.full(), request=request)
+
+    def test_compact_representation(self):
+        self.assertParity(DeliveryFieldset())
+
+    def test_partial_expand(self):
+        self.assertParity(DeliveryFieldset(expand=['status', 'courier']))
+        self.assertParity(DeliveryFieldset(expand=['services', 'transport_model', 'packaging']))
+
+    def test_sparse_fields(self):
+        self.assertParity(DeliveryFieldset(fields=['source_lat', 'source_lon', 'dest_lat', 'dest_lon']))
+        self.assertParity(DeliveryFieldset(fields=['start_time', 'media_file', 'services'], expand=['services']))
+        self.assertParity(DeliveryFieldset(fields=['courier', 'status'], expand=['courier']))
+
+    def test_filtered_and_ordered_queryset(self):
+        queryset = Delivery.objects.filter(courier__isnull=True).order_by('-distance', 'id')
+        self.assertParity(DeliveryFieldset.full(), queryset=queryset)
+        queryset = Delivery.objects.filter(status__name='Доставлено').order_by('start_time')
+        self.assertParity(DeliveryFieldset.full(), queryset=queryset)
+
+    def test_empty_queryset(self):
+        self.assertParity(DeliveryFieldset.full(), queryset=Delivery.objects.none())
+
+    def test_query_count(self):
+        with self.assertNumQueries(2):
+            DeliveryReadSerializer().serialize(Delivery.objects.all())
+        with self.assertNumQueries(1):
+            DeliveryReadSerializer(DeliveryFieldset(fields=['status'])).serialize(Delivery.objects.all())
+
+
+class DeliveryQueryPlanTests(TestCase):
+    """Запросы эндпоинтов не должны читать таблицу доставок последовательным сканированием."""
+
+    # Таблица доставок и ее секции (PostgreSQL), но не delivery_delivery_services
+    DELIVERY_RELATION = re.compile(r'^delivery_delivery(_y\d{4}m\d{2}|_default)?$')
+
+    # Прошедшие месяцы с секциями, созданными тестом
+    SEED_MONTHS = [datetime(2024, 1, 1, tzinfo=dt_timezone.utc), datetime(2024, 2, 1, tzinfo=dt_timezone.utc)]
+
+    @classmethod
+    def setUpTestData(cls):
+        transport_model = TransportModel.objects.create(name='Модель')
+        packaging = PackagingType.objects.create(name='Упаковка')
+        cls.pending = Status.objects.create(name=queries.PENDING_STATUS_NAME)
+        delivered = Status.objects.create(name=queries.DELIVERED_STATUS_NAME)
+        in_progress = Status.objects.create(name='В пути')
+        cls.couriers = [User.objects.create_user(f'plan_courier_{i}') for i in range(50)]
+        # Доставки поровну в секциях месяцев SEED_MONTHS, а не в секции по умолчанию
+        if partitions.is_partitioned():
+            for month in cls.SEED_MONTHS:
+                partitions.create_partition(month)
+
+        deliveries = []
+        for i in range(5000):
+            # Около 1% доставок ждут курьера, как в рабочей базе
+            unassigned = i % 100 == 0
+            start = cls.SEED_MONTHS[i % len(cls.SEED_MONTHS)] + timedelta(minutes=i * 5)
+            deliveries.append(Delivery(
+                transport_model=transport_model,
+                transport_number=f'П{i:05d}',
+                start_time=start,
+                end_time=start + timedelta(hours=2),
+                distance=i % 50 + 0.5,
+                packaging=packaging,
+                status=cls.pending if unassigned else (delivered if i % 3 else in_progress),
+                technical_condition='Исправно',
+                courier=None if unassigned else cls.couriers[i % 50],
+                source_lat=55.7, source_lon=37.6, dest_lat=55.8, dest_lon=37.7,
+            ))
+        Delivery.objects.bulk_create(deliveries)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def endpoint_queries(self):
+        courier = self.couriers[7]
+        delivery_id = Delivery.objects.filter(courier=courier).values_list('id', flat=True).first()
+        return {
+            'available': queries.available_deliveries(self.pending, {}),
+            'available max_distance': queries.available_deliveries(self.pending, {'max_distance': '10'}),
+            'available sort distance': queries.available_deliveries(
+                self.pending, {'max_distance': '10', 'sort_by': 'distance'}
+            ),
+            'available sort -start_time': queries.available_deliveries(self.pending, {'sort_by': '-start_time'}),
+            'my active': queries.my_active_deliveries(courier),
+            'my history': queries.my_history_deliveries(courier),
+            'coordinates': queries.unassigned_coordinates(),
+            'profile total': Delivery.objects.filter(courier=courier),
+            'retrieve': Delivery.objects.filter(pk=delivery_id),
+        }
+
+    def seq_scanned_relations(self, queryset):
+        """Таблицы доставок (с данными), которые план читает последовательно."""
+        if connection.vendor == 'postgresql':
+            nodes = [json.loads(queryset.explain(format='json'))[0]['Plan']]
+            relations = set()
+            while nodes:
+                node = nodes.pop()
+                nodes.extend(node.get('Plans', []))
+                if node['Node Type'] == 'Seq Scan' and self.DELIVERY_RELATION.match(node['Relation Name']):
+                    relations.add(node['Relation Name'])
+            # Пустые секции планировщик честно читает последовательно
+            with connection.cursor() as cursor:
+                for relation in list(relations):
+                    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {connection.ops.quote_name(relation)})')
+                    if not cursor.fetchone()[0]:
+                        relations.discard(relation)
+            return relations
+        # SQLite: "SCAN таблица" без индекса - полный просмотр
+        return set(re.findall(r'\bSCAN (delivery_delivery)(?: AS \w+)?$', queryset.explain(), re.MULTILINE))
+
+    def test_no_sequential_scans(self):
+        if connection.vendor not in ('postgresql', 'sqlite'):
+            self.skipTest("Разбор плана реализован для PostgreSQL и SQLite")
+        if partitions.is_partitioned():
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT count(*) FROM {partitions.DEFAULT_PARTITION}')
+                self.assertEqual(cursor.fetchone()[0], 0)
+        for name, queryset in self.endpoint_queries().items():
+            with self.subTest(name):
+                self.assertEqual(self.seq_scanned_relations(queryset), set(), queryset.explain())
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False)
+class DeliveryWriteQueryCountTests(TestCase):
+    """Число запросов записи доставки не должно зависеть от числа услуг."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.transport_models = [TransportModel.objects.create(name=f'Модель {i}') for i in range(2)]
+        cls.packaging = PackagingType.objects.create(name='Коробка')
+        cls.status = Status.objects.create(name='В ожидании', color='yellow')
+        cls.services = [Service.objects.create(name=f'Услуга {i}') for i in range(8)]
+        cls.user = User.objects.create_user('dispatcher')
+        cls.delivery = Delivery.objects.create(
+            transport_model=cls.transport_models[0],
+            transport_number='А001ВС',
+            start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+            end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+            distance=5,
+            packaging=cls.packaging,
+            status=cls.status,
+            technical_condition='Исправно',
+        )
+        cls.delivery.services.set(cls.services[:2])
+
+    def setUp(self):
+        # SQLite повторяет ID после отката теста: представления прошлых тестов не должны читаться
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def service_ids(self, count):
+        return [service.pk for service in self.services[:count]]
+
+    def count_queries(self, method, url, data):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        return len(context), response
+
+    def test_set_services_unchanged(self):
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        with self.assertNumQueries(2):
+            self.assertFalse(writes.set_services(delivery, writes.existing_service_ids(self.service_ids(2))))
+
+    def test_set_services_diff(self):
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        # Текущий набор, вставка недостающих, удаление лишних
+        with self.assertNumQueries(3):
+            self.assertTrue(writes.set_services(delivery, [self.services[1].pk, self.services[2].pk]))
+        self.assertEqual(
+            sorted(delivery.services.values_list('pk', flat=True)),
+            [self.services[1].pk, self.services[2].pk]
+        )
+
+    def test_save_changes_updates_only_changed_fields(self):
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(writes.save_changes(delivery, writes.set_fields(delivery, {'distance': '5'})))
+
+        changed = writes.set_fields(delivery, {'distance': '7.5', 'transport_number': 'А001ВС'})
+        self.assertEqual(changed, ['distance'])
+        with CaptureQueriesContext(connection) as context:
+            writes.save_changes(delivery, changed)
+        (update,) = context.captured_queries
+        self.assertIn('"distance"', update['sql'])
+        self.assertNotIn('"transport_number"', update['sql'])
+        self.assertEqual(delivery.version, 2)
+
+    def test_update_all_query_count(self):
+        url = f'/api/deliveries/{self.delivery.pk}/update_all/'
+        few, _ = self.count_queries('patch', url, {
+            'transport_model_id': self.transport_models[1].pk, 'service_ids': self.service_ids(4),
+        })
+        many, response = self.count_queries('patch', url, {
+            'transport_model_id': self.transport_models[0].pk, 'service_ids': self.service_ids(8),
+        })
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.json()['services']), 8)
+
+    def test_create_simple_query_count(self):
+        url = '/api/deliveries/create_simple/'
+        data = {
+            'transport_model_id': self.transport_models[0].pk,
+            'packaging_id': self.packaging.pk,
+            'status_id': self.status.pk,
+            'start_time': '2025-05-11T10:00:00Z',
+            'end_time': '2025-05-11T12:00:00Z',
+        }
+        few, _ = self.count_queries('post', url, {**data, 'service_ids': self.service_ids(1)})
+        many, response = self.count_queries('post', url, {**data, 'service_ids': self.service_ids(8)})
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.json()['services']), 8)
+
+    def test_create_simple_unknown_related(self):
+        response = self.client.post('/api/deliveries/create_simple/', {
+            'transport_model_id': 999999,
+            'packaging_id': self.packaging.pk,
+            'status_id': self.status.pk,
+            'start_time': '2025-05-11T10:00:00Z',
+            'end_time': '2025-05-11T12:00:00Z',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Delivery.objects.filter(start_time='2025-05-11T10:00:00Z').exists())
+
+    def test_serializer_update_query_count(self):
+        def update(names):
+            delivery = Delivery.objects.select_related(*writes.RELATED_MODELS).get(pk=self.delivery.pk)
+            serializer = DeliverySerializer(delivery, data={
+                'services': [{'name': name} for name in names],
+                'distance': 9,
+            }, partial=True)
+            serializer.is_valid(raise_exception=True)
+            with CaptureQueriesContext(connection) as context:
+                serializer.save()
+            return len(context)
+
+        self.assertEqual(update(['Новая 1', 'Новая 2']), update([f'Другая {i}' for i in range(8)]))
+        self.assertEqual(self.delivery.services.count(), 8)
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class DeliveryVersionTests(TestCase):
+    """Изменение устаревшей версии доставки - конфликт 409, а не перезапись."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.transport_model = TransportModel.objects.create(name='Модель')
+        cls.packaging = PackagingType.objects.create(name='Коробка')
+        cls.pending = Status.objects.create(name='В ожидании', color='yellow')
+        cls.delivered = Status.objects.create(name='Доставлено', color='green')
+        cls.user = User.objects.create_user('dispatcher')
+        cls.delivery = Delivery.objects.create(
+            transport_model=cls.transport_model,
+            transport_number='А001ВС',
+            start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+            end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+            distance=5,
+            packaging=cls.packaging,
+            status=cls.pending,
+            technical_condition='Исправно',
+            courier=cls.user,
+        )
+        # Версия 2: клиент, видевший версию 1, опоздал
+        Delivery.objects.filter(pk=cls.delivery.pk).update(version=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/deliveries/{self.delivery.pk}/'
+
+    def requests(self, data):
+        """Изменяющие запросы доставки: (имя, метод, URL, данные, формат)."""
+        return [
+            ('update', 'patch', self.url, {**data, 'distance': 9}, 'json'),
+            ('update_all', 'patch', f'{self.url}update_all/', {**data, 'distance': 9}, 'json'),
+            ('update_status', 'patch', f'{self.url}update_status/', {**data, 'status_id': self.delivered.pk}, 'json'),
+            ('assign', 'patch', f'{self.url}assign/', data, 'json'),
+            ('unassign', 'patch', f'{self.url}unassign/', data, 'json'),
+            ('media', 'post', f'{self.url}media/', data, 'multipart'),
+        ]
+
+    def assert_conflict(self, response):
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(response.json()['current']['version'], 2)
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        self.assertEqual((delivery.version, delivery.distance, delivery.status_id), (2, 5, self.pending.pk))
+
+    def test_stale_if_match(self):
+        for name, method, url, data, data_format in self.requests({}):
+            with self.subTest(name):
+                response = getattr(self.client, method)(url, data, format=data_format, HTTP_IF_MATCH='"1"')
+                self.assert_conflict(response)
+
+    def test_stale_body_version(self):
+        for name, method, url, data, data_format in self.requests({'version': 1}):
+            with self.subTest(name):
+                self.assert_conflict(getattr(self.client, method)(url, data, format=data_format))
+
+    def test_stale_sync(self):
+        response = self.client.post('/api/deliveries/sync/', {'changes': [
+            {'id': 'c1', 'action': 'update', 'data': {'id': self.delivery.pk, 'version': 1, 'distance': 9}},
+        ]}, format='json')
+        (result,) = response.json()
+        self.assertEqual(result['status'], 'conflict')
+        self.assertEqual(result['data']['version'], 2)
+        self.assertEqual(Delivery.objects.get(pk=self.delivery.pk).distance, 5)
+
+    def test_stale_delete(self):
+        response = self.client.delete(self.url, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertTrue(Delivery.objects.filter(pk=self.delivery.pk).exists())
+
+        self.assertEqual(self.client.delete(self.url, HTTP_IF_MATCH='"2"').status_code, 204)
+        self.assertFalse(Delivery.objects.filter(pk=self.delivery.pk).exists())
+
+    def test_concurrent_change_between_load_and_save(self):
+        check_version = Delivery.check_version
+
+        def change_concurrently(delivery, expected):
+            check_version(delivery, expected)
+            # Другой запрос успел сохранить доставку после ее загрузки
+            Delivery.objects.filter(pk=delivery.pk).update(version=F('version') + 1, distance=7)
+
+        with mock.patch.object(Delivery, 'check_version', change_concurrently):
+            response = self.client.patch(
+                f'{self.url}update_status/', {'status_id': self.delivered.pk}, format='json', HTTP_IF_MATCH='"2"'
+            )
+        self.assertEqual(response.status_code, 409, response.content)
+        self.assertEqual(response['ETag'], '"3"')
+        delivery = Delivery.objects.get(pk=self.delivery.pk)
+        # Ни перезаписи чужого изменения, ни INSERT новой строки
+        self.assertEqual((delivery.version, delivery.distance, delivery.status_id), (3, 7, self.pending.pk))
+        self.assertEqual(Delivery.objects.count(), 1)
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_weak_etag_after_compression(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"2"')
+
+        response = self.client.patch(
+            f'{self.url}update_status/', {'status_id': self.delivered.pk}, format='json',
+            HTTP_IF_MATCH=response['ETag'],
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Delivery.objects.get(pk=self.delivery.pk).version, 3)
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False)
+class DeliveryBulkCreateTests(TestCase):
+    """Пакетное создание: справочники одним upsert, результат по каждому элементу."""
+
+    URL = '/api/deliveries/bulk/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.status = Status.objects.create(name='В ожидании', color='yellow')
+        cls.service = Service.objects.create(name='Погрузка')
+        cls.courier = User.objects.create_user('courier')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.courier)
+
+    def item(self, i, **overrides):
+        return {
+            'transport_model': {'name': f'Модель {i % 3}'},
+            'packaging': {'name': 'Коробка'},
+            'status': {'name': 'В ожидании', 'color': 'red'},
+            'services': [{'name': 'Погрузка'}, {'name': f'Услуга {i % 2}'}],
+            'transport_number': f'Б{i:03d}ВС',
+            'start_time': '2025-05-11T10:00:00Z',
+            'end_time': '2025-05-11T12:00:00Z',
+            'distance': i,
+            'technical_condition': 'Исправно',
+            **overrides,
+        }
+
+    def post(self, items):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.URL, {'deliveries': items}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json(), len(context)
+
+    def test_results_per_item(self):
+        results, _ = self.post([
+            self.item(0, courier_id=self.courier.pk),
+            self.item(1, distance='далеко'),
+            self.item(2, courier_id=999999),
+            self.item(3),
+        ])
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'error', 'created'])
+        self.assertIn('distance', results[1]['error'])
+
+        first = Delivery.objects.get(pk=results[0]['id'])
+        self.assertEqual(first.courier_id, self.courier.pk)
+        self.assertEqual(first.status_id, self.status.pk)
+        self.assertEqual(first.version, 1)
+        self.assertEqual(
+            sorted(first.services.values_list('name', flat=True)), ['Погрузка', 'Услуга 0']
+        )
+        # Существующий статус не перезаписывается цветом из запроса
+        self.assertEqual(Status.objects.get().color, 'yellow')
+        self.assertEqual(Service.objects.filter(name='Погрузка').count(), 1)
+
+    def test_query_count_does_not_grow(self):
+        _, few = self.post([self.item(i) for i in range(3)])
+        _, many = self.post([self.item(i) for i in range(40)])
+        self.assertEqual(few, many)
+        self.assertEqual(Delivery.objects.count(), 43)
+
+    @override_settings(DELIVERY_BULK_MAX_ITEMS=2)
+    def test_too_many_items(self):
+        response = self.client.post(self.URL, {'deliveries': [self.item(i) for i in range(3)]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Delivery.objects.exists())
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class DeliveryEventLogTests(TestCase):
+    """Журнал изменений и дневные суммы времени в статусах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pending = Status.objects.create(name='В ожидании', color='yellow')
+        cls.in_transit = Status.objects.create(name='В пути', color='blue')
+        cls.delivered = Status.objects.create(name='Доставлено', color='green')
+        cls.user = User.objects.create_user('dispatcher')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.delivery = Delivery.objects.create(
+                transport_model=TransportModel.objects.create(name='Модель'),
+                transport_number='В001ВС',
+                start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+                end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+                distance=5,
+                packaging=PackagingType.objects.create(name='Коробка'),
+                status=self.pending,
+                technical_condition='Исправно',
+            )
+
+    def set_status(self, status_obj, hours_in_previous):
+        # Время входа в текущий статус сдвигается назад вместо ожидания
+        DeliveryEvent.objects.filter(delivery=self.delivery, field='status').update(
+            created_at=F('created_at') - timedelta(hours=hours_in_previous)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/deliveries/{self.delivery.pk}/update-status/', {'status_id': status_obj.pk}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_history(self):
+        self.set_status(self.in_transit, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/deliveries/{self.delivery.pk}/assign/', {'courier_id': self.user.pk}, format='json'
+            )
+
+        history = self.client.get(f'/api/deliveries/{self.delivery.pk}/history/').json()
+        self.assertEqual(
+            [(event['field'], event['old_value'], event['new_value'], event['user']) for event in history],
+            [
+                ('status', None, str(self.pending.pk), None),
+                ('status', str(self.pending.pk), str(self.in_transit.pk), self.user.pk),
+                ('courier', None, str(self.user.pk), self.user.pk),
+            ]
+        )
+        self.assertEqual(self.client.get('/api/deliveries/999999/history/').status_code, 404)
+
+    def test_status_durations(self):
+        self.set_status(self.in_transit, 2)
+        self.set_status(self.delivered, 3)
+
+        durations = {row.status_id: row for row in StatusDuration.objects.all()}
+        self.assertEqual(durations[self.pending.pk].entries, 1)
+        self.assertEqual(durations[self.pending.pk].exits, 1)
+        self.assertAlmostEqual(durations[self.pending.pk].total_seconds, 2 * 3600, delta=60)
+        self.assertAlmostEqual(durations[self.in_transit.pk].total_seconds, 3 * 3600, delta=60)
+        self.assertEqual(durations[self.delivered.pk].exits, 0)
+
+        report = {row['status']: row for row in self.client.get('/api/reports/status-durations/').json()}
+        self.assertAlmostEqual(report[self.in_transit.pk]['avg_seconds'], 3 * 3600, delta=60)
+        self.assertIsNone(report[self.delivered.pk]['avg_seconds'])
+
+    def test_events_written_once_per_transaction(self):
+        with CaptureQueriesContext(connection) as context:
+            with self.captureOnCommitCallbacks(execute=True):
+                writes.create_deliveries([{
+                    'transport_model': {'name': 'Модель'},
+                    'packaging': {'name': 'Коробка'},
+                    'status': {'name': 'В ожидании'},
+                    'transport_number': f'Г{i:03d}ВС',
+                    'start_time': datetime(2025, 5, 11, 10, tzinfo=dt_timezone.utc),
+                    'end_time': datetime(2025, 5, 11, 12, tzinfo=dt_timezone.utc),
+                    'distance': i,
+                    'technical_condition': 'Исправно',
+                } for i in range(20)])
+        inserts = [query['sql'] for query in context.captured_queries if 'delivery_deliveryevent' in query['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(StatusDuration.objects.get(status=self.pending).entries, 21)
+
+
+@override_settings(
+    THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False,
+    LOCATION_FLUSH_SIZE=1, LOCATION_MIN_INTERVAL=5, LOCATION_MIN_DISTANCE=10,
+)
+class CourierLocationIngestTests(TestCase):
+    """Прием GPS-точек: разбор, прореживание и пакетная запись."""
+
+    URL = '/api/locations/'
+
+    def setUp(self):
+        # Буфер и прореживание создаются по настройкам при первом обращении
+        locations._buffer = None
+        locations._downsampler = None
+        self.courier = User.objects.create_user('courier')
+        self.client = APIClient()
+        self.client.force_authenticate(self.courier)
+        self.now = time.time()
+
+    def test_json_fixes_are_downsampled(self):
+        fixes = [{'t': self.now - 60 + i, 'lat': 55.75, 'lon': 37.61 + i * 1e-6} for i in range(5)]
+        fixes.append({'t': self.now, 'lat': 55.76, 'lon': 37.62, 'acc': 4.5})
+        fixes.append({'t': self.now, 'lat': 'север'})
+        response = self.client.post(self.URL, fixes, format='json')
+
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json(), {'received': 7, 'queued': 2, 'downsampled': 4, 'rejected': 1})
+        self.assertEqual(
+            list(CourierLocation.objects.order_by('recorded_at').values_list('lat', 'accuracy')),
+            [(55.75, None), (55.76, 4.5)]
+        )
+        self.assertTrue(all(location.courier_id == self.courier.pk for location in CourierLocation.objects.all()))
+
+    def delivery(self, courier):
+        return Delivery.objects.create(
+            transport_model=TransportModel.objects.get_or_create(name='Модель')[0],
+            transport_number='Д001ВС',
+            start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+            end_time=datetime(2025, 5, 10, 11, tzinfo=dt_timezone.utc),
+            distance=5,
+            packaging=PackagingType.objects.get_or_create(name='Коробка')[0],
+            status=Status.objects.get_or_create(name='В пути', defaults={'color': 'blue'})[0],
+            technical_condition='Исправно',
+            courier=courier,
+        )
+
+    def test_binary_fixes(self):
+        delivery = self.delivery(self.courier)
+        body = b''.join(
+            locations.FIX.pack(self.now - 30 + i * 10, 557512345 + i * 1000, 376154321, 35, delivery.pk)
+            for i in range(3)
+        )
+        response = self.client.generic('POST', self.URL, body, content_type=locations.MEDIA_TYPE)
+
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['queued'], 3)
+        first = CourierLocation.objects.order_by('recorded_at').first()
+        self.assertAlmostEqual(first.lat, 55.7512345)
+        self.assertEqual(first.accuracy, 3.5)
+        self.assertEqual(first.delivery_id, delivery.pk)
+
+    def test_foreign_delivery_fixes_are_rejected(self):
+        own = self.delivery(self.courier)
+        foreign = self.delivery(User.objects.create_user('other'))
+        fixes = [
+            {'t': self.now - 20, 'lat': 55.75, 'lon': 37.61, 'delivery_id': own.pk},
+            {'t': self.now - 10, 'lat': 55.76, 'lon': 37.61, 'delivery_id': foreign.pk},
+            {'t': self.now, 'lat': 55.77, 'lon': 37.61, 'delivery_id': foreign.pk + 1000},
+        ]
+        response = self.client.post(self.URL, fixes, format='json')
+
+        self.assertEqual(response.json(), {'received': 3, 'queued': 1, 'downsampled': 0, 'rejected': 2})
+        self.assertEqual(list(CourierLocation.objects.values_list('delivery_id', flat=True)), [own.pk])
+
+    def test_retransmitted_fixes_are_dropped(self):
+        fixes = [{'t': self.now - 20 + i * 10, 'lat': 55.75 + i / 100, 'lon': 37.61} for i in range(2)]
+        self.client.post(self.URL, fixes, format='json')
+        response = self.client.post(self.URL, fixes, format='json')
+        self.assertEqual(response.json()['queued'], 0)
+        self.assertEqual(CourierLocation.objects.count(), 2)
+
+    def test_flush_errors(self):
+        buffer = locations.LocationBuffer(flush_size=10, flush_interval=3600)
+        fixes = [locations.Fix(self.now, 55.75, 37.61, None, None)]
+        # Недоступная база - точки теряются, ошибка в коде пробрасывается
+        with mock.patch.object(locations, 'write_rows', side_effect=OperationalError):
+            buffer.add(self.courier.pk, fixes)
+            self.assertEqual(buffer.flush(), 0)
+        with mock.patch.object(locations, 'write_rows', side_effect=TypeError):
+            buffer.add(self.courier.pk, fixes)
+            with self.assertRaises(TypeError):
+                buffer.flush()
+
+    @override_settings(LOCATION_MAX_BATCH=2)
+    def test_batch_limit(self):
+        fixes = [{'t': self.now, 'lat': 55.75, 'lon': 37.61}] * 3
+        self.assertEqual(self.client.post(self.URL, fixes, format='json').status_code, 400)
+
+
+class TrackSimplificationTests(TestCase):
+    """Упрощение и кодирование треков."""
+
+    def test_encode_polyline(self):
+        # Пример из описания формата Google
+        self.assertEqual(
+            tracks.encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453]),
+            '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+        )
+
+    def test_douglas_peucker(self):
+        x = np.linspace(0, 1000, 101)
+        straight = np.column_stack((x, np.where(np.arange(101) % 2, 0.5, -0.5)))
+        self.assertEqual(tracks.douglas_peucker(straight, 2).tolist(), [0, 100])
+
+        # Разворот назад сохраняется, хотя лежит на той же прямой
+        there_and_back = np.array([[0, 0], [500, 0], [1000, 0], [400, 0]], dtype=float)
+        self.assertEqual(tracks.douglas_peucker(there_and_back, 2).tolist(), [0, 2, 3])
+        self.assertEqual(tracks.douglas_peucker(straight, 0).tolist(), list(range(101)))
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class TrackEndpointTests(TestCase):
+    """Треки доставки и курьера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.courier = User.objects.create_user('courier')
+        cls.delivered = Status.objects.create(name=queries.DELIVERED_STATUS_NAME, color='green')
+        cls.start = datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc)
+        cls.delivery = Delivery.objects.create(
+            transport_model=TransportModel.objects.create(name='Модель'),
+            transport_number='Д001ВС',
+            start_time=cls.start,
+            end_time=cls.start + timedelta(hours=1),
+            distance=5,
+            packaging=PackagingType.objects.create(name='Коробка'),
+            status=cls.delivered,
+            technical_condition='Исправно',
+            courier=cls.courier,
+        )
+        # Прямая на север с одним поворотом на восток
+        CourierLocation.objects.bulk_create(
+            [CourierLocation(
+                courier=cls.courier, delivery=cls.delivery, recorded_at=cls.start + timedelta(seconds=10 * i),
+                lat=55.75 + i * 1e-4, lon=37.61,
+            ) for i in range(50)]
+            + [CourierLocation(
+                courier=cls.courier, delivery=cls.delivery, recorded_at=cls.start + timedelta(seconds=500 + 10 * i),
+                lat=55.7549, lon=37.61 + i * 1e-4,
+            ) for i in range(1, 50)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.courier)
+
+    def test_delivery_track_is_simplified_and_cached(self):
+        url = f'/api/deliveries/{self.delivery.pk}/track/'
+        raw = self.client.get(url).json()
+        self.assertEqual((raw['points'], raw['simplified']), (99, 99))
+
+        track = self.client.get(url, {'zoom': 15}).json()
+        self.assertEqual(track['points'], 99)
+        self.assertEqual(track['simplified'], 3)
+        self.assertEqual(track['times'], [0, 490, 990])
+
+        # Трек завершенной доставки берется из кэша
+        CourierLocation.objects.all().delete()
+        self.assertEqual(self.client.get(url, {'zoom': 15}).json(), track)
+
+    def test_courier_track_window(self):
+        url = f'/api/couriers/{self.courier.pk}/track/'
+        track = self.client.get(url, {
+            'from': self.start.isoformat(), 'to': (self.start + timedelta(seconds=495)).isoformat(), 'zoom': 10,
+        }).json()
+        self.assertEqual((track['points'], track['simplified']), (50, 2))
+
+        response = self.client.get(url, {
+            'from': self.start.isoformat(), 'to': (self.start + timedelta(days=2)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_courier_track_access(self):
+        url = f'/api/couriers/{self.courier.pk}/track/'
+        self.client.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(User.objects.create_user('dispatcher', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_delivery_track_access(self):
+        url = f'/api/deliveries/{self.delivery.pk}/track/'
+        self.client.force_authenticate(User.objects.create_user('other'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_authenticate(User.objects.create_user('dispatcher', is_staff=True))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class MapClusterTests(TestCase):
+    """Кластеры доставок на карте из счетчиков ячеек."""
+
+    # Москва и Санкт-Петербург
+    POINTS = [(55.75, 37.61), (55.76, 37.62), (55.74, 37.60), (59.93, 30.31)]
+    BBOX = '20,50,45,62'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('dispatcher')
+        cls.status = Status.objects.create(name='В ожидании', color='yellow')
+        cls.transport_model = TransportModel.objects.create(name='Модель')
+        cls.packaging = PackagingType.objects.create(name='Коробка')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deliveries = [Delivery.objects.create(
+                transport_model=self.transport_model,
+                transport_number=f'К{i:03d}ВС',
+                start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+                end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+                distance=5,
+                packaging=self.packaging,
+                status=self.status,
+                technical_condition='Исправно',
+                source_lat=lat, source_lon=lon, dest_lat=lat + 0.01, dest_lon=lon + 0.01,
+            ) for i, (lat, lon) in enumerate(self.POINTS)]
+
+    def clusters(self, zoom, bbox=BBOX):
+        response = self.client.get('/api/deliveries/coordinates/', {'bbox': bbox, 'zoom': zoom})
+        self.assertEqual(response.status_code, 200, response.content)
+        return sorted((cluster['count'], cluster['lat'], cluster['lon']) for cluster in response.json())
+
+    def cell_counts(self):
+        return {
+            (level, x, y): count
+            for level, x, y, count in MapCell.objects.filter(count__gt=0).values_list('level', 'x', 'y', 'count')
+        }
+
+    def test_clusters_follow_changes(self):
+        self.assertEqual(self.clusters(2), [(1, 59.93, 30.31), (3, 55.75, 37.61)])
+        self.assertEqual([count for count, _, _ in self.clusters(14, '37.5,55.7,37.7,55.8')], [1, 1, 1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/deliveries/{self.deliveries[0].pk}/assign/', {'courier_id': self.user.pk}, format='json'
+            )
+            self.deliveries[3].delete()
+        self.assertEqual(self.clusters(2), [(2, 55.75, 37.61)])
+
+        # Пересчет дает те же счетчики, что и приращения
+        incremental = self.cell_counts()
+        maps.rebuild()
+        self.assertEqual(self.cell_counts(), incremental)
+
+    def test_deferred_fields_are_read_before_save(self):
+        delivery = Delivery.objects.only('id', 'version').get(pk=self.deliveries[1].pk)
+        delivery.courier = self.user
+        with self.captureOnCommitCallbacks(execute=True):
+            delivery.save(update_fields=['courier'])
+        self.assertEqual(self.clusters(2), [(1, 59.93, 30.31), (2, 55.745, 37.605)])
+
+    def test_window_validation(self):
+        url = '/api/deliveries/coordinates/'
+        self.assertEqual(self.client.get(url, {'zoom': 5}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'bbox': self.BBOX, 'zoom': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'bbox': '-180,-85,180,85', 'zoom': 18}).status_code, 400)
+        # Без окна - прежний список координат
+        self.assertEqual(len(self.client.get(url).json()), 4)
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class DeliveryFragmentCacheTests(TestCase):
+    """Представления доставок из кэша и их сброс."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('dispatcher')
+        cls.pending = Status.objects.create(name=queries.PENDING_STATUS_NAME, color='yellow')
+        cls.in_transit = Status.objects.create(name='В пути', color='blue')
+        cls.service = Service.objects.create(name='Хрупкое')
+        transport_model = TransportModel.objects.create(name='Модель')
+        packaging = PackagingType.objects.create(name='Коробка')
+        cls.deliveries = [Delivery.objects.create(
+            transport_model=transport_model,
+            transport_number=f'Ф{i:03d}ВС',
+            start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+            end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+            distance=i,
+            packaging=packaging,
+            status=cls.pending,
+            technical_condition='Исправно',
+        ) for i in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def available(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.get('/api/deliveries/available/', {'sort_by': 'distance'})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list_assembled_from_cache(self):
+        first = self.available()
+        self.assertEqual(
+            first.json(),
+            DeliveryReadSerializer().serialize(queries.available_deliveries(self.pending, {'sort_by': 'distance'}))
+        )
+        # Статус и версии доставок; представления - из кэша
+        with self.assertNumQueries(2):
+            second = self.available()
+        self.assertEqual(second.content, first.content)
+
+    def test_invalidation(self):
+        self.available()
+        delivery = self.deliveries[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f'/api/deliveries/{delivery.pk}/update-status/', {'status_id': self.in_transit.pk}, format='json'
+            )
+        self.assertEqual(len(self.available().json()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pending.color = 'orange'
+            self.pending.save()
+        self.assertEqual({item['status']['color'] for item in self.available().json()}, {'orange'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deliveries[0].services.add(self.service)
+        self.assertEqual(self.available().json()[0]['services'], [{'id': self.service.pk, 'name': 'Хрупкое'}])
+
+    def test_tiers(self):
+        # Кэш процесса в роли общего - один уровень
+        self.assertEqual(fragments._tiers(), (caches['default'],))
+        local = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'delivery-fragments'}
+        for backend, count in (('db.DatabaseCache', 2), ('dummy.DummyCache', 1)):
+            shared = {'BACKEND': f'django.core.cache.backends.{backend}', 'LOCATION': 'cache'}
+            with self.subTest(backend), override_settings(CACHES={'default': shared, 'delivery_fragments': local}):
+                self.assertEqual(len(fragments._tiers()), count)
+
+    def test_generation_is_per_process_without_shared_cache(self):
+        other_process = LocMemCache('other-process', {})
+        with mock.patch.object(fragments, '_shared', return_value=other_process):
+            self.available()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pending.color = 'orange'
+            self.pending.save()
+        self.assertEqual({item['status']['color'] for item in self.available().json()}, {'orange'})
+        # Другой процесс отдает прежнее представление до истечения времени жизни
+        with mock.patch.object(fragments, '_shared', return_value=other_process):
+            self.assertEqual({item['status']['color'] for item in self.available().json()}, {'yellow'})
+
+    def test_retrieve_and_post_write_responses(self):
+        delivery = self.deliveries[2]
+        url = f'/api/deliveries/{delivery.pk}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'{url}assign/', {}, format='json')
+        self.assertEqual(response['ETag'], '"2"')
+        self.assertEqual(response.json()['courier']['id'], self.user.pk)
+
+        # Ответ на изменение уже в кэше под новой версией
+        with self.assertNumQueries(1):
+            retrieved = self.client.get(url)
+        self.assertEqual(retrieved.content, response.content)
+        self.assertEqual(retrieved['ETag'], '"2"')
+
+        sparse = self.client.get(url, {'fields': 'id,status', 'expand': 'status'}).json()
+        self.assertEqual(sparse, {
+            'id': delivery.pk, 'status': {'id': self.pending.pk, 'name': self.pending.name, 'color': 'yellow'},
+        })
+        self.assertEqual(self.client.get('/api/deliveries/999999/').status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], REPLICA_PIN_SECONDS=60)
+class ReplicaRoutingTests(TestCase):
+    """Чтение с реплики: только помеченные эндпоинты и не сразу после записи пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('courier')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(lambda request: HttpResponse())
+        self.token = str(AccessToken.for_user(self.user))
+
+    def read_database(self, view, method='get', authorized=True):
+        """База, из которой представление читало бы доставки."""
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'} if authorized else {}
+        request = getattr(self.factory, method)('/', **headers)
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, view, (), {})
+        database = ReplicaRouter().db_for_read(Delivery)
+        self.middleware.process_response(request, HttpResponse())
+        return database
+
+    def test_marked_endpoints_read_replica(self):
+        for view in (
+            MyHistoryDeliveriesView.as_view(),
+            DeliveryViewSet.as_view({'get': 'search'}),
+            async_views.my_history_deliveries,
+        ):
+            with self.subTest(view.__name__):
+                self.assertEqual(self.read_database(view), 'replica_0')
+        # После запроса чтение снова идет в основную базу
+        self.assertEqual(ReplicaRouter().db_for_read(Delivery), 'default')
+
+    def test_unmarked_endpoints_read_primary(self):
+        for view in (
+            AvailableDeliveriesView.as_view(),
+            DeliveryViewSet.as_view({'get': 'list'}),
+            async_views.available_deliveries,
+        ):
+            with self.subTest(view.__name__):
+                self.assertEqual(self.read_database(view), 'default')
+        self.assertEqual(self.read_database(MyHistoryDeliveriesView.as_view(), 'post'), 'default')
+
+    def test_write_pins_user_to_primary(self):
+        view = MyHistoryDeliveriesView.as_view()
+        self.read_database(DeliveryViewSet.as_view({'patch': 'update_status'}), 'patch')
+        self.assertEqual(self.read_database(view), 'default')
+        # Другие клиенты по-прежнему читают с реплики
+        self.assertEqual(self.read_database(view, authorized=False), 'replica_0')
+
+    def test_replicas_require_shared_cache(self):
+        self.assertEqual([error.id for error in checks.check_replica_pin_cache(None)], ['delivery.E001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(checks.check_replica_pin_cache(None), [])
+        with override_settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(checks.check_replica_pin_cache(None), [])
+
+
+class CachedUserAuthenticationTests(TestCase):
+    """Кэш пользователей JWT: без хэша пароля и со сбросом при изменении пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('courier', password='secret')
+
+    def setUp(self):
+        cache.clear()
+        self.token = AccessToken.for_user(self.user)
+        self.key = authentication.user_cache_key(self.user.pk)
+
+    def test_cache_holds_no_password(self):
+        backend = authentication.CachedJWTAuthentication()
+        backend.get_user(self.token)
+        _, fields = cache.get(self.key)
+        self.assertEqual(set(fields), set(authentication.CACHED_USER_FIELDS))
+
+        with self.assertNumQueries(0):
+            user = backend.get_user(self.token)
+        self.assertEqual(user, self.user)
+        self.assertEqual((user.username, user.is_active), ('courier', True))
+        self.assertEqual(user.password, '')
+
+    def test_user_changes_invalidate_cache(self):
+        backend = authentication.CachedJWTAuthentication()
+        for change in ('deactivate', 'set_password'):
+            with self.subTest(change):
+                backend.get_user(self.token)
+                self.assertIsNotNone(cache.get(self.key))
+                user = User.objects.get(pk=self.user.pk)
+                if change == 'deactivate':
+                    user.is_active = False
+                else:
+                    user.set_password('changed')
+                user.save()
+                self.assertIsNone(cache.get(self.key))
+                User.objects.filter(pk=self.user.pk).update(is_active=True)
+
+
+class PushSubscriptionTests(TestCase):
+    """Отбор событий доставок по каналам подписки."""
+
+    @staticmethod
+    def event(courier=None, prev_courier=None, lat=None, lon=None, op='updated'):
+        return {'op': op, 'id': 1, 'courier': courier, 'prev_courier': prev_courier,
+                'status': None, 'prev_status': None, 'lat': lat, 'lon': lon}
+
+    def test_channels(self):
+        available = push.Subscription(7, ['available'])
+        self.assertTrue(available.matches(self.event()))
+        # Назначение и снятие курьера меняют список доступных
+        self.assertTrue(available.matches(self.event(courier=3)))
+        self.assertTrue(available.matches(self.event(prev_courier=3)))
+        self.assertFalse(available.matches(self.event(courier=3, prev_courier=4)))
+
+        my = push.Subscription(7, ['my'])
+        self.assertTrue(my.matches(self.event(courier=7, prev_courier=7)))
+        self.assertTrue(my.matches(self.event(courier=3, prev_courier=7)))
+        self.assertFalse(my.matches(self.event(courier=3, prev_courier=4)))
+        self.assertFalse(my.matches(self.event()))
+        self.assertTrue(my.matches({'op': 'resync'}))
+
+    def test_bbox(self):
+        subscription = push.Subscription(7, ['bbox'], '37.0,55.0,38.0,56.0')
+        self.assertTrue(subscription.matches(self.event(courier=3, prev_courier=3, lat=55.5, lon=37.5)))
+        self.assertTrue(subscription.matches(self.event(courier=3, prev_courier=3, lat=55.0, lon=38.0)))
+        self.assertFalse(subscription.matches(self.event(courier=3, prev_courier=3, lat=55.5, lon=38.5)))
+        self.assertFalse(subscription.matches(self.event(courier=3, prev_courier=3)))
+
+        subscription.remove(['bbox'])
+        self.assertIsNone(subscription.bbox)
+        self.assertFalse(subscription.matches(self.event(courier=3, prev_courier=3, lat=55.5, lon=37.5)))
+
+    def test_invalid_subscription(self):
+        with self.assertRaises(ValidationError):
+            push.Subscription(7, ['unknown'])
+        with self.assertRaises(ValidationError):
+            push.Subscription(7, ['bbox'], '37.0,55.0,38.0')
+
+
+class TokenBucketTests(TestCase):
+    """Корзины токенов: пополнение, время ожидания и вытеснение ячеек общего файла."""
+
+    def test_take_token(self):
+        # Полная корзина отдает токен сразу
+        self.assertEqual(throttling.take_token(2, 0, 0, 2, 0.5), (1, 0.0))
+        # Пустая корзина: ждать, пока накопится один токен
+        self.assertEqual(throttling.take_token(0.5, 0, 0, 2, 0.5), (0.5, 1.0))
+        # За 3 секунды пополняется 1.5 токена, но не больше размера корзины
+        self.assertEqual(throttling.take_token(0, 0, 3, 2, 0.5), (0.5, 0.0))
+        self.assertEqual(throttling.take_token(0, 0, 100, 2, 0.5), (1, 0.0))
+        # Часы, ушедшие назад, не отнимают токены
+        self.assertEqual(throttling.take_token(1, 10, 5, 2, 0.5), (0, 0.0))
+
+    def test_shared_memory_eviction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Все ячейки файла попадают в окно поиска любого ключа
+            slots = throttling.SharedMemoryBucketStore.PROBES
+            store = throttling.SharedMemoryBucketStore(f'{directory}/buckets', slots=slots)
+            with mock.patch('delivery.throttling.time.time', return_value=0.0):
+                self.assertEqual(store.consume('poll:1', 1, 0.001), 0.0)
+                self.assertGreater(store.consume('poll:1', 1, 0.001), 0)
+            # Остальные ячейки заняты позже, новая корзина вытесняет poll:1
+            for index in range(2, store.slots + 2):
+                with mock.patch('delivery.throttling.time.time', return_value=float(index)):
+                    self.assertEqual(store.consume(f'poll:{index}', 1, 0.001), 0.0)
+            with mock.patch('delivery.throttling.time.time', return_value=float(store.slots + 2)):
+                self.assertEqual(store.consume('poll:1', 1, 0.001), 0.0)
+                # Соседние корзины не затронуты
+                self.assertGreater(store.consume(f'poll:{store.slots + 1}', 1, 0.001), 0)
+
+    @override_settings(THROTTLE_BUCKETS={'poll': (2, 0.5)}, LOAD_SHEDDING_ENABLED=False)
+    def test_retry_after(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('courier'))
+        with mock.patch.object(throttling, '_store', throttling.LocalBucketStore()):
+            for _ in range(2):
+                self.assertEqual(client.get('/api/deliveries/available/').status_code, 200)
+            response = client.get('/api/deliveries/available/')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '2')
+
+    @override_settings(THROTTLE_BUCKETS={'poll': (2, 0.001)}, LOAD_SHEDDING_ENABLED=False)
+    def test_reads_without_scope_are_throttled(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('courier'))
+        with mock.patch.object(throttling, '_store', throttling.LocalBucketStore()):
+            self.assertEqual(client.get('/api/deliveries/').status_code, 200)
+            self.assertEqual(client.get('/api/deliveries/999999/').status_code, 404)
+            self.assertEqual(client.get('/api/deliveries/').status_code, 429)
+            self.assertEqual(client.get('/api/deliveries/999999/').status_code, 429)
+            self.assertEqual(client.get('/api/profile/').status_code, 429)
+            self.assertEqual(client.options('/api/deliveries/').status_code, 200)
+
+    @override_settings(THROTTLE_BUCKETS={'map': (3, 0.001), 'export': (1, 0.001)}, LOAD_SHEDDING_ENABLED=False)
+    def test_map_window_has_own_bucket(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('courier'))
+        window = {'bbox': '37.5,55.7,37.7,55.8', 'zoom': 12}
+        with mock.patch.object(throttling, '_store', throttling.LocalBucketStore()):
+            self.assertEqual(client.get('/api/deliveries/coordinates/').status_code, 200)
+            self.assertEqual(client.get('/api/deliveries/coordinates/').status_code, 429)
+            for _ in range(3):
+                self.assertEqual(client.get('/api/deliveries/coordinates/', window).status_code, 200)
+            self.assertEqual(client.get('/api/deliveries/coordinates/', window).status_code, 429)
+
+
+class AdaptiveLimiterTests(TestCase):
+    """Лимит одновременных запросов low: AIMD и пропуск critical при перегрузке."""
+
+    def setUp(self):
+        self.limiter = concurrency.AdaptiveLimiter({concurrency.LOW: 0.5, concurrency.CRITICAL: 1.0}, max_limit=4)
+
+    def test_limit_in_flight(self):
+        for _ in range(4):
+            self.assertTrue(self.limiter.acquire(concurrency.LOW))
+        self.assertFalse(self.limiter.acquire(concurrency.LOW))
+        # Изменения и обычные запросы не ограничиваются
+        self.assertTrue(self.limiter.acquire(concurrency.CRITICAL))
+        self.assertTrue(self.limiter.acquire(concurrency.DEFAULT))
+        self.limiter.release(concurrency.LOW)
+        self.assertTrue(self.limiter.acquire(concurrency.LOW))
+        # Запрос, долго ждавший в очереди, сбрасывается сразу
+        self.limiter.release(concurrency.LOW)
+        self.assertFalse(self.limiter.acquire(concurrency.LOW, waited=2.0))
+
+    def test_aimd(self):
+        with mock.patch('delivery.concurrency.time.monotonic', return_value=10.0):
+            self.limiter.observe(concurrency.LOW, started=5.0, latency=1.0)
+            self.assertEqual(self.limiter.limit, 2)
+            # Запросы той же перегрузки не уменьшают лимит повторно
+            self.limiter.observe(concurrency.CRITICAL, started=6.0, latency=2.0)
+            self.assertEqual(self.limiter.limit, 2)
+            # Долгое ожидание в очереди тоже признак перегрузки
+            self.limiter.observe(concurrency.LOW, started=11.0, latency=0.1, waited=1.0)
+            self.assertEqual(self.limiter.limit, 1)
+        self.limiter.observe(concurrency.LOW, started=12.0, latency=0.1)
+        self.assertEqual(self.limiter.limit, 2)
+        self.limiter.observe(concurrency.LOW, started=12.0, latency=0.1)
+        self.assertEqual(self.limiter.limit, 2.5)
+        # Классы без цели не влияют на лимит
+        self.limiter.observe(concurrency.DEFAULT, started=12.0, latency=10.0)
+        self.assertEqual(self.limiter.limit, 2.5)
+
+    def test_fractional_limit(self):
+        self.limiter.limit = 0.25
+        with mock.patch('delivery.concurrency.random.random', return_value=0.1):
+            self.assertTrue(self.limiter.acquire(concurrency.LOW))
+        self.limiter.release(concurrency.LOW)
+        with mock.patch('delivery.concurrency.random.random', return_value=0.5):
+            self.assertFalse(self.limiter.acquire(concurrency.LOW))
+            self.assertTrue(self.limiter.acquire(concurrency.CRITICAL))
+        # Лимит не опускается ниже min_limit и растет шагами min_limit
+        with mock.patch('delivery.concurrency.time.monotonic', return_value=0.0):
+            for index in range(1, 10):
+                self.limiter.observe(concurrency.LOW, started=float(index), latency=1.0)
+        self.assertEqual(self.limiter.limit, self.limiter.min_limit)
+        self.limiter.observe(concurrency.LOW, started=200.0, latency=0.1)
+        self.assertAlmostEqual(self.limiter.limit, 2 * self.limiter.min_limit)
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class AsyncViewTests(TestCase):
+    """Асинхронные эндпоинты: аутентификация и совпадение ответов с синхронными."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.courier = User.objects.create_user('courier')
+        pending = Status.objects.create(name=queries.PENDING_STATUS_NAME, color='yellow')
+        transport_model = TransportModel.objects.create(name='Модель')
+        packaging = PackagingType.objects.create(name='Коробка')
+        for i in range(3):
+            Delivery.objects.create(
+                transport_model=transport_model,
+                transport_number=f'А{i:03d}ВС',
+                start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+                end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+                distance=i,
+                packaging=packaging,
+                status=pending,
+                technical_condition='Исправно',
+                courier=cls.courier if i == 0 else None,
+                source_lat=55.75, source_lon=37.61, dest_lat=55.76, dest_lon=37.62,
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.token = str(AccessToken.for_user(self.courier))
+        self.headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'}
+
+    def test_token_rejection(self):
+        url = '/api/async/deliveries/available/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer invalid').status_code, 401)
+        # Токен из строки запроса принимают только эндпоинты с allow_query_token
+        self.assertEqual(self.client.get(url, {'access_token': self.token}).status_code, 401)
+        self.assertEqual(self.client.post(url, **self.headers).status_code, 405)
+
+        User.objects.filter(pk=self.courier.pk).update(is_active=False)
+        self.assertEqual(self.client.get(url, **self.headers).status_code, 401)
+
+    def test_query_token(self):
+        @async_views.async_api_view(allow_query_token=True, throttle_scope=None)
+        async def whoami(request):
+            return async_views.json_response({'id': request.user.pk})
+
+        factory = AsyncRequestFactory()
+        # Как и тестовый клиент Django, не закрываем соединение транзакции теста
+        with mock.patch.object(push, 'close_old_connections'):
+            response = async_to_sync(whoami)(factory.get('/', {'access_token': self.token}))
+            self.assertEqual(json.loads(response.content), {'id': self.courier.pk})
+            response = async_to_sync(whoami)(factory.get('/', {'access_token': 'invalid'}))
+        self.assertEqual(response.status_code, 401)
+
+    def test_responses_match_sync_views(self):
+        for sync_url, async_url, params in (
+            ('/api/deliveries/available/', '/api/async/deliveries/available/', {'sort_by': 'distance'}),
+            ('/api/deliveries/my/active/', '/api/async/deliveries/my/active/', {}),
+            ('/api/deliveries/my/history/', '/api/async/deliveries/my/history/', {}),
+            ('/api/deliveries/coordinates/', '/api/async/deliveries/coordinates/', {}),
+            ('/api/deliveries/coordinates/', '/api/async/deliveries/coordinates/', {'bbox': '37,55,38,56', 'zoom': 10}),
+            ('/api/profile/', '/api/async/profile/', {}),
+        ):
+            with self.subTest(async_url, **params):
+                expected = self.client.get(sync_url, params, **self.headers)
+                response = self.client.get(async_url, params, **self.headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), expected.json())
+
+
+@override_settings(METRICS_TOKEN='scrape-token', THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False)
+class MetricsTests(TestCase):
+    """Метрики запросов и доступ к /metrics."""
+
+    def test_request_is_recorded(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('courier'))
+        self.assertEqual(client.get('/api/statuses/').status_code, 200)
+
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertRegex(body, r'delivery_http_requests_total\{method="GET",route="[^"]*statuses[^"]*",status="200"\} [1-9]')
+        self.assertRegex(body, r'delivery_http_request_db_queries_count\{method="GET",route="[^"]*statuses[^"]*"\} [1-9]')
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+            self.client.force_login(User.objects.create_user('admin', is_staff=True))
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+@override_settings(
+    PROFILING_ENABLED=True, PROFILING_SAMPLE_RATES={}, THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False,
+)
+class ProfilingTests(TestCase):
+    """Профилирование запросов по требованию и по выборке маршрута."""
+
+    URL = '/api/deliveries/available/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.courier = User.objects.create_user('courier')
+        cls.staff = User.objects.create_user('dispatcher', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        # Соединение теста открыто до подключения обертки в apps.ready()
+        profiling.install_capture_wrapper(None, connection)
+        self.addCleanup(connection.execute_wrappers.remove, profiling.capture_wrapper)
+
+    def get(self, user, **headers):
+        return self.client.get(self.URL, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}', **headers)
+
+    def test_sample_trigger(self):
+        request = APIRequestFactory().get(self.URL)
+        rates = {'api/deliveries/available/': 0.25}
+        with mock.patch('delivery.profiling.random.random', return_value=0.1):
+            self.assertEqual(profiling.sample_trigger(request, rates), 'sample')
+            self.assertIsNone(profiling.sample_trigger(APIRequestFactory().get('/api/profile/'), rates))
+            self.assertIsNone(profiling.sample_trigger(APIRequestFactory().get('/missing/'), rates))
+        with mock.patch('delivery.profiling.random.random', return_value=0.5):
+            self.assertIsNone(profiling.sample_trigger(request, rates))
+
+    def test_staff_header_saves_report(self):
+        response = self.get(self.staff, HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        report = ProfileReport.objects.get(pk=response['X-Profile-Report'])
+        self.assertEqual(
+            (report.method, report.route, report.trigger, report.user, report.status_code),
+            ('GET', 'api/deliveries/available/', 'header', self.staff, 200),
+        )
+        self.assertGreater(report.query_count, 0)
+        self.assertTrue(report.slow_queries)
+        self.assertTrue(all(query['explain'] for query in report.slow_queries))
+        self.assertIn('pyinstrument', report.html_report.lower())
+
+        # Курьеру заголовок не включает профилирование
+        response = self.get(self.courier, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Report', response)
+        self.assertEqual(ProfileReport.objects.count(), 1)
+
+    @override_settings(PROFILING_SAMPLE_RATES={'api/deliveries/available/': 1.0})
+    def test_sampled_route(self):
+        self.client = self.client_class()
+        response = self.get(self.courier)
+        report = ProfileReport.objects.get(pk=response['X-Profile-Report'])
+        self.assertEqual((report.trigger, report.user), ('sample', self.courier))
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, LOG_PAYLOAD_LIMIT=40)
+class StructuredLogTests(TestCase):
+    """Записи лога в JSON с ID запроса и пользователя."""
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        handler = log.QueueLogHandler(stream=self.stream)
+        handler.setFormatter(log.JSONFormatter())
+        handler.addFilter(log.RequestContextFilter())
+        logger = logging.getLogger('delivery.views')
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        self.addCleanup(handler.stop)
+        self.handler = handler
+        previous_level = logger.level
+        logger.setLevel(logging.INFO)
+        self.addCleanup(logger.setLevel, previous_level)
+
+    def records(self):
+        # Остановка фонового потока дописывает очередь
+        self.handler.stop()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_request_record(self):
+        user = User.objects.create_user('dispatcher')
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            '/api/deliveries/create_simple/', {'comment': 'x' * 100}, format='json', HTTP_X_REQUEST_ID='req-42'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['X-Request-ID'], 'req-42')
+
+        [record] = [item for item in self.records() if item['msg'].startswith('Создание новой доставки')]
+        self.assertEqual(
+            (record['level'], record['logger'], record['request_id'], record['user_id']),
+            ('INFO', 'delivery.views', 'req-42', user.pk),
+        )
+        # Данные запроса обрезаны до LOG_PAYLOAD_LIMIT байт
+        self.assertIn('...(+', record['msg'])
+        self.assertLess(len(record['msg']), 120)
+
+    def test_record_outside_request(self):
+        logging.getLogger('delivery.views').info("Без запроса", extra={'delivery_id': 7})
+        [record] = self.records()
+        self.assertEqual((record['request_id'], record['user_id'], record['delivery_id']), (None, None, 7))
+        self.assertIsNotNone(log.new_request_id('bad\nid'))
+        self.assertNotEqual(log.new_request_id('bad\nid'), 'bad\nid')
+
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class DeliverySearchTests(TestCase):
+    """Поиск доставок по номеру транспорта и адресам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('dispatcher')
+        status = Status.objects.create(name=queries.PENDING_STATUS_NAME, color='yellow')
+        transport_model = TransportModel.objects.create(name='Модель')
+        packaging = PackagingType.objects.create(name='Коробка')
+        cls.deliveries = [Delivery.objects.create(
+            transport_model=transport_model,
+            transport_number=number,
+            start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+            end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+            distance=1,
+            packaging=packaging,
+            status=status,
+            technical_condition='Исправно',
+            source_address=source,
+            destination_address='Москва, Тверская улица, 1',
+        ) for number, source in (
+            ('А123ВС', 'Москва, Ленинградский проспект, 10'),
+            ('К777ММ', 'Москва, Профсоюзная улица, 5'),
+            ('Е001КХ', 'Санкт-Петербург, Невский проспект, 20'),
+        )]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, text):
+        response = self.client.get('/api/deliveries/search/', {'q': text, 'fields': 'id'})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['id'] for item in response.json()]
+
+    def test_prefix_query(self):
+        _, words = search.prefix_query('Невский  Пр').get_source_expressions()
+        self.assertEqual(words.value, 'невский:* & пр:*')
+        self.assertIsNone(search.prefix_query(' ,. '))
+        self.assertFalse(search.search_deliveries(Delivery.objects.all(), '  ').exists())
+
+    def test_search(self):
+        first, second, third = (delivery.pk for delivery in self.deliveries)
+        self.assertEqual(self.search('А123'), [first])
+        self.assertEqual(set(self.search('Москва')), {first, second, third})
+        # Похожие адреса (по триграммам в PostgreSQL) - ниже точного совпадения
+        self.assertEqual(self.search('Невский проспект')[0], third)
+        self.assertEqual(self.client.get('/api/deliveries/search/', {'q': 'а'}).status_code, 400)
+
+    def test_prefix_and_typo_search(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("Префиксы слов и триграммы - только в PostgreSQL")
+        first, second, third = (delivery.pk for delivery in self.deliveries)
+        # Начала слов в любом порядке
+        self.assertEqual(self.search('прос ленин'), [first])
+        self.assertEqual(self.search('петер нев'), [third])
+        # Опечатка в слове находится по триграммам
+        self.assertEqual(self.search('Профсаюзная'), [second])
+        # Точное совпадение номера выше похожих
+        self.assertEqual(self.search('К777ММ')[0], second)
+
+@override_settings(THROTTLE_BUCKETS={}, LOAD_SHEDDING_ENABLED=False, PUSH_ENABLED=False)
+class DeliveryAdminTests(TestCase):
+    """Массовые действия и подсчет строк списка доставок в админке."""
+
+    URL = '/admin/delivery/delivery/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin')
+        cls.courier = User.objects.create_user('courier')
+        cls.pending = Status.objects.create(name=queries.PENDING_STATUS_NAME, color='yellow')
+        cls.in_transit = Status.objects.create(name='В пути', color='blue')
+        cls.transport_model = TransportModel.objects.create(name='Модель')
+        cls.packaging = PackagingType.objects.create(name='Коробка')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        # Доставки создаются в тесте, чтобы журнал и карта сбрасывались при фиксации
+        with self.captureOnCommitCallbacks(execute=True):
+            self.deliveries = [Delivery.objects.create(
+                transport_model=self.transport_model,
+                transport_number=f'Б{i:03d}ВС',
+                start_time=datetime(2025, 5, 10, 10, tzinfo=dt_timezone.utc),
+                end_time=datetime(2025, 5, 10, 12, tzinfo=dt_timezone.utc),
+                distance=i,
+                packaging=self.packaging,
+                status=self.pending,
+                technical_condition='Исправно',
+                courier=self.courier,
+                source_lat=55.75, source_lon=37.61 + i / 100, dest_lat=55.76, dest_lon=37.62,
+            ) for i in range(3)]
+
+    def action(self, action, **values):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.URL, {
+                'action': action,
+                '_selected_action': [delivery.pk for delivery in self.deliveries[:2]],
+                **values,
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_bulk_unassign(self):
+        self.action('unassign_courier')
+        self.assertEqual(
+            list(Delivery.objects.order_by('id').values_list('courier_id', 'version')),
+            [(None, 2), (None, 2), (self.courier.pk, 1)],
+        )
+        self.assertEqual(
+            list(DeliveryEvent.objects.filter(field='courier', new_value=None).order_by('delivery_id')
+                 .values_list('delivery_id', 'old_value', 'new_value')),
+            [(delivery.pk, str(self.courier.pk), None) for delivery in self.deliveries[:2]],
+        )
+        # Доставки без курьера появились на карте
+        self.assertEqual(
+            MapCell.objects.filter(level=0).values_list('count', flat=True).get(), 2
+        )
+
+    def test_bulk_change_status(self):
+        self.action('change_status', status=self.in_transit.pk)
+        self.assertEqual(
+            list(Delivery.objects.order_by('id').values_list('status_id', 'version')),
+            [(self.in_transit.pk, 2), (self.in_transit.pk, 2), (self.pending.pk, 1)],
+        )
+        self.assertEqual(DeliveryEvent.objects.filter(field='status', new_value=str(self.in_transit.pk)).count(), 2)
+        self.assertFalse(MapCell.objects.exists())
+
+    def test_estimated_count(self):
+        queryset = Delivery.objects.order_by('id')
+        estimate = json.dumps([{'Plan': {'Plan Rows': delivery_admin.ADMIN_EXACT_COUNT_LIMIT + 1}}])
+        with mock.patch.object(delivery_admin, 'connections') as connections, \
+                mock.patch.object(type(queryset), 'explain', return_value=estimate):
+            connections.__getitem__.return_value.vendor = 'postgresql'
+            self.assertEqual(
+                delivery_admin.EstimatedCountPaginator(queryset, 100).count, delivery_admin.ADMIN_EXACT_COUNT_LIMIT + 1
+            )
+        # Небольшая оценка - точный COUNT(*)
+        with mock.patch.object(delivery_admin, 'connections') as connections, \
+                mock.patch.object(type(queryset), 'explain', return_value=json.dumps([{'Plan': {'Plan Rows': 10}}])):
+            connections.__getitem__.return_value.vendor = 'postgresql'
+            self.assertEqual(delivery_admin.EstimatedCountPaginator(queryset, 100).count, 3)
+        self.assertEqual(self.client.get(self.URL).status_code, 200)
@@ -0,0 +1,312 @@
+"""
+Ограничение частоты запросов алгоритмом token bucket.
+
+Корзина хранится для пары (класс маршрута, пользователь): чтение (poll),
+запись (write), синхронизация (sync), окно карты (map), выгрузки (export),
+прием GPS-точек (location) и вход (login, по IP). Каждый запрос забирает из корзины один токен, токены
+восстанавливаются с постоянной скоростью до размера корзины, поэтому
+клиент может сделать короткую серию запросов, но не может долго
+опрашивать сервер чаще заданной скорости.
+
+Состояние корзин общее для всех процессов: в Redis (REDIS_URL) или
+в файле, отображенном в память (для процессов одного сервера).
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+from hashlib import blake2b
+
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+try:
+    import fcntl
+except ImportError:  # Windows: только хранилище в памяти процесса
+    fcntl = None
+
+# Классы маршрута для запросов без явного класса: чтение и изменение
+READ_SCOPE = 'poll'
+WRITE_SCOPE = 'write'
+
+# Классы запроса координат: окно карты и полная выгрузка
+MAP_SCOPE = 'map'
+EXPORT_SCOPE = 'export'
+
+# Скрипт Redis: пополнение и списание токена атомарно, время - часы Redis
+REDIS_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 't', 'u')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'u', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+def take_token(tokens, updated, now, capacity, rate):
+    """
+    Пополняет корзину за прошедшее время и забирает из нее токен.
+
+    Args:
+        tokens: Токены в корзине на момент updated
+        updated: Время последнего изменения корзины
+        now: Текущее время
+        capacity: Размер корзины
+        rate: Токенов в секунду
+
+    Returns:
+        tuple: Новое число токенов и время ожидания в секундах (0 - запрос разрешен)
+    """
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class LocalBucketStore:
+    """Корзины в памяти процесса (для разработки и систем без fcntl)."""
+
+    def __init__(self, max_buckets=65536):
+        self.max_buckets = max_buckets
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        """
+        Забирает токен из корзины key.
+
+        Returns:
+            float: Время ожидания в секундах, 0 - запрос разрешен
+        """
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.max_buckets:
+                self._buckets.clear()
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, wait = take_token(tokens, updated, now, capacity, rate)
+            self._buckets[key] = (tokens, now)
+        return wait
+
+    async def aconsume(self, key, capacity, rate):
+        return self.consume(key, capacity, rate)
+
+
+class SharedMemoryBucketStore:
+    """
+    Корзины в файле, отображенном в память всеми процессами сервера.
+
+    Файл - таблица из slots ячеек (хэш ключа, токены, время изменения).
+    Ключ ищется в PROBES соседних ячейках; если его нет, занимается
+    свободная ячейка или ячейка, дольше всех не менявшаяся. Доступ
+    защищен блокировкой файла (flock) между процессами и мьютексом
+    между потоками.
+    """
+
+    SLOT = struct.Struct('=Qdd')
+    PROBES = 8
+
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # После fork блокировка унаследованного дескриптора общая с родителем,
+        # поэтому файл открывается заново в каждом процессе
+        if self._pid == os.getpid():
+            return
+        size = self.slots * self.SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self._map = mmap.mmap(fd, size)
+        self._fd = fd
+        self._pid = os.getpid()
+
+    def _find(self, digest):
+        """Возвращает (смещение, токены, время) ячейки ключа; токены None для новой ячейки."""
+        unpack = self.SLOT.unpack_from
+        victim = None
+        for probe in range(self.PROBES):
+            offset = (digest + probe) % self.slots * self.SLOT.size
+            stored, tokens, updated = unpack(self._map, offset)
+            if stored == digest:
+                return offset, tokens, updated
+            if victim is None or updated < victim[1]:
+                victim = (offset, updated)
+        return victim[0], None, None
+
+    def consume(self, key, capacity, rate):
+        """
+        Забирает токен из корзины key.
+
+        Returns:
+            float: Время ожидания в секундах, 0 - запрос разрешен
+        """
+        # 0 обозначает пустую ячейку
+        digest = int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                offset, tokens, updated = self._find(digest)
+                if tokens is None:
+                    tokens, updated = capacity, now
+                tokens, wait = take_token(tokens, updated, now, capacity, rate)
+                self.SLOT.pack_into(self._map, offset, digest, tokens, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return wait
+
+    async def aconsume(self, key, capacity, rate):
+        return self.consume(key, capacity, rate)
+
+
+class RedisBucketStore:
+    """Корзины в Redis; пополнение и списание выполняет один скрипт Lua."""
+
+    def __init__(self, url, prefix='delivery:throttle:'):
+        import redis
+        import redis.asyncio
+
+        self.prefix = prefix
+        self._script = redis.Redis.from_url(url).register_script(REDIS_SCRIPT)
+        self._ascript = redis.asyncio.Redis.from_url(url).register_script(REDIS_SCRIPT)
+
+    def consume(self, key, capacity, rate):
+        """
+        Забирает токен из корзины key.
+
+        Returns:
+            float: Время ожидания в секундах, 0 - запрос разрешен
+        """
+        return float(self._script(keys=[self.prefix + key], args=[capacity, rate]))
+
+    async def aconsume(self, key, capacity, rate):
+        return float(await self._ascript(keys=[self.prefix + key], args=[capacity, rate]))
+
+
+_store = None
+
+
+def get_store():
+    """Хранилище корзин по настройке THROTTLE_STORE (создается один раз на процесс)."""
+    global _store  # pylint: disable=global-statement
+    if _store is None:
+        if settings.THROTTLE_STORE == 'redis':
+            _store = RedisBucketStore(settings.THROTTLE_REDIS_URL)
+        elif settings.THROTTLE_STORE == 'shm' and fcntl is not None:
+            _store = SharedMemoryBucketStore(settings.THROTTLE_SHM_PATH, settings.THROTTLE_SHM_SLOTS)
+        else:
+            _store = LocalBucketStore()
+    return _store
+
+
+def coordinates_scope(request):
+    """
+    Класс запроса координат доставок.
+
+    Окно карты (bbox, zoom) запрашивается при каждом сдвиге и масштабировании
+    и читает только ячейки MapCell, поэтому его корзина больше, чем у полной
+    выгрузки координат.
+
+    Args:
+        request: HTTP запрос (DRF или Django)
+
+    Returns:
+        str: MAP_SCOPE или EXPORT_SCOPE
+    """
+    params = getattr(request, 'query_params', request.GET)
+    if 'bbox' in params or 'zoom' in params:
+        return MAP_SCOPE
+    return EXPORT_SCOPE
+
+
+def bucket_key(request, scope):
+    """
+    Ключ корзины: класс маршрута и пользователь (для анонимных - IP).
+
+    Args:
+        request: HTTP запрос (DRF или Django) с установленным user
+        scope: Класс маршрута
+
+    Returns:
+        str: Ключ корзины
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'{scope}:{user.pk}'
+    return f'{scope}:ip:{BaseThrottle().get_ident(request)}'
+
+
+def check(request, scope):
+    """
+    Забирает токен класса scope для запроса.
+
+    Returns:
+        float: Время ожидания в секундах, 0 - запрос разрешен
+            (в том числе для класса без настроенной корзины)
+    """
+    bucket = settings.THROTTLE_BUCKETS.get(scope)
+    if bucket is None:
+        return 0.0
+    return get_store().consume(bucket_key(request, scope), *bucket)
+
+
+async def acheck(request, scope):
+    """Асинхронная версия check."""
+    bucket = settings.THROTTLE_BUCKETS.get(scope)
+    if bucket is None:
+        return 0.0
+    return await get_store().aconsume(bucket_key(request, scope), *bucket)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Ограничение DRF по корзине класса маршрута.
+
+    Класс берется из throttle_scopes представления (действие -> класс),
+    затем из throttle_scope; класс может быть функцией запроса. Чтение
+    без класса относится к READ_SCOPE, изменение - к WRITE_SCOPE.
+    Не ограничиваются только OPTIONS и представления с throttle_classes = [].
+    DRF отвечает 429 с заголовком Retry-After.
+    """
+
+    def get_scope(self, request, view):
+        """Класс маршрута запроса или None, если запрос не ограничивается."""
+        action = getattr(view, 'action', None)
+        scopes = getattr(view, 'throttle_scopes', {})
+        scope = scopes[action] if action in scopes else getattr(view, 'throttle_scope', None)
+        if callable(scope):
+            scope = scope(request)
+        if scope is not None:
+            return scope
+        # Предварительные запросы CORS приходят без токена
+        if request.method == 'OPTIONS':
+            return None
+        return READ_SCOPE if request.method in SAFE_METHODS else WRITE_SCOPE
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        self.delay = check(request, scope) if scope else 0.0
+        return not self.delay
+
+    def wait(self):
+        return self.delay
@@ -0,0 +1,170 @@
+"""
+Треки курьеров для отображения на карте.
+
+Точки CourierLocation упрощаются алгоритмом Дугласа-Пекера
+(векторизованным на NumPy) с допуском, равным TRACK_TOLERANCE_PX
+пикселям карты на запрошенном масштабе, и кодируются в polyline
+(формат Google, точность 1e-5 градуса). Для воспроизведения вместе
+с линией возвращаются секунды от начала трека для каждой точки.
+
+Трек завершенной доставки больше не меняется, поэтому его упрощенные
+версии кэшируются по ID, версии доставки и масштабу.
+"""
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .locations import EARTH_RADIUS
+from .queries import DELIVERED_STATUS_NAME
+
+# Метров в пикселе тайла 256x256 на экваторе при масштабе 0
+METERS_PER_PIXEL_Z0 = 2 * np.pi * EARTH_RADIUS / 256
+
+MAX_ZOOM = 22
+
+
+def parse_zoom(value):
+    """
+    Масштаб карты из параметра запроса.
+
+    Returns:
+        int: Масштаб 0..MAX_ZOOM или None (трек без упрощения)
+
+    Raises:
+        ValueError: Значение не число
+    """
+    if value in (None, ''):
+        return None
+    return min(MAX_ZOOM, max(0, int(value)))
+
+
+def tolerance(zoom, lat):
+    """Допуск упрощения в метрах для масштаба zoom на широте lat."""
+    return settings.TRACK_TOLERANCE_PX * METERS_PER_PIXEL_Z0 * np.cos(np.radians(lat)) / 2 ** zoom
+
+
+def project(lat, lon):
+    """Проекция точек в метры на плоскости, касательной в середине трека."""
+    lat0 = np.radians((lat.min() + lat.max()) / 2)
+    return np.column_stack((
+        np.radians(lon) * np.cos(lat0) * EARTH_RADIUS,
+        np.radians(lat) * EARTH_RADIUS,
+    ))
+
+
+def douglas_peucker(xy, epsilon):
+    """
+    Индексы точек, оставшихся после упрощения ломаной.
+
+    Расстояния до отрезка считаются для всех точек участка одной
+    операцией NumPy; участки обрабатываются через стек, без рекурсии.
+
+    Args:
+        xy: Массив точек (n, 2) в метрах
+        epsilon: Допуск в метрах
+
+    Returns:
+        ndarray: Индексы оставленных точек по возрастанию
+    """
+    n = len(xy)
+    if n < 3 or epsilon <= 0:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a = xy[start]
+        d = xy[end] - a
+        points = xy[start + 1:end] - a
+        length = d @ d
+        # Расстояние до отрезка, а не до прямой: трек может возвращаться назад
+        t = np.clip(points @ d / length, 0, 1) if length else np.zeros(len(points))
+        distances = np.hypot(*(points - np.outer(t, d)).T)
+        i = int(distances.argmax())
+        if distances[i] > epsilon:
+            middle = start + 1 + i
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+    return np.flatnonzero(keep)
+
+
+def encode_polyline(lat, lon):
+    """
+    Кодирует точки в polyline (алгоритм Google, точность 1e-5).
+
+    Args:
+        lat: Широты
+        lon: Долготы
+
+    Returns:
+        str: Закодированная линия
+    """
+    values = np.round(np.column_stack((lat, lon)) * 1e5).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    deltas = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+    chunks = []
+    for value in deltas.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def build_track(rows, zoom=None):
+    """
+    Упрощенный и закодированный трек.
+
+    Args:
+        rows: Кортежи (recorded_at, lat, lon) в порядке времени
+        zoom: Масштаб карты; None - все точки
+
+    Returns:
+        dict: polyline, секунды от начала для каждой точки, начало и конец трека
+    """
+    rows = list(rows)
+    if not rows:
+        return {'points': 0, 'simplified': 0, 'polyline': '', 'times': [], 'start': None, 'end': None}
+    times = np.array([row[0].timestamp() for row in rows])
+    lat = np.array([row[1] for row in rows])
+    lon = np.array([row[2] for row in rows])
+
+    if zoom is None:
+        kept = np.arange(len(rows))
+    else:
+        kept = douglas_peucker(project(lat, lon), tolerance(zoom, (lat.min() + lat.max()) / 2))
+    return {
+        'points': len(rows),
+        'simplified': len(kept),
+        'polyline': encode_polyline(lat[kept], lon[kept]),
+        'times': np.round(times[kept] - times[0]).astype(int).tolist(),
+        'start': rows[0][0],
+        'end': rows[-1][0],
+    }
+
+
+def delivery_track(delivery, rows, zoom=None):
+    """
+    Трек доставки; трек завершенной доставки берется из кэша.
+
+    Args:
+        delivery: Доставка со статусом
+        rows: Функция без аргументов, возвращающая точки трека
+        zoom: Масштаб карты
+
+    Returns:
+        dict: Результат build_track()
+    """
+    if delivery.status.name != DELIVERED_STATUS_NAME:
+        return build_track(rows(), zoom)
+    key = f'delivery:track:{delivery.pk}:{delivery.version}:{zoom}'
+    track = cache.get(key)
+    if track is None:
+        track = build_track(rows(), zoom)
+        cache.set(key, track, settings.TRACK_CACHE_SECONDS)
+    return track
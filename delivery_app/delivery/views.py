@@ -4,13 +4,20 @@
 """
 
 import logging
-from rest_framework import viewsets, views, status
+from datetime import date, datetime, timedelta
+from rest_framework import generics, viewsets, views, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, PermissionDenied
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 from .models import (
     TransportModel,
@@ -19,7 +26,7 @@ from .models import (
     Status,
     Delivery,
     UserProfile,
-    User
+    VersionConflict
 )
 from .serializers import (
     TransportModelSerializer,
@@ -27,44 +34,289 @@ from .serializers import (
     ServiceSerializer,
     StatusSerializer,
     DeliverySerializer,
+    DeliveryBulkItemSerializer,
+    DeliveryEventSerializer,
     UserProfileSerializer
 )
+from .fieldsets import DeliveryFieldset
+from . import fragments, locations, maps, queries, throttling, tracks, writes
+from .log import payload
+from .renderers import ORJSONParser
+from .search import search_deliveries
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Поиск доставок: минимальная длина строки и число результатов
+SEARCH_MIN_LENGTH = 2
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
 # pylint: disable=no-member
 # objects - это стандартный атрибут Django моделей
 
+
+def delivery_etag(version):
+    """ETag доставки - ее версия."""
+    return f'"{version}"'
+
+
+def requested_version(request, data=None):
+    """
+    Версия доставки, на которой клиент основывал изменение.
+
+    Берется из заголовка If-Match (ETag из ответа) или поля version
+    данных изменения.
+
+    Args:
+        request: HTTP запрос
+        data: Данные изменения (по умолчанию тело запроса)
+
+    Returns:
+        int или None, если клиент не передал версию
+    """
+    if data is None:
+        header = request.headers.get('If-Match', '').strip()
+        if header and header != '*':
+            return _parse_version(header.split(',')[0].strip().removeprefix('W/').strip('"'))
+        data = request.data
+    return _parse_version(data.get('version'))
+
+
+def _parse_version(value):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ParseError(f"Некорректная версия доставки: {value}")
+
+def _parse_date(value, default):
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ParseError(f"Некорректная дата: {value}")
+
+def _parse_datetime(value, default):
+    if not value:
+        return default
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ParseError(f"Некорректное время: {value}")
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+def _parse_zoom(request):
+    try:
+        return tracks.parse_zoom(request.query_params.get('zoom'))
+    except ValueError:
+        raise ParseError("Некорректный масштаб zoom")
+
 class TransportModelViewSet(viewsets.ModelViewSet):
     """ViewSet для модели транспорта."""
     queryset = TransportModel.objects.all()
     serializer_class = TransportModelSerializer
     permission_classes = [IsAuthenticated]
+    # Справочники можно читать с реплики
+    replica_actions = ('list', 'retrieve')
 
 class PackagingTypeViewSet(viewsets.ModelViewSet):
     """ViewSet для типа упаковки."""
     queryset = PackagingType.objects.all()
     serializer_class = PackagingTypeSerializer
     permission_classes = [IsAuthenticated]
+    # Справочники можно читать с реплики
+    replica_actions = ('list', 'retrieve')
 
 class ServiceViewSet(viewsets.ModelViewSet):
     """ViewSet для услуги."""
     queryset = Service.objects.all()
     serializer_class = ServiceSerializer
     permission_classes = [IsAuthenticated]
+    # Справочники можно читать с реплики
+    replica_actions = ('list', 'retrieve')
 
 class StatusViewSet(viewsets.ModelViewSet):
     """ViewSet для статуса."""
     queryset = Status.objects.all()
     serializer_class = StatusSerializer
     permission_classes = [IsAuthenticated]
+    # Справочники можно читать с реплики
+    replica_actions = ('list', 'retrieve')
 
 class DeliveryViewSet(viewsets.ModelViewSet):
     """ViewSet для доставки."""
     queryset = Delivery.objects.all()
     serializer_class = DeliverySerializer
     permission_classes = [IsAuthenticated]
+
+    # Действия, поддерживающие параметры ?fields= и ?expand=
+    # (list и retrieve собирают ответ из кэша представлений delivery.fragments)
+    fieldset_actions = ('retrieve',)
+    # Поиск только читает и допускает отставание реплики
+    replica_actions = ('search',)
+    # Классы ограничения частоты (delivery.throttling); остальные
+    # действия относятся к классу poll (чтение) или write (изменение)
+    throttle_scopes = {
+        'sync': 'sync', 'bulk': 'sync', 'coordinates': throttling.coordinates_scope,
+    }
+
+    def get_fieldset(self):
+        """
+        Возвращает набор полей для текущего запроса.
+
+        Returns:
+            DeliveryFieldset: Набор полей из параметров ?fields= и ?expand=
+        """
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = DeliveryFieldset.from_request(self.request)
+        return self._fieldset
+
+    def get_queryset(self):
+        """
+        Для чтения загружает только колонки и связи выбранных полей; для
+        изменений - доставку вместе со связанными объектами ответа одним запросом.
+        """
+        queryset = super().get_queryset()
+        if self.action in self.fieldset_actions:
+            queryset = self.get_fieldset().apply(queryset)
+        else:
+            queryset = queryset.select_related(*writes.RELATED_MODELS)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        """Для чтения передает сериализатору набор полей."""
+        if self.action in self.fieldset_actions:
+            kwargs.setdefault('fieldset', self.get_fieldset())
+        return super().get_serializer(*args, **kwargs)
+
+    def handle_exception(self, exc):
+        """Конфликт версий превращается в ответ 409 с текущим состоянием доставки."""
+        if isinstance(exc, VersionConflict):
+            return self.conflict_response(exc)
+        return super().handle_exception(exc)
+
+    def conflict_response(self, exc):
+        """
+        Ответ 409 на изменение устаревшей версии доставки.
+
+        Args:
+            exc: VersionConflict
+
+        Returns:
+            Response: Ошибка и текущее состояние доставки (None, если она удалена)
+        """
+        current = Delivery.objects.filter(pk=exc.delivery_id).first()
+        response = Response(
+            {"error": str(exc), "current": self.current_state(current)},
+            status=status.HTTP_409_CONFLICT
+        )
+        if current is not None:
+            response['ETag'] = delivery_etag(current.version)
+        return response
+
+    def current_state(self, delivery):
+        """Полное представление доставки для ответа о конфликте."""
+        if delivery is None:
+            return None
+        return DeliverySerializer(delivery, context=self.get_serializer_context()).data
+
+    def delivery_response(self, delivery, build, status_code=status.HTTP_200_OK):
+        """
+        Ответ с полным представлением доставки после изменения.
+
+        Представление берется из кэша по версии доставки или строится
+        функцией build и сохраняется в кэш, поэтому следующее чтение
+        доставки не сериализует ее заново.
+
+        Args:
+            delivery: Доставка с актуальной версией
+            build: Функция без аргументов, возвращающая словарь представления
+            status_code: Код ответа
+
+        Returns:
+            Response: Представление доставки с ETag
+        """
+        data = fragments.DeliveryFragments(request=self.request).instance(delivery, build)
+        response = Response(data, status=status_code)
+        response['ETag'] = delivery_etag(delivery.version)
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        """Добавляет ETag (версию) к ответам с одной доставкой."""
+        data = getattr(response, 'data', None)
+        if isinstance(data, dict) and 'version' in data and 'id' in data and not response.has_header('ETag'):
+            response['ETag'] = delivery_etag(data['version'])
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Возвращает список доставок через быстрый сериализатор.
+
+        Args:
+            request: HTTP запрос
+
+        Returns:
+            Response: Список доставок
+        """
+        queryset = queries.filter_deliveries(
+            self.filter_queryset(super().get_queryset()), request.query_params
+        )
+        return Response(fragments.DeliveryFragments(self.get_fieldset(), request=request).render(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Возвращает доставку из кэша представлений.
+
+        Запрос к базе читает только версию доставки; представление
+        строится заново, если его нет в кэше для этой версии.
+
+        Args:
+            request: HTTP запрос
+
+        Returns:
+            Response: Данные доставки с ETag
+        """
+        delivery_id, version = generics.get_object_or_404(
+            self.filter_queryset(super().get_queryset()).values_list('id', 'version'), pk=kwargs['pk']
+        )
+        data = fragments.DeliveryFragments(self.get_fieldset(), request=request).render_one(delivery_id, version)
+        if data is None:
+            raise Http404
+        response = Response(data)
+        response['ETag'] = delivery_etag(version)
+        return response
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ищет доставки по номеру транспорта и адресам.
+
+        Параметр q - строка поиска (слова ищутся как префиксы, с учетом
+        опечаток); поддерживаются те же фильтры, что и у списка
+        (status, courier, max_distance, sort_by, fields, expand), и limit.
+        Без sort_by результаты упорядочены по релевантности.
+
+        Args:
+            request: HTTP запрос
+
+        Returns:
+            Response: Найденные доставки
+        """
+        text = request.query_params.get('q', '')
+        if len(text.strip()) < SEARCH_MIN_LENGTH:
+            return Response(
+                {"error": f"Строка поиска q должна содержать не менее {SEARCH_MIN_LENGTH} символов"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), SEARCH_MAX_LIMIT) if limit.isdigit() and int(limit) > 0 else SEARCH_DEFAULT_LIMIT
+
+        queryset = search_deliveries(Delivery.objects.all(), text)
+        queryset = queries.filter_deliveries(queryset, request.query_params)[:limit]
+        return Response(fragments.DeliveryFragments(self.get_fieldset(), request=request).render(queryset))
     
     def update(self, request, *args, **kwargs):
         """
@@ -76,44 +328,51 @@ class DeliveryViewSet(viewsets.ModelViewSet):
         Returns:
             Response: Обновленные данные или ошибка
         """
-        logger.info(f"Попытка обновления доставки: {request.data}")
-        print(f"Попытка обновления доставки: {request.data}")
-        
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        
-        # Логируем текущее состояние
-        logger.info(f"Текущий статус: {instance.status.id} - {instance.status.name}")
-        print(f"Текущий статус: {instance.status.id} - {instance.status.name}")
-        
-        # Проверяем обновление статуса
-        status_id = request.data.get('status_id')
-        if status_id:
-            try:
-                new_status = Status.objects.get(id=status_id)
-                logger.info(f"Меняем статус на: {new_status.id} - {new_status.name}")
-                print(f"Меняем статус на: {new_status.id} - {new_status.name}")
-            except Status.DoesNotExist:
-                logger.error(f"Статус с ID={status_id} не найден")
-                print(f"Статус с ID={status_id} не найден")
+        instance.check_version(requested_version(request))
+        old_status_id = instance.status_id
+        logger.info("Обновление доставки %s: %s", instance.pk, payload(request.data))
         
         # Выполняем стандартное обновление
         serializer = self.get_serializer(instance, data=request.data, partial=partial)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+        # Услуги меняются до UPDATE доставки; при конфликте версий откатываются
+        with transaction.atomic():
+            self.perform_update(serializer)
         
-        # Проверяем, что статус обновился
-        updated_instance = self.get_object()
-        logger.info(f"Обновленный статус: {updated_instance.status.id} - {updated_instance.status.name}")
-        print(f"Обновленный статус: {updated_instance.status.id} - {updated_instance.status.name}")
+        if instance.status_id != old_status_id:
+            logger.info("Статус доставки %s изменен: %s -> %s", instance.pk, old_status_id, instance.status_id)
         
         if getattr(instance, '_prefetched_objects_cache', None):
             # If 'prefetch_related' has been applied to a queryset, we need to
             # forcibly invalidate the prefetch cache on the instance.
             instance._prefetched_objects_cache = {}
 
-        return Response(serializer.data)
+        return self.delivery_response(instance, lambda: serializer.data)
     
+    def destroy(self, request, *args, **kwargs):
+        """
+        Удаляет доставку, если клиент видел ее текущую версию.
+
+        Args:
+            request: HTTP запрос (версия в If-Match)
+
+        Returns:
+            Response: Пустой ответ 204
+        """
+        instance = self.get_object()
+        expected = requested_version(request)
+        with transaction.atomic():
+            if expected is not None:
+                # Версия под блокировкой строки: изменение не вклинится между проверкой и удалением
+                instance.version = generics.get_object_or_404(
+                    Delivery.objects.select_for_update().values_list('version', flat=True), pk=instance.pk
+                )
+                instance.check_version(expected)
+            self.perform_destroy(instance)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=True, methods=['patch'])
     def assign(self, request, pk=None):
         """
@@ -127,6 +386,7 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             Response: Данные о доставке или ошибка
         """
         delivery = self.get_object()
+        delivery.check_version(requested_version(request))
         
         if delivery.courier is not None:
             return Response(
@@ -135,10 +395,11 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             )
         
         delivery.courier = request.user
-        delivery.save()
+        # Конфликт версий откатывается до точки сохранения, не ломая внешнюю транзакцию
+        with transaction.atomic():
+            delivery.save()
         
-        serializer = self.get_serializer(delivery)
-        return Response(serializer.data)
+        return self.delivery_response(delivery, lambda: self.get_serializer(delivery).data)
     
     @action(detail=True, methods=['patch'])
     def unassign(self, request, pk=None):
@@ -153,6 +414,7 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             Response: Данные о доставке или ошибка
         """
         delivery = self.get_object()
+        delivery.check_version(requested_version(request))
         
         if delivery.courier != request.user:
             return Response(
@@ -161,10 +423,10 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             )
         
         delivery.courier = None
-        delivery.save()
+        with transaction.atomic():
+            delivery.save()
         
-        serializer = self.get_serializer(delivery)
-        return Response(serializer.data)
+        return self.delivery_response(delivery, lambda: self.get_serializer(delivery).data)
         
     @action(detail=True, methods=['post'])
     def media(self, request, pk=None):
@@ -179,6 +441,7 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             Response: Данные о доставке или ошибка
         """
         delivery = self.get_object()
+        delivery.check_version(requested_version(request))
         
         if 'media_file' not in request.FILES:
             return Response(
@@ -187,10 +450,10 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             )
         
         delivery.media_file = request.FILES['media_file']
-        delivery.save()
+        with transaction.atomic():
+            delivery.save()
         
-        serializer = self.get_serializer(delivery)
-        return Response(serializer.data)
+        return self.delivery_response(delivery, lambda: self.get_serializer(delivery).data)
     
     @action(detail=False, methods=['post'])
     def sync(self, request):
@@ -231,9 +494,11 @@ class DeliveryViewSet(viewsets.ModelViewSet):
                         continue
                     
                     delivery = get_object_or_404(Delivery, id=data['id'])
+                    delivery.check_version(requested_version(request, data))
                     serializer = self.get_serializer(delivery, data=data, partial=True)
                     serializer.is_valid(raise_exception=True)
-                    serializer.save()
+                    with transaction.atomic():
+                        serializer.save()
                     results.append({
                         'id': change_id,
                         'status': 'updated',
@@ -245,6 +510,14 @@ class DeliveryViewSet(viewsets.ModelViewSet):
                         'status': 'error',
                         'error': f'Неизвестное действие: {action_type}'
                     })
+            except VersionConflict as e:
+                # Клиент изменял устаревшую версию: возвращаем текущую для слияния
+                results.append({
+                    'id': change_id,
+                    'status': 'conflict',
+                    'error': str(e),
+                    'data': self.current_state(Delivery.objects.filter(pk=e.delivery_id).first())
+                })
             except Exception as e:
                 results.append({
                     'id': change_id,
@@ -258,26 +531,73 @@ class DeliveryViewSet(viewsets.ModelViewSet):
     def coordinates(self, request):
         """
         Возвращает координаты доставок.
+
+        С параметрами bbox=min_lon,min_lat,max_lon,max_lat и zoom возвращает
+        кластеры доставок окна карты (центр и число доставок) из
+        предрасчитанных ячеек MapCell.
         
         Args:
             request: HTTP запрос
             
         Returns:
-            Response: Список координат доставок
+            Response: Список координат доставок или кластеров
         """
-        deliveries = self.queryset.filter(
-            courier__isnull=True
-        ).values('id', 'source_lat', 'source_lon', 'dest_lat', 'dest_lon')
+        window = maps.parse_window(request.query_params)
+        if window is not None:
+            return Response(maps.clusters(maps.cells(*window)))
+
+        deliveries = queries.unassigned_coordinates()
         
         # Фильтруем только те доставки, у которых заполнены координаты
-        result = []
-        for delivery in deliveries:
-            if (delivery.get('source_lat') and delivery.get('source_lon') and 
-                delivery.get('dest_lat') and delivery.get('dest_lon')):
-                result.append(delivery)
+        result = [delivery for delivery in deliveries if queries.has_coordinates(delivery)]
         
         return Response(result)
 
+    @action(detail=True, methods=['get'])
+    def history(self, request, pk=None):
+        """
+        Возвращает журнал изменений статуса и курьера доставки.
+
+        Args:
+            request: HTTP запрос
+            pk: ID доставки
+
+        Returns:
+            Response: События в порядке изменений
+
+        Raises:
+            Http404: Доставка не найдена
+        """
+        if not Delivery.objects.filter(pk=pk).exists():
+            raise Http404
+        events = queries.delivery_history(pk)
+        return Response(DeliveryEventSerializer(events, many=True).data)
+
+    @action(detail=True, methods=['get'])
+    def track(self, request, pk=None):
+        """
+        Возвращает трек курьера по доставке, упрощенный для масштаба карты.
+
+        Трек доступен курьеру доставки и сотрудникам (is_staff).
+
+        Args:
+            request: HTTP запрос с необязательным параметром zoom (0-22)
+            pk: ID доставки
+
+        Returns:
+            Response: Трек в формате polyline со временем точек
+
+        Raises:
+            PermissionDenied: Трек чужой доставки запрашивает не сотрудник
+        """
+        delivery = get_object_or_404(Delivery.objects.select_related('status'), pk=pk)
+        if delivery.courier_id != request.user.pk and not request.user.is_staff:
+            raise PermissionDenied("Трек доступен только курьеру доставки")
+        track = tracks.delivery_track(
+            delivery, lambda: queries.delivery_locations(delivery.pk), _parse_zoom(request)
+        )
+        return Response({'delivery': delivery.pk, **track})
+
     @action(detail=True, methods=['patch'])
     def update_status(self, request, pk=None):
         """
@@ -291,6 +611,7 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             Response: Обновленные данные доставки
         """
         delivery = self.get_object()
+        delivery.check_version(requested_version(request))
         
         # Получаем ID статуса из запроса
         status_id = request.data.get('status_id')
@@ -305,19 +626,14 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             status_obj = Status.objects.get(id=status_id)
             
             # Обновляем статус доставки
-            old_status = delivery.status
-            print(f"Обновляем статус доставки {delivery.id} с {old_status.id} ({old_status.name}) на {status_obj.id} ({status_obj.name})")
-            
+            old_status_id = delivery.status_id
             delivery.status = status_obj
-            delivery.save()
-            
-            # Проверяем, что статус обновился
-            delivery.refresh_from_db()
-            print(f"Статус после обновления: {delivery.status.id} ({delivery.status.name})")
+            with transaction.atomic():
+                delivery.save()
+            logger.info("Статус доставки %s изменен: %s -> %s", delivery.pk, old_status_id, status_obj.pk)
             
             # Возвращаем обновленные данные
-            serializer = self.get_serializer(delivery)
-            return Response(serializer.data)
+            return self.delivery_response(delivery, lambda: self.get_serializer(delivery).data)
         
         except Status.DoesNotExist:
             return Response(
@@ -338,88 +654,37 @@ class DeliveryViewSet(viewsets.ModelViewSet):
             Response: Обновленные данные доставки
         """
         delivery = self.get_object()
+        delivery.check_version(requested_version(request))
         
-        logger.info(f"Обновление всех полей доставки: {request.data}")
-        print(f"Обновление всех полей доставки {delivery.id}: {request.data}")
+        logger.info("Обновление всех полей доставки %s: %s", delivery.pk, payload(request.data))
         
-        # Обработка связанных моделей
-        transport_model_id = request.data.get('transport_model_id')
-        packaging_id = request.data.get('packaging_id')
+        related_ids = {
+            name: request.data[f'{name}_id'] for name in ('transport_model', 'packaging', 'status')
+            if request.data.get(f'{name}_id')
+        }
         service_ids = request.data.get('service_ids', [])
-        status_id = request.data.get('status_id')
         
         try:
-            # Обновляем модель транспорта
-            if transport_model_id:
-                try:
-                    transport_model = TransportModel.objects.get(id=transport_model_id)
-                    delivery.transport_model = transport_model
-                    print(f"Модель транспорта установлена: {transport_model.id} ({transport_model.name})")
-                except TransportModel.DoesNotExist:
-                    return Response(
-                        {"error": f"Модель транспорта с ID {transport_model_id} не найдена"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Обновляем тип упаковки
-            if packaging_id:
-                try:
-                    packaging = PackagingType.objects.get(id=packaging_id)
-                    delivery.packaging = packaging
-                    print(f"Тип упаковки установлен: {packaging.id} ({packaging.name})")
-                except PackagingType.DoesNotExist:
-                    return Response(
-                        {"error": f"Тип упаковки с ID {packaging_id} не найден"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Обновляем услуги
-            if service_ids:
-                # Очищаем текущие услуги
-                delivery.services.clear()
-                print(f"Очищены текущие услуги")
-                
-                # Добавляем новые услуги
-                for service_id in service_ids:
-                    try:
-                        service = Service.objects.get(id=service_id)
-                        delivery.services.add(service)
-                        print(f"Добавлена услуга: {service.id} ({service.name})")
-                    except Service.DoesNotExist:
-                        print(f"Услуга с ID {service_id} не найдена")
-                        # Не прерываем выполнение, просто пропускаем эту услугу
-            
-            # Обновляем статус
-            if status_id:
-                try:
-                    status_obj = Status.objects.get(id=status_id)
-                    delivery.status = status_obj
-                    print(f"Статус установлен: {status_obj.id} ({status_obj.name})")
-                except Status.DoesNotExist:
-                    return Response(
-                        {"error": f"Статус с ID {status_id} не найден"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Обновляем прочие поля
-            for field in ['transport_number', 'start_time', 'end_time', 'distance', 
-                         'technical_condition', 'source_address', 'destination_address',
-                         'source_lat', 'source_lon', 'dest_lat', 'dest_lon']:
-                if field in request.data:
-                    setattr(delivery, field, request.data.get(field))
-                    print(f"Поле {field} установлено: {request.data.get(field)}")
-            
-            # Сохраняем доставку
-            delivery.save()
-            print(f"Доставка {delivery.id} успешно сохранена")
+            # Проверка ID, услуги и UPDATE изменившихся полей - одна транзакция;
+            # при конфликте версий откатывается все
+            with transaction.atomic():
+                changed = writes.set_related(delivery, related_ids)
+                changed += writes.set_fields(delivery, request.data)
+                services_changed = False
+                if service_ids:
+                    services_changed = writes.set_services(delivery, writes.existing_service_ids(service_ids))
+                writes.save_changes(delivery, changed, services_changed)
+            logger.debug("Доставка %s сохранена, изменены поля: %s", delivery.pk, changed)
             
             # Возвращаем обновленные данные
-            serializer = self.get_serializer(delivery)
-            return Response(serializer.data)
+            return self.delivery_response(delivery, lambda: self.get_serializer(delivery).data)
             
+        except writes.RelatedNotFound as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except VersionConflict:
+            raise
         except Exception as e:
-            logger.error(f"Ошибка при обновлении доставки: {str(e)}")
-            print(f"Ошибка при обновлении доставки: {str(e)}")
+            logger.exception("Ошибка при обновлении доставки %s", delivery.pk)
             return Response(
                 {"error": f"Ошибка при обновлении доставки: {str(e)}"},
                 status=status.HTTP_400_BAD_REQUEST
@@ -436,131 +701,117 @@ class DeliveryViewSet(viewsets.ModelViewSet):
         Returns:
             Response: Данные созданной доставки
         """
-        logger.info(f"Создание новой доставки: {request.data}")
-        print(f"Создание новой доставки: {request.data}")
-        
-        # Обработка связанных моделей
-        transport_model_id = request.data.get('transport_model_id')
-        packaging_id = request.data.get('packaging_id')
-        service_ids = request.data.get('service_ids', [])
-        status_id = request.data.get('status_id')
-        courier_id = request.data.get('courier_id')
+        logger.info("Создание новой доставки: %s", payload(request.data))
         
-        try:
-            # Получаем модель транспорта
-            if not transport_model_id:
+        related_ids = {}
+        for name in ('transport_model', 'packaging', 'status'):
+            if not request.data.get(f'{name}_id'):
                 return Response(
-                    {"error": "Необходимо указать transport_model_id"},
+                    {"error": f"Необходимо указать {name}_id"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            try:
-                transport_model = TransportModel.objects.get(id=transport_model_id)
-                print(f"Модель транспорта: {transport_model.id} ({transport_model.name})")
-            except TransportModel.DoesNotExist:
-                return Response(
-                    {"error": f"Модель транспорта с ID {transport_model_id} не найдена"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Получаем тип упаковки
-            if not packaging_id:
-                return Response(
-                    {"error": "Необходимо указать packaging_id"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            try:
-                packaging = PackagingType.objects.get(id=packaging_id)
-                print(f"Тип упаковки: {packaging.id} ({packaging.name})")
-            except PackagingType.DoesNotExist:
-                return Response(
-                    {"error": f"Тип упаковки с ID {packaging_id} не найден"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Получаем статус
-            if not status_id:
-                return Response(
-                    {"error": "Необходимо указать status_id"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            try:
-                status_obj = Status.objects.get(id=status_id)
-                print(f"Статус: {status_obj.id} ({status_obj.name})")
-            except Status.DoesNotExist:
-                return Response(
-                    {"error": f"Статус с ID {status_id} не найден"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Получаем курьера (если указан)
-            courier = None
-            if courier_id:
-                try:
-                    courier = User.objects.get(id=courier_id)
-                    print(f"Курьер: {courier.id} ({courier.username})")
-                except User.DoesNotExist:
-                    return Response(
-                        {"error": f"Курьер с ID {courier_id} не найден"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            # Создаем новую доставку
+            related_ids[name] = request.data[f'{name}_id']
+        if request.data.get('courier_id'):
+            related_ids['courier'] = request.data['courier_id']
+        service_ids = request.data.get('service_ids', [])
+        
+        try:
             delivery = Delivery(
-                transport_model=transport_model,
-                packaging=packaging,
-                status=status_obj,
-                courier=courier,
-                transport_number=request.data.get('transport_number', ''),
-                start_time=request.data.get('start_time'),
-                end_time=request.data.get('end_time'),
-                distance=request.data.get('distance', 0),
-                technical_condition=request.data.get('technical_condition', 'Исправно'),
-                source_address=request.data.get('source_address', ''),
-                destination_address=request.data.get('destination_address', ''),
-                source_lat=request.data.get('source_lat'),
-                source_lon=request.data.get('source_lon'),
-                dest_lat=request.data.get('dest_lat'),
-                dest_lon=request.data.get('dest_lon')
+                transport_number='',
+                distance=0,
+                technical_condition='Исправно',
+                source_address='',
+                destination_address=''
             )
-            
-            # Сохраняем доставку
-            delivery.save()
-            print(f"Доставка создана с ID: {delivery.id}")
-            
-            # Добавляем услуги
-            if service_ids:
-                for service_id in service_ids:
-                    try:
-                        service = Service.objects.get(id=service_id)
-                        delivery.services.add(service)
-                        print(f"Добавлена услуга: {service.id} ({service.name})")
-                    except Service.DoesNotExist:
-                        print(f"Услуга с ID {service_id} не найдена")
-                        # Не прерываем выполнение, просто пропускаем эту услугу
+            # Проверка ID (по запросу на таблицу), INSERT доставки и услуг - одна транзакция
+            with transaction.atomic():
+                writes.set_related(delivery, related_ids)
+                writes.set_fields(delivery, request.data)
+                delivery.save()
+                if service_ids:
+                    writes.set_services(delivery, writes.existing_service_ids(service_ids), current=())
+            logger.info("Доставка создана с ID %s", delivery.pk)
             
             # Возвращаем созданную доставку
-            serializer = self.get_serializer(delivery)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return self.delivery_response(
+                delivery, lambda: self.get_serializer(delivery).data, status.HTTP_201_CREATED
+            )
             
+        except writes.RelatedNotFound as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            logger.error(f"Ошибка при создании доставки: {str(e)}")
-            print(f"Ошибка при создании доставки: {str(e)}")
+            logger.exception("Ошибка при создании доставки")
             return Response(
                 {"error": f"Ошибка при создании доставки: {str(e)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Создает пакет доставок (до DELIVERY_BULK_MAX_ITEMS за запрос).
+
+        Справочники задаются названиями и создаются при необходимости,
+        курьер - ID. Элементы с ошибками пропускаются, остальные
+        создаются за фиксированное число запросов.
+
+        Args:
+            request: HTTP запрос {"deliveries": [...]}
+
+        Returns:
+            Response: Результат по каждому элементу в порядке запроса
+        """
+        items = request.data.get('deliveries')
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Необходимо указать список deliveries"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.DELIVERY_BULK_MAX_ITEMS:
+            return Response(
+                {"error": f"Не больше {settings.DELIVERY_BULK_MAX_ITEMS} доставок за запрос"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        logger.info("Пакетное создание доставок: %s", len(items))
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = DeliveryBulkItemSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'status': 'error', 'error': serializer.errors}
+
+        # Курьеры проверяются одним запросом
+        courier_ids = {data['courier_id'] for _, data in valid if data.get('courier_id') is not None}
+        existing = set(User.objects.filter(pk__in=courier_ids).values_list('pk', flat=True))
+        for index, data in valid:
+            if data.get('courier_id') is not None and data['courier_id'] not in existing:
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'error': writes.RELATED_NOT_FOUND['courier'].format(data['courier_id'])
+                }
+        valid = [(index, data) for index, data in valid if results[index] is None]
+
+        if valid:
+            deliveries = writes.create_deliveries([data for _, data in valid])
+            for (index, _), delivery in zip(valid, deliveries):
+                results[index] = {'index': index, 'status': 'created', 'id': delivery.pk}
+
+        return Response(results)
+
 class AvailableDeliveriesView(views.APIView):
     """Представление для получения доступных доставок."""
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'poll'
 
     def get(self, request):
         """
         Получает список доставок без назначенного курьера и со статусом "В ожидании".
-        Поддерживает фильтрацию по максимальному расстоянию и сортировку.
+        Поддерживает фильтрацию по максимальному расстоянию и сортировку,
+        а также выбор полей параметрами fields и expand.
         
         Args:
             request: HTTP запрос
@@ -570,47 +821,24 @@ class AvailableDeliveriesView(views.APIView):
         """
         # Получаем или создаем статус "В ожидании"
         status_obj, _ = Status.objects.get_or_create(
-            name="В ожидании",
+            name=queries.PENDING_STATUS_NAME,
             defaults={'color': 'yellow'}
         )
 
         # Получаем доставки без курьера и с нужным статусом
-        deliveries = Delivery.objects.filter(
-            courier__isnull=True,
-            status=status_obj
-        ).select_related(
-            'transport_model',
-            'packaging',
-            'status'
-        ).prefetch_related('services')
-        
-        # Фильтрация по максимальному расстоянию
-        max_distance = request.query_params.get('max_distance')
-        if max_distance and max_distance.isdigit():
-            deliveries = deliveries.filter(distance__lte=float(max_distance))
-        
-        # Сортировка
-        sort_by = request.query_params.get('sort_by')
-        if sort_by:
-            if sort_by == 'distance':
-                deliveries = deliveries.order_by('distance')
-            elif sort_by == '-distance':
-                deliveries = deliveries.order_by('-distance')
-            elif sort_by == 'start_time':
-                deliveries = deliveries.order_by('start_time')
-            elif sort_by == '-start_time':
-                deliveries = deliveries.order_by('-start_time')
-
-        serializer = DeliverySerializer(deliveries, many=True)
-        return Response(serializer.data)
+        deliveries = queries.available_deliveries(status_obj, request.query_params)
+
+        return Response(fragments.DeliveryFragments(DeliveryFieldset.from_request(request)).render(deliveries))
 
 class MyActiveDeliveriesView(views.APIView):
     """Представление для получения активных доставок курьера."""
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'poll'
 
     def get(self, request):
         """
         Получает список активных доставок текущего курьера.
+        Поддерживает выбор полей параметрами fields и expand.
         
         Args:
             request: HTTP запрос
@@ -618,19 +846,20 @@ class MyActiveDeliveriesView(views.APIView):
         Returns:
             Response: Список активных доставок
         """
-        deliveries = Delivery.objects.filter(
-            courier=request.user
-        ).exclude(status__name="Доставлено")
-        serializer = DeliverySerializer(deliveries, many=True)
-        return Response(serializer.data)
+        deliveries = queries.my_active_deliveries(request.user)
+        return Response(fragments.DeliveryFragments(DeliveryFieldset.from_request(request)).render(deliveries))
 
 class MyHistoryDeliveriesView(views.APIView):
     """Представление для получения истории доставок курьера."""
     permission_classes = [IsAuthenticated]
+    throttle_scope = 'poll'
+    # GET допускает отставание реплики
+    replica_safe = True
 
     def get(self, request):
         """
         Получает историю доставок текущего курьера.
+        Поддерживает выбор полей параметрами fields и expand.
         
         Args:
             request: HTTP запрос
@@ -638,16 +867,110 @@ class MyHistoryDeliveriesView(views.APIView):
         Returns:
             Response: История доставок
         """
-        deliveries = Delivery.objects.filter(
-            courier=request.user,
-            status__name="Доставлено"
-        )
-        serializer = DeliverySerializer(deliveries, many=True)
-        return Response(serializer.data)
+        deliveries = queries.my_history_deliveries(request.user)
+        return Response(fragments.DeliveryFragments(DeliveryFieldset.from_request(request)).render(deliveries))
+
+class StatusDurationReportView(views.APIView):
+    """Отчет о времени доставок в статусах (по дневным суммам, без чтения журнала)."""
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'export'
+    # GET допускает отставание реплики
+    replica_safe = True
+
+    def get(self, request):
+        """
+        Возвращает время в статусах за период.
+
+        Args:
+            request: HTTP запрос с параметрами date_from и date_to (YYYY-MM-DD),
+                по умолчанию - последние 30 дней
+
+        Returns:
+            Response: Переходы, выходы и среднее время по статусам
+        """
+        today = timezone.localdate()
+        date_from = _parse_date(request.query_params.get('date_from'), today - timedelta(days=29))
+        date_to = _parse_date(request.query_params.get('date_to'), today)
+        rows = queries.status_durations(date_from, date_to)
+        return Response(queries.status_duration_report(rows))
+
+class CourierLocationView(views.APIView):
+    """Прием пачек GPS-точек текущего курьера."""
+    permission_classes = [IsAuthenticated]
+    parser_classes = [ORJSONParser, locations.FixesParser]
+    throttle_scope = 'location'
+
+    def post(self, request):
+        """
+        Принимает точки JSON-массивом (или {"fixes": [...]}) или в двоичном формате.
+
+        Точки пишутся в базу пачками в фоне, поэтому ответ - 202. Точки
+        с доставкой, не назначенной текущему курьеру, отбрасываются.
+
+        Args:
+            request: HTTP запрос
+
+        Returns:
+            Response: Число полученных, принятых, прореженных и отброшенных точек
+        """
+        data = request.data
+        if isinstance(data, bytes):
+            count = len(data) // locations.FIX.size
+        else:
+            data = data.get('fixes') if isinstance(data, dict) else data
+            count = len(data) if isinstance(data, list) else 0
+        if count > settings.LOCATION_MAX_BATCH:
+            return Response(
+                {"error": f"Не больше {settings.LOCATION_MAX_BATCH} точек за запрос"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if isinstance(data, bytes):
+            fixes, rejected = locations.parse_binary(data)
+        else:
+            fixes, rejected = locations.parse_json(data)
+        fixes, foreign = locations.assigned_fixes(request.user.pk, fixes)
+        result = locations.ingest(request.user.pk, fixes, rejected + foreign)
+        return Response(result, status=status.HTTP_202_ACCEPTED)
+
+class CourierTrackView(views.APIView):
+    """Трек курьера за период."""
+    permission_classes = [IsAuthenticated]
+    throttle_scope = 'poll'
+    # GET допускает отставание реплики
+    replica_safe = True
+
+    def get(self, request, courier_id):
+        """
+        Возвращает трек курьера, упрощенный для масштаба карты.
+
+        Трек доступен самому курьеру и сотрудникам (is_staff).
+
+        Args:
+            request: HTTP запрос с параметрами from и to (ISO 8601, по умолчанию
+                последний час; не длиннее TRACK_MAX_WINDOW_HOURS) и zoom
+            courier_id: ID курьера
+
+        Returns:
+            Response: Трек в формате polyline со временем точек
+
+        Raises:
+            PermissionDenied: Чужой трек запрашивает не сотрудник
+        """
+        if courier_id != request.user.pk and not request.user.is_staff:
+            raise PermissionDenied("Трек доступен только самому курьеру")
+        end = _parse_datetime(request.query_params.get('to'), timezone.now())
+        start = _parse_datetime(request.query_params.get('from'), end - timedelta(hours=1))
+        if not start <= end <= start + timedelta(hours=settings.TRACK_MAX_WINDOW_HOURS):
+            raise ParseError(f"Период должен быть не длиннее {settings.TRACK_MAX_WINDOW_HOURS} ч")
+        track = tracks.build_track(queries.courier_locations(courier_id, start, end), _parse_zoom(request))
+        return Response({'courier': courier_id, **track})
 
 class ProfileView(views.APIView):
     """Представление для профиля курьера и статистики."""
     permission_classes = [IsAuthenticated]
+    # GET допускает отставание реплики
+    replica_safe = True
 
     def get(self, request):
         """
@@ -668,30 +991,16 @@ class ProfileView(views.APIView):
         ).count()
 
         # Успешные доставки (только из раздела "История")
-        successful_deliveries = Delivery.objects.filter(
-            courier=request.user,
-            status__name="Доставлено"
-        ).count()
+        completed_deliveries = queries.my_history_deliveries(request.user)
+        successful_deliveries = completed_deliveries.count()
 
         # Вычисляем общее время доставки в секундах только для завершенных доставок
-        completed_deliveries = Delivery.objects.filter(
-            courier=request.user,
-            status__name="Доставлено"
+        stats = queries.courier_stats(
+            total_deliveries,
+            successful_deliveries,
+            completed_deliveries.values_list('start_time', 'end_time')
         )
 
-        total_delivery_time = 0
-        for delivery in completed_deliveries:
-            if delivery.end_time and delivery.start_time:
-                duration = delivery.end_time - delivery.start_time
-                total_delivery_time += duration.total_seconds()
-
-        stats = {
-            'total_deliveries': total_deliveries,
-            'successful_deliveries': successful_deliveries,
-            'total_delivery_time_seconds': round(total_delivery_time, 2),
-            'total_delivery_time_hours': round(total_delivery_time / 3600, 2)  # Конвертируем в часы для удобства
-        }
-
         return Response({**serializer.data, **stats})
         
     def put(self, request):
@@ -744,3 +1053,5 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    # Подбор паролей ограничивается по IP
+    throttle_scope = 'login'
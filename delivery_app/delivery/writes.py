@@ -0,0 +1,291 @@
+"""
+Запись доставок за минимальное число SQL-запросов.
+
+Связанные объекты проверяются одним запросом на таблицу, набор услуг
+изменяется по разнице с текущим (одна вставка и одно удаление), а
+UPDATE доставки включает только изменившиеся поля. Справочники по
+названию находятся или создаются одним INSERT ... ON CONFLICT на таблицу.
+"""
+
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from . import events, maps
+from .models import Delivery, PackagingType, Service, Status, TransportModel
+from .push import delivery_event, publish_delivery_event
+
+logger = logging.getLogger(__name__)
+
+# pylint: disable=no-member
+# objects - это стандартный атрибут Django моделей
+
+# Внешние ключи доставки и их модели
+RELATED_MODELS = {
+    'transport_model': TransportModel,
+    'packaging': PackagingType,
+    'status': Status,
+    'courier': User,
+}
+
+# Собственные поля доставки, которые можно изменить через API
+EDITABLE_FIELDS = (
+    'transport_number', 'start_time', 'end_time', 'distance',
+    'technical_condition', 'source_address', 'destination_address',
+    'source_lat', 'source_lon', 'dest_lat', 'dest_lon',
+)
+
+RELATED_NOT_FOUND = {
+    'transport_model': "Модель транспорта с ID {} не найдена",
+    'packaging': "Тип упаковки с ID {} не найден",
+    'status': "Статус с ID {} не найден",
+    'courier': "Курьер с ID {} не найден",
+}
+
+# Больше созданных доставок - одно событие resync вместо события на каждую
+BULK_EVENT_LIMIT = 500
+
+
+class RelatedNotFound(Exception):
+    """Указан ID несуществующего связанного объекта."""
+
+    def __init__(self, name, pk):
+        super().__init__(RELATED_NOT_FOUND[name].format(pk))
+        self.name = name
+        self.pk = pk
+
+
+def set_related(delivery, ids):
+    """
+    Присваивает доставке связанные объекты по ID.
+
+    Загружаются только объекты, ID которых отличается от текущего,
+    по одному запросу на таблицу.
+
+    Args:
+        delivery: Доставка
+        ids: Имя внешнего ключа -> ID
+
+    Returns:
+        list: Имена изменившихся внешних ключей
+
+    Raises:
+        RelatedNotFound: Объекта с таким ID нет
+    """
+    changed = []
+    for name, pk in ids.items():
+        field = Delivery._meta.get_field(name)
+        pk = field.target_field.to_python(pk)
+        if getattr(delivery, field.attname) == pk:
+            continue
+        obj = RELATED_MODELS[name].objects.filter(pk=pk).first()
+        if obj is None:
+            raise RelatedNotFound(name, pk)
+        setattr(delivery, name, obj)
+        changed.append(name)
+    return changed
+
+
+def set_fields(delivery, data, fields=EDITABLE_FIELDS):
+    """
+    Присваивает доставке поля из данных запроса.
+
+    Returns:
+        list: Имена изменившихся полей
+    """
+    changed = []
+    for name in fields:
+        if name not in data:
+            continue
+        value = Delivery._meta.get_field(name).to_python(data[name])
+        if getattr(delivery, name) != value:
+            setattr(delivery, name, value)
+            changed.append(name)
+    return changed
+
+
+def existing_service_ids(service_ids):
+    """
+    Оставляет ID существующих услуг (один запрос); остальные пропускаются.
+
+    Returns:
+        list: ID услуг в исходном порядке без повторов
+    """
+    wanted = list(dict.fromkeys(int(service_id) for service_id in service_ids))
+    found = set(Service.objects.filter(pk__in=wanted).values_list('pk', flat=True))
+    for service_id in wanted:
+        if service_id not in found:
+            logger.warning("Услуга с ID %s не найдена", service_id)
+    return [service_id for service_id in wanted if service_id in found]
+
+
+def upsert_by_name(model, rows):
+    """
+    ID справочных записей по названию; недостающие создаются.
+
+    Один INSERT ... ON CONFLICT (name) DO UPDATE ... RETURNING id:
+    существующие строки не меняются, но их ID возвращаются, а
+    параллельные запросы с теми же названиями не получают ошибку
+    уникальности. Названия сортируются, чтобы параллельные вставки
+    блокировали строки в одном порядке.
+
+    Args:
+        model: Модель с уникальным полем name
+        rows: Название -> поля новой записи (dict) или итерируемое названий
+
+    Returns:
+        dict: Название -> ID
+    """
+    if not isinstance(rows, dict):
+        rows = dict.fromkeys(rows)
+    if not rows:
+        return {}
+    objs = model.objects.bulk_create(
+        [model(name=name, **(rows[name] or {})) for name in sorted(rows)],
+        update_conflicts=True,
+        unique_fields=['name'],
+        update_fields=['name'],
+    )
+    return {obj.name: obj.pk for obj in objs}
+
+
+def service_ids_by_name(names):
+    """
+    ID услуг по названиям; недостающие услуги создаются (один запрос).
+
+    Returns:
+        list: ID услуг в порядке названий
+    """
+    names = list(dict.fromkeys(names))
+    ids = upsert_by_name(Service, names)
+    return [ids[name] for name in names]
+
+
+def set_services(delivery, service_ids, current=None):
+    """
+    Приводит набор услуг доставки к service_ids.
+
+    Текущий набор читается одним запросом (или передается для новой
+    доставки), затем добавляются недостающие связи одной вставкой и
+    удаляются лишние одним DELETE.
+
+    Args:
+        delivery: Сохраненная доставка
+        service_ids: ID существующих услуг
+        current: Текущие ID услуг, если известны
+
+    Returns:
+        bool: True, если набор изменился
+    """
+    through = Delivery.services.through
+    links = through.objects.filter(delivery_id=delivery.pk)
+    if current is None:
+        current = set(links.values_list('service_id', flat=True))
+    wanted = set(service_ids)
+    added = wanted - set(current)
+    removed = set(current) - wanted
+    if added:
+        through.objects.bulk_create([
+            through(delivery_id=delivery.pk, service_id=service_id) for service_id in service_ids
+            if service_id in added
+        ])
+    if removed:
+        links.filter(service_id__in=removed).delete()
+    # Закэшированный набор услуг устарел
+    getattr(delivery, '_prefetched_objects_cache', {}).pop('services', None)
+    return bool(added or removed)
+
+
+def save_changes(delivery, changed, services_changed=False):
+    """
+    Сохраняет только изменившиеся поля доставки.
+
+    Изменение услуг тоже увеличивает версию доставки: UPDATE выполняется
+    с одним полем version.
+
+    Args:
+        delivery: Доставка
+        changed: Имена изменившихся полей
+        services_changed: Изменился ли набор услуг
+
+    Returns:
+        bool: True, если доставка сохранена
+    """
+    if not changed and not services_changed:
+        return False
+    delivery.save(update_fields=changed)
+    return True
+
+
+def create_deliveries(items):
+    """
+    Создает пакет доставок за фиксированное число запросов.
+
+    Справочники по названию - один upsert на таблицу, доставки и связи
+    с услугами - bulk_create пачками DELIVERY_BULK_BATCH_SIZE, все в
+    одной транзакции. bulk_create обходит сигналы модели, поэтому события
+    push-канала и журнала изменений публикуются, а ячейки карты
+    обновляются здесь.
+
+    Args:
+        items: Проверенные данные DeliveryBulkItemSerializer
+
+    Returns:
+        list: Созданные доставки в порядке items
+    """
+    statuses = {}
+    for item in items:
+        statuses.setdefault(item['status']['name'], {
+            key: value for key, value in item['status'].items() if key != 'name'
+        })
+    batch_size = settings.DELIVERY_BULK_BATCH_SIZE
+
+    with transaction.atomic():
+        transport_model_ids = upsert_by_name(TransportModel, {item['transport_model']['name'] for item in items})
+        packaging_ids = upsert_by_name(PackagingType, {item['packaging']['name'] for item in items})
+        status_ids = upsert_by_name(Status, statuses)
+        service_ids = upsert_by_name(Service, {
+            service['name'] for item in items for service in item.get('services', ())
+        })
+
+        deliveries = []
+        for item in items:
+            fields = {
+                key: value for key, value in item.items()
+                if key not in ('transport_model', 'packaging', 'status', 'services')
+            }
+            deliveries.append(Delivery(
+                transport_model_id=transport_model_ids[item['transport_model']['name']],
+                packaging_id=packaging_ids[item['packaging']['name']],
+                status_id=status_ids[item['status']['name']],
+                **fields
+            ))
+        Delivery.objects.bulk_create(deliveries, batch_size=batch_size)
+
+        through = Delivery.services.through
+        through.objects.bulk_create([
+            through(delivery_id=delivery.pk, service_id=service_id)
+            for delivery, item in zip(deliveries, items)
+            for service_id in dict.fromkeys(service_ids[service['name']] for service in item.get('services', ()))
+        ], batch_size=batch_size)
+
+        events.record(
+            event for delivery in deliveries
+            for event in events.delivery_changes(
+                delivery.pk, {}, {'status': delivery.status_id, 'courier': delivery.courier_id}, created=True
+            )
+        )
+        maps.record_moves(
+            (None, maps.point({name: getattr(delivery, name) for name in maps.FIELDS}))
+            for delivery in deliveries
+        )
+        if len(deliveries) > BULK_EVENT_LIMIT:
+            publish_delivery_event({'op': 'resync'})
+        else:
+            for delivery in deliveries:
+                publish_delivery_event(delivery_event('created', delivery, delivery.courier_id, delivery.status_id))
+
+    logger.info("Создано доставок пакетом: %s", len(deliveries))
+    return deliveries
@@ -2,6 +2,8 @@
 ASGI config for delivery_app project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+WebSocket connections to /ws/deliveries/ are served by the delivery push
+channel, everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -13,4 +15,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'delivery_app.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from delivery.push import websocket_application  # noqa: E402  (после настройки Django)
+
+WEBSOCKET_PATHS = {
+    '/ws/deliveries/': websocket_application,
+}
+
+
+async def application(scope, receive, send):
+    """Направляет WebSocket в push-канал, остальное - в Django."""
+    if scope['type'] == 'websocket':
+        handler = WEBSOCKET_PATHS.get(scope['path'])
+        if handler is None:
+            await send({'type': 'websocket.close', 'code': 4404})
+            return
+        return await handler(scope, receive, send)
+    return await django_application(scope, receive, send)
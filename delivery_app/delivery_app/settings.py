@@ -6,6 +6,7 @@ Django settings for delivery_app project.
 from pathlib import Path
 from datetime import timedelta
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
@@ -27,6 +28,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # Поиск: триграммы и полнотекстовый поиск
     "rest_framework",
     "rest_framework_simplejwt",
     "corsheaders",
@@ -34,13 +36,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "delivery.middleware.MetricsMiddleware",  # Метрики Prometheus (первым)
+    "delivery.middleware.RequestContextMiddleware",  # ID запроса в логах
+    "delivery.middleware.LoadSheddingMiddleware",  # Сброс нагрузки при перегрузке
     "django.middleware.security.SecurityMiddleware",
+    "delivery.middleware.CompressionMiddleware",  # Сжатие ответов
+    "delivery.middleware.ReplicaRoutingMiddleware",  # Чтение с реплик
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",  # Для CORS
     "django.middleware.common.CommonMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "delivery.middleware.ProfilingMiddleware",  # Профилирование по требованию
 ]
 
 # CORS settings
@@ -77,27 +85,261 @@ TEMPLATES = [
 WSGI_APPLICATION = "delivery_app.wsgi.application"
 
 # Database
-DATABASES = {
-    "default": {
+# DB_POOL_MODE: psycopg - пул соединений psycopg 3 в каждом процессе,
+# pgbouncer - постоянные соединения к внешнему пулеру в режиме транзакций,
+# off - новое соединение на каждый запрос
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'psycopg')
+
+
+def _database(host, port):
+    """Настройки подключения к PostgreSQL с учетом режима пула."""
+    database = {
         "ENGINE": "django.db.backends.postgresql",
         "NAME": os.getenv('DB_NAME'),
         "USER": os.getenv('DB_USER'),
         "PASSWORD": os.getenv('DB_PASSWORD'),
-        "HOST": os.getenv('DB_HOST'),
-        "PORT": os.getenv('DB_PORT'),
+        "HOST": host,
+        "PORT": port,
+    }
+    if DB_POOL_MODE == 'psycopg':
+        database["OPTIONS"] = {
+            "pool": {
+                # max_size * число воркеров не должно превышать max_connections
+                "min_size": int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+                "max_size": int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+                "timeout": float(os.getenv('DB_POOL_TIMEOUT', '10')),
+                "max_idle": float(os.getenv('DB_POOL_MAX_IDLE', '300')),
+            },
+        }
+        # Django проверяет соединение перед выдачей из пула (check пула)
+        database["CONN_HEALTH_CHECKS"] = True
+    elif DB_POOL_MODE == 'pgbouncer':
+        database["CONN_MAX_AGE"] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+        database["CONN_HEALTH_CHECKS"] = True
+        # Серверные курсоры не переживают смену соединения в режиме транзакций
+        database["DISABLE_SERVER_SIDE_CURSORS"] = True
+    return database
+
+
+DATABASES = {
+    "default": _database(os.getenv('DB_HOST'), os.getenv('DB_PORT')),
+}
+
+# Реплики для чтения: DB_REPLICAS=host1:5432,host2:5432
+DATABASE_REPLICAS = []
+for _index, _replica in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(','))):
+    _host, _, _port = _replica.strip().partition(':')
+    _alias = f'replica_{_index}'
+    DATABASES[_alias] = _database(_host, _port or os.getenv('DB_PORT'))
+    # В тестах реплика указывает на тестовую копию основной базы
+    DATABASES[_alias]["TEST"] = {"MIRROR": "default"}
+    DATABASE_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ["delivery.db_router.ReplicaRouter"]
+
+# Сколько секунд после записи пользователь читает только из основной базы
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+
+# Cache (общий для всех процессов, если задан REDIS_URL)
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
+
+# Кэш JSON-представлений доставок (delivery.fragments): кэш процесса на
+# DELIVERY_FRAGMENT_LOCAL_SIZE записей перед общим кэшем DELIVERY_FRAGMENT_CACHE
+# и время жизни представления в секундах
+DELIVERY_FRAGMENT_CACHE = os.getenv('DELIVERY_FRAGMENT_CACHE', 'default')
+DELIVERY_FRAGMENT_TIMEOUT = int(os.getenv('DELIVERY_FRAGMENT_TIMEOUT', '3600'))
+DELIVERY_FRAGMENT_LOCAL_SIZE = int(os.getenv('DELIVERY_FRAGMENT_LOCAL_SIZE', '10000'))
+CACHES['delivery_fragments'] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "delivery-fragments",
+    "TIMEOUT": DELIVERY_FRAGMENT_TIMEOUT,
+    "OPTIONS": {"MAX_ENTRIES": DELIVERY_FRAGMENT_LOCAL_SIZE},
 }
 
 # REST Framework settings
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "delivery.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "delivery.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "delivery.renderers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    "DEFAULT_THROTTLE_CLASSES": [
+        "delivery.throttling.TokenBucketThrottle",
+    ],
+}
+
+# Ограничение частоты запросов (token bucket) по пользователю и классу маршрута.
+# THROTTLE_RATES: класс=размер корзины:токенов в секунду через запятую, например
+# poll=30:2,sync=10:0.1. Корзины хранятся в Redis (при REDIS_URL) или в файле
+# THROTTLE_SHM_PATH, общем для процессов сервера (THROTTLE_STORE=redis|shm|local).
+# THROTTLE_ENABLED=False отключает ограничение (нагрузочные тесты с одного IP)
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_BUCKETS = {
+    'poll': (30, 2.0),
+    'write': (60, 1.0),
+    'sync': (10, 0.1),
+    'map': (60, 4.0),
+    'export': (5, 0.02),
+    'login': (10, 0.05),
+    'location': (20, 1.0),
+}
+THROTTLE_BUCKETS.update({
+    scope.strip(): tuple(float(value) for value in bucket.split(':'))
+    for scope, _, bucket in (
+        item.rpartition('=') for item in os.getenv('THROTTLE_RATES', '').split(',') if item
+    )
+})
+if not THROTTLE_ENABLED:
+    THROTTLE_BUCKETS = {}
+THROTTLE_REDIS_URL = os.getenv('REDIS_URL')
+THROTTLE_STORE = os.getenv('THROTTLE_STORE', 'redis' if THROTTLE_REDIS_URL else 'shm')
+THROTTLE_SHM_PATH = os.getenv('THROTTLE_SHM_PATH', os.path.join(tempfile.gettempdir(), 'delivery-throttle'))
+THROTTLE_SHM_SLOTS = int(os.getenv('THROTTLE_SHM_SLOTS', '65536'))
+
+# Сброс нагрузки (delivery.concurrency): цели времени ответа классов запросов
+# в секундах, например LOAD_SHEDDING_TARGETS=critical=0.3,low=2. Медленнее цели -
+# лимит параллельных запросов low (опрос, поиск, выгрузки) на процесс уменьшается
+LOAD_SHEDDING_ENABLED = os.getenv('LOAD_SHEDDING_ENABLED', 'True') == 'True'
+LOAD_SHEDDING_TARGETS = {'critical': 0.5, 'default': 1.0, 'low': 2.0}
+LOAD_SHEDDING_TARGETS.update({
+    name.strip(): float(target)
+    for name, _, target in (
+        item.rpartition('=') for item in os.getenv('LOAD_SHEDDING_TARGETS', '').split(',') if item
+    )
+})
+LOAD_SHEDDING_MAX_LOW = int(os.getenv('LOAD_SHEDDING_MAX_LOW', '16'))
+LOAD_SHEDDING_MIN_LOW = float(os.getenv('LOAD_SHEDDING_MIN_LOW', '0.05'))
+# Запрос low, ждавший в очереди балансировщика (X-Request-Start) дольше, сбрасывается
+LOAD_SHEDDING_MAX_QUEUE = float(os.getenv('LOAD_SHEDDING_MAX_QUEUE', '1.0'))
+
+# Без ?fields= и ?expand= эндпоинты доставок возвращают связанные объекты
+# как ID, только если включен этот флаг (старые клиенты ждут вложенные объекты)
+DELIVERY_COMPACT_BY_DEFAULT = os.getenv('DELIVERY_COMPACT_BY_DEFAULT', 'False') == 'True'
+
+# Пакетное создание доставок (/api/deliveries/bulk/): наибольшее число доставок
+# в запросе и размер пачки INSERT. Тело запроса ограничено DATA_UPLOAD_MAX_MEMORY_SIZE
+DELIVERY_BULK_MAX_ITEMS = int(os.getenv('DELIVERY_BULK_MAX_ITEMS', '5000'))
+DELIVERY_BULK_BATCH_SIZE = int(os.getenv('DELIVERY_BULK_BATCH_SIZE', '1000'))
+DATA_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('DATA_UPLOAD_MAX_MEMORY_SIZE', str(10 * 1024 * 1024)))
+
+# Прием GPS-точек курьеров (delivery.locations): прореживание (точки чаще
+# LOCATION_MIN_INTERVAL секунд и ближе LOCATION_MIN_DISTANCE метров к предыдущей
+# не сохраняются), размер пачки записи и период записи фоновым потоком
+LOCATION_MIN_INTERVAL = float(os.getenv('LOCATION_MIN_INTERVAL', '5'))
+LOCATION_MIN_DISTANCE = float(os.getenv('LOCATION_MIN_DISTANCE', '10'))
+LOCATION_FLUSH_SIZE = int(os.getenv('LOCATION_FLUSH_SIZE', '5000'))
+LOCATION_FLUSH_INTERVAL = float(os.getenv('LOCATION_FLUSH_INTERVAL', '1'))
+LOCATION_MAX_BATCH = int(os.getenv('LOCATION_MAX_BATCH', '2000'))
+
+# Треки (delivery.tracks): допуск упрощения в пикселях карты, время кэша
+# треков завершенных доставок и наибольший период трека курьера
+TRACK_TOLERANCE_PX = float(os.getenv('TRACK_TOLERANCE_PX', '1'))
+TRACK_CACHE_SECONDS = int(os.getenv('TRACK_CACHE_SECONDS', '86400'))
+TRACK_MAX_WINDOW_HOURS = int(os.getenv('TRACK_MAX_WINDOW_HOURS', '24'))
+
+# Кластеры доставок на карте (delivery.maps): наибольший уровень ячеек
+# (после изменения - python manage.py delivery_map_cells), размер ячейки
+# кластера 256 / 2**MAP_CLUSTER_CELL_SHIFT пикселей и наибольшее число
+# ячеек в окне карты
+MAP_MAX_LEVEL = int(os.getenv('MAP_MAX_LEVEL', '18'))
+MAP_CLUSTER_CELL_SHIFT = int(os.getenv('MAP_CLUSTER_CELL_SHIFT', '2'))
+MAP_MAX_CELLS = int(os.getenv('MAP_MAX_CELLS', '10000'))
+
+# Сжатие ответов
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_ENCODINGS = ['zstd', 'br', 'gzip']
+COMPRESSION_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+
+# Метрики Prometheus (/metrics). Для нескольких воркеров задайте
+# переменную окружения PROMETHEUS_MULTIPROC_DIR (пустой каталог при старте).
+# METRICS_TOKEN - токен сборщика (Authorization: Bearer); без него /metrics
+# доступен только сотрудникам, вошедшим в admin
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# Профилирование запросов (отчеты в админке, Profile Reports).
+# PROFILING_SAMPLE_RATES: маршрут=доля через запятую, например
+# api/deliveries/<int:pk>/update-all/=0.01,api/deliveries/sync/=0.05
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATES = {
+    route.strip(): float(rate)
+    for route, _, rate in (
+        item.rpartition('=') for item in os.getenv('PROFILING_SAMPLE_RATES', '').split(',') if item
+    )
+}
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', '0.001'))
+PROFILING_EXPLAIN_TOP = int(os.getenv('PROFILING_EXPLAIN_TOP', '5'))
+
+# Логирование: JSON-строки в stdout через очередь и фоновый поток.
+# LOG_SAMPLING: логгер=доля записей ниже WARNING через запятую, например
+# delivery.views=0.1,django.db.backends=0.01
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_PAYLOAD_LIMIT = int(os.getenv('LOG_PAYLOAD_LIMIT', '2048'))
+LOG_SAMPLING = {
+    name.strip(): float(rate)
+    for name, _, rate in (
+        item.rpartition('=') for item in os.getenv('LOG_SAMPLING', '').split(',') if item
+    )
+}
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'delivery.log.JSONFormatter'},
+    },
+    'filters': {
+        'sampling': {'()': 'delivery.log.SamplingFilter', 'rates': LOG_SAMPLING},
+        'request_context': {'()': 'delivery.log.RequestContextFilter'},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'delivery.log.QueueLogHandler',
+            'queue_size': LOG_QUEUE_SIZE,
+            'formatter': 'json',
+            'filters': ['sampling', 'request_context'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': LOG_LEVEL},
+    'loggers': {
+        # Ошибки запросов пишет корневой обработчик, без дублирования в консоль
+        'django': {'handlers': [], 'level': LOG_LEVEL, 'propagate': True},
+    },
 }
 
+# Секционирование доставок по месяцам (PostgreSQL): секции вперед создают
+# post_migrate и команда delivery_partitions ensure (запускать по cron),
+# старые секции архивирует delivery_partitions archive
+DELIVERY_PARTITION_MONTHS_AHEAD = int(os.getenv('DELIVERY_PARTITION_MONTHS_AHEAD', '3'))
+DELIVERY_ARCHIVE_AFTER_MONTHS = int(os.getenv('DELIVERY_ARCHIVE_AFTER_MONTHS', '12'))
+
+# Push-канал изменений доставок (SSE и WebSocket)
+PUSH_ENABLED = os.getenv('PUSH_ENABLED', 'True') == 'True'
+PUSH_BROKER = os.getenv('PUSH_BROKER', 'delivery.broker.PostgresBroker')
+PUSH_CHANNEL = os.getenv('PUSH_CHANNEL', 'delivery_events')
+
 # JWT settings
 
 SIMPLE_JWT = {
@@ -105,6 +347,10 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+# Время жизни пользователя в кэше JWT аутентификации, секунд. Между процессами
+# кэш сбрасывается только при общем кэше (REDIS_URL), иначе - по истечении TTL
+AUTH_USER_CACHE_SECONDS = int(os.getenv('AUTH_USER_CACHE_SECONDS', '60'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -8,10 +8,13 @@ from django.conf.urls.static import static
 from django.views.generic import RedirectView
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
+from delivery import async_views
+from delivery.metrics import metrics_view
 from delivery.views import (
     TransportModelViewSet, PackagingTypeViewSet, ServiceViewSet, StatusViewSet,
     DeliveryViewSet, AvailableDeliveriesView, MyActiveDeliveriesView,
-    MyHistoryDeliveriesView, ProfileView, CustomTokenObtainPairView
+    MyHistoryDeliveriesView, ProfileView, StatusDurationReportView, CourierLocationView,
+    CourierTrackView, CustomTokenObtainPairView
 )
 
 router = DefaultRouter()
@@ -23,10 +26,12 @@ router.register(r'deliveries', DeliveryViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/deliveries/available/', AvailableDeliveriesView.as_view(), name='available_deliveries'),
     path('api/deliveries/my/active/', MyActiveDeliveriesView.as_view(), name='my_active_deliveries'),
     path('api/deliveries/my/history/', MyHistoryDeliveriesView.as_view(), name='my_history_deliveries'),
     path('api/deliveries/coordinates/', DeliveryViewSet.as_view({'get': 'coordinates'}), name='deliveries_coordinates'),
+    path('api/deliveries/search/', DeliveryViewSet.as_view({'get': 'search'}), name='deliveries_search'),
     path('api/deliveries/sync/', DeliveryViewSet.as_view({'post': 'sync'}), name='deliveries_sync'),
     path('api/deliveries/<int:pk>/assign/', DeliveryViewSet.as_view({'patch': 'assign'}), name='delivery_assign'),
     path('api/deliveries/<int:pk>/unassign/', DeliveryViewSet.as_view({'patch': 'unassign'}), name='delivery_unassign'),
@@ -35,6 +40,16 @@ urlpatterns = [
     path('api/deliveries/<int:pk>/update-all/', DeliveryViewSet.as_view({'patch': 'update_all'}), name='delivery_update_all'),
     path('api/deliveries/create_simple/', DeliveryViewSet.as_view({'post': 'create_simple'}), name='delivery_create_simple'),
     path('api/profile/', ProfileView.as_view(), name='profile'),
+    path('api/locations/', CourierLocationView.as_view(), name='courier_locations'),
+    path('api/couriers/<int:courier_id>/track/', CourierTrackView.as_view(), name='courier_track'),
+    path('api/reports/status-durations/', StatusDurationReportView.as_view(), name='status_duration_report'),
+    # Асинхронные версии эндпоинтов чтения (для запуска под ASGI)
+    path('api/async/deliveries/available/', async_views.available_deliveries, name='async_available_deliveries'),
+    path('api/async/deliveries/my/active/', async_views.my_active_deliveries, name='async_my_active_deliveries'),
+    path('api/async/deliveries/my/history/', async_views.my_history_deliveries, name='async_my_history_deliveries'),
+    path('api/async/deliveries/coordinates/', async_views.coordinates, name='async_deliveries_coordinates'),
+    path('api/async/profile/', async_views.profile, name='async_profile'),
+    path('api/async/deliveries/events/', async_views.delivery_events, name='async_delivery_events'),
     path('api/', include(router.urls)),
     path('api/token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
@@ -0,0 +1,45 @@
+"""
+Конфигурация uvicorn для запуска delivery_app под ASGI.
+
+Запуск из каталога delivery_app:
+    python -m delivery_app.uvicorn_config
+
+Асинхронные эндпоинты (/api/async/...) не занимают воркер на время
+ожидания базы и медленных клиентов; синхронные представления выполняются
+в пуле потоков asgiref. Каждый запрос к базе держит соединение из пула
+процесса (DB_POOL_MAX_SIZE), а запрос, не дождавшийся соединения за
+DB_POOL_TIMEOUT, падает с 500. Поэтому по умолчанию воркер принимает не
+больше DB_POOL_MAX_SIZE одновременных соединений и сразу отвечает 503 на
+остальные, а воркеров столько, сколько процессоров: на нагрузке,
+упирающейся в процессор, больше воркеров не помогает (README, п. 4).
+Соединения push-канала (SSE) и keep-alive тоже учитываются в лимите -
+при включенном push задайте UVICORN_LIMIT_CONCURRENCY явно.
+"""
+
+import os
+
+import uvicorn
+
+UVICORN_CONFIG = {
+    'app': 'delivery_app.asgi:application',
+    'host': os.getenv('UVICORN_HOST', '0.0.0.0'),
+    'port': int(os.getenv('UVICORN_PORT', '8000')),
+    'workers': int(os.getenv('UVICORN_WORKERS', str(os.cpu_count() or 1))),
+    # Django не обрабатывает события lifespan
+    'lifespan': 'off',
+    # Сверх этого числа соединений воркер сразу отвечает 503 (по умолчанию - размер пула базы)
+    'limit_concurrency': int(os.getenv('UVICORN_LIMIT_CONCURRENCY', os.getenv('DB_POOL_MAX_SIZE', '10'))),
+    'backlog': int(os.getenv('UVICORN_BACKLOG', '2048')),
+    'timeout_keep_alive': int(os.getenv('UVICORN_KEEPALIVE', '5')),
+    'proxy_headers': True,
+    'forwarded_allow_ips': os.getenv('UVICORN_FORWARDED_ALLOW_IPS', '127.0.0.1'),
+}
+
+
+def main():
+    """Запускает uvicorn с настройками из окружения."""
+    uvicorn.run(**UVICORN_CONFIG)
+
+
+if __name__ == '__main__':
+    main()